@@ -0,0 +1,90 @@
+"""Per-contact memory of the in-memory record model.
+
+Run from the repository root:
+    python benchmarks/record_memory.py [amount of contacts] [--legacy]
+
+--legacy measures the record model the bot had before the records were slotted: every value object with
+its own __dict__, the birthday as a datetime and the phones, addresses, notes and tags as lists of such
+objects, so the saving of the compact model can be reproduced.
+"""
+import argparse
+import sys
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent / 'contact_book_bot' / 'src'))
+
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import Record  # noqa: E402
+
+CONTACTS = 100_000
+# every field is split out of a csv-like line, like the values of a loaded book are
+CONTACT_TEMPLATE = 'Contact {number};+380{number:09d},+1{number:010d};{day:02d}.{month:02d}.1990;' \
+                   '{number} Main street,Kyiv;contact{number}@mail.com;Note number {number}|work,urgent;Call back|home'
+
+
+class LegacyValue:
+    """Name, phone, address, email and tag of the legacy model, a plain object with a __dict__"""
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+
+class LegacyBirthday:
+
+    def __init__(self, birthday: str) -> None:
+        self.value = datetime.strptime(birthday, '%d.%m.%Y')
+
+
+class LegacyNote:
+
+    def __init__(self, note: str, tags: List[str]) -> None:
+        self.value = note
+        self.tag = [LegacyValue(tag) for tag in tags]
+
+
+class LegacyRecord:
+
+    def __init__(self, name: str, phones: List[str], birthday: Optional[str], addresses: List[str],
+                 email: Optional[str]) -> None:
+        self.phone = [LegacyValue(phone) for phone in phones]
+        self.address = [LegacyValue(address) for address in addresses]
+        self.name = LegacyValue(name)
+        self.birthday = LegacyBirthday(birthday) if birthday else None
+        self.email = LegacyValue(email) if email else None
+        self.note = []
+
+    def add_note(self, note: str, tags: List[str]) -> None:
+        self.note.append(LegacyNote(note, tags))
+
+
+def make_record(number: int, record_class: Callable[..., Any] = Record) -> Any:
+    name, phones, birthday, addresses, email, *notes = CONTACT_TEMPLATE.format(
+        number=number, day=number % 28 + 1, month=number % 12 + 1).split(';')
+    record = record_class(name, phones.split(','), birthday, addresses.split(','), email)
+    for note in notes:
+        note_text, tags = note.split('|')
+        record.add_note(note_text, tags.split(','))
+    return record
+
+
+def measure_bytes_per_contact(amount: int, legacy: bool = False) -> float:
+    record_class = LegacyRecord if legacy else Record
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    records = [make_record(number, record_class) for number in range(amount)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return (after - before) / amount
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('contacts', nargs='?', type=int, default=CONTACTS, help='amount of contacts')
+    parser.add_argument('--legacy', action='store_true', help='measure the record model before it was slotted')
+    arguments = parser.parse_args()
+    layout = 'legacy' if arguments.legacy else 'compact'
+    print(f'{measure_bytes_per_contact(arguments.contacts, arguments.legacy):.0f} bytes per contact '
+          f'({arguments.contacts} contacts, {layout} records)')
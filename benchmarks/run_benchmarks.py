@@ -0,0 +1,217 @@
+"""Benchmarks of the address book and dir sorter hot paths.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py [--sizes 1000 100000 1000000] [--tree-sizes 1000 10000]
+                                        [--names 1000000] [--no-memory] [--output results.json]
+
+Every benchmark is timed with tracemalloc off and then, unless --no-memory is given, run once more
+under tracemalloc to get its peak memory. Results are printed (or written) as JSON.
+"""
+import argparse
+import collections
+import json
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from synthetic_data import file_stems, write_book, write_tree
+from record_memory import measure_bytes_per_contact
+
+from handlers_and_commands import handlers
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook, RENDER_CACHE
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CsvStorage
+from handlers_and_commands.dir_sort_scrypt.dir_sorter import sort_dir
+from handlers_and_commands.dir_sort_scrypt.name_normalizer import normalize
+
+BOOK_SIZES = (1_000, 100_000, 1_000_000)
+TREE_SIZES = (1_000, 10_000)
+NAMES_AMOUNTS = (1_000_000,)
+# distinct stems among the normalized names, all of them are distinct for the uncached case
+REPEATED_STEMS = 10_000
+FIND_QUERIES = ('Contact 12', '+38050', '12 Main', 'mail.com', 'x')
+# popular contacts are found again and again, their renders come from the render cache
+REPEATED_FIND_QUERIES = ('Contact 12',) * 20
+SAMPLED_CONTACTS = 1_000
+RECORD_MEMORY_CONTACTS = 100_000
+
+
+def measure(setup: Callable[[], Any], run: Callable[[Any], Any], with_memory: bool) -> Dict[str, float]:
+    """Times run(setup()), the setup is not measured and is repeated for the memory pass"""
+    state = setup()
+    start = time.perf_counter()
+    run(state)
+    result = {'seconds': time.perf_counter() - start}
+    del state
+    if with_memory:
+        state = setup()
+        tracemalloc.start()
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_memory_bytes'] = peak
+    return result
+
+
+def copy_book(book_path: Path, work_dir: Path) -> Path:
+    for leftover in work_dir.glob('book.*'):
+        leftover.unlink()
+    return Path(shutil.copyfile(book_path, work_dir / 'book.csv'))
+
+
+def loaded_book(book_path: Path, work_dir: Path, lazy: bool = False) -> AddressBook:
+    book = AddressBook(CsvStorage(copy_book(book_path, work_dir)))
+    book.load(lazy=lazy)
+    return book
+
+
+def sampled_names(size: int) -> List[str]:
+    generator = random.Random(size)
+    return [f'Contact {generator.randrange(size)}' for _ in range(min(SAMPLED_CONTACTS, size))]
+
+
+def book_benchmarks(size: int, work_dir: Path, with_memory: bool) -> List[Dict[str, Any]]:
+    book_path = write_book(work_dir / f'synthetic_{size}.csv', size)
+    names = sampled_names(size)
+
+    def fresh_book() -> AddressBook:
+        return AddressBook(CsvStorage(copy_book(book_path, work_dir)))
+
+    # the read only benchmarks share one loaded book, loading a million contacts for each would take ages
+    shared_books = []
+
+    def loaded() -> AddressBook:
+        if not shared_books:
+            shared_books.append(loaded_book(book_path, work_dir))
+        return shared_books[0]
+
+    def find_all(book: AddressBook) -> None:
+        for query in FIND_QUERIES:
+            book.find_record(query)
+
+    def find_repeated(book: AddressBook) -> None:
+        RENDER_CACHE.clear()
+        for query in REPEATED_FIND_QUERIES:
+            handlers.find_contact(query, book)
+
+    def notes_with_tag(book: AddressBook) -> None:
+        for name in names:
+            handlers.find_notes_with_tag(name, 'work', book)
+
+    def search_notes(book: AddressBook) -> None:
+        for name in names:
+            handlers.search_for_notes(name, 'meet', book)
+
+    cases = (
+        ('load', fresh_book, lambda book: book.load()),
+        ('load_lazy', fresh_book, lambda book: book.load(lazy=True)),
+        ('find_record_lazy', lambda: loaded_book(book_path, work_dir, lazy=True), find_all),
+        ('find_record', loaded, find_all),
+        ('find_contact_repeated', loaded, find_repeated),
+        ('get_birthdays_by_days', loaded, lambda book: book.get_birthdays_by_days(7)),
+        ('get_birthdays_in_range', loaded, lambda book: book.get_birthdays_in_range(0, 30)),
+        ('see_all_contacts', loaded, lambda book: book.see_all_contacts()),
+        ('find_notes_with_tag', loaded, notes_with_tag),
+        ('search_for_notes', loaded, search_notes),
+        ('save', loaded, lambda book: book.save()),
+    )
+    results = []
+    for name, setup, run in cases:
+        results.append({'benchmark': name, 'contacts': size, **measure(setup, run, with_memory)})
+        if run is find_repeated:
+            results[-1]['render_cache'] = RENDER_CACHE.stats()
+        print(f'{name} on {size} contacts: {results[-1]["seconds"]:.3f}s', file=sys.stderr)
+    shared_books[0].close()
+    book_path.unlink()
+    return results
+
+
+def tree_benchmarks(size: int, work_dir: Path, with_memory: bool) -> List[Dict[str, Any]]:
+    tree_path = work_dir / f'tree_{size}'
+
+    def setup() -> str:
+        return str(write_tree(tree_path, size))
+
+    result = {'benchmark': 'sort_dir', 'files': size, **measure(setup, sort_dir, with_memory)}
+    print(f'sort_dir on {size} files: {result["seconds"]:.3f}s', file=sys.stderr)
+    shutil.rmtree(tree_path)
+    return [result]
+
+
+def normalize_benchmarks(amount: int, with_memory: bool) -> List[Dict[str, Any]]:
+    results = []
+    for name, distinct in (('normalize_repeated', REPEATED_STEMS), ('normalize_distinct', amount)):
+
+        def setup() -> List[str]:
+            normalize.cache_clear()
+            return file_stems(amount, distinct)
+
+        def run(stems: List[str]) -> None:
+            collections.deque(map(normalize, stems), maxlen=0)
+
+        result = {'benchmark': name, 'names': amount, **measure(setup, run, with_memory)}
+        result['names_per_second'] = round(amount / result['seconds'])
+        results.append(result)
+        print(f'{name} of {amount} names: {result["names_per_second"]} names/s', file=sys.stderr)
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+        book_sizes: List[int],
+        tree_sizes: List[int],
+        names_amounts: List[int],
+        with_memory: bool,
+) -> Dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in book_sizes:
+            results += book_benchmarks(size, Path(work_dir), with_memory)
+        for size in tree_sizes:
+            results += tree_benchmarks(size, Path(work_dir), with_memory)
+    for amount in names_amounts:
+        results += normalize_benchmarks(amount, with_memory)
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'record_bytes_per_contact': measure_bytes_per_contact(RECORD_MEMORY_CONTACTS),
+        'legacy_record_bytes_per_contact': measure_bytes_per_contact(RECORD_MEMORY_CONTACTS, legacy=True),
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(BOOK_SIZES),
+                        help='amounts of contacts in the synthetic books')
+    parser.add_argument('--tree-sizes', type=int, nargs='*', default=list(TREE_SIZES),
+                        help='amounts of files in the synthetic directories to sort')
+    parser.add_argument('--names', type=int, nargs='*', default=list(NAMES_AMOUNTS),
+                        help='amounts of the file names to normalize')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory pass')
+    parser.add_argument('--output', type=Path, help='write the JSON results to this file instead of stdout')
+    arguments = parser.parse_args()
+    results = run_benchmarks(arguments.sizes, arguments.tree_sizes, arguments.names, not arguments.no_memory)
+    report = json.dumps(results, indent=2)
+    if arguments.output:
+        arguments.output.write_text(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Stress test of the address book changed and read from many threads at once.
+
+Run from the repository root:
+    python benchmarks/stress_book.py [--contacts 2000] [--threads 16] [--seconds 10] [--seed 0] [--storage csv]
+
+Writers add, change and delete contacts, one of their changes adds a phone and the note about it together.
+Readers find, page, list and render the contacts meanwhile and check, that they never see the phone without
+its note. When the threads are done the indexes, the rendered contacts and the saved book are compared with
+a book built from the final contacts from scratch. Exits with 1 and prints the violations, if there are any.
+"""
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Set
+
+from synthetic_data import write_book
+
+from handlers_and_commands.bot_classes_and_exceptions import bot_exceptions
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook, ContactOutput, Record, \
+    contact_to_record, record_to_contact
+from handlers_and_commands.bot_classes_and_exceptions.bot_sqlite_storage import SqliteStorage
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import ContactsStorage, CsvStorage
+
+CONTACTS = 2_000
+THREADS = 16
+SECONDS = 10.0
+# phones added by the writers, every one of them comes with the note about it
+STRESS_PHONE_PREFIX = '+999'
+STRESS_TAG = 'stress'
+EXPECTED_ERRORS = (
+    bot_exceptions.UnknownContactError,
+    bot_exceptions.UnknownNoteError,
+    bot_exceptions.UnknownPhoneError,
+)
+
+
+def stress_note(phone: str) -> str:
+    return f'phone {phone}'
+
+
+def add_stress_phone(record: Record, phone: str) -> None:
+    """The phone and its note are one change, no reader sees one of them without the other"""
+    with record.changing():
+        record.add_phone(phone)
+        record.add_note(stress_note(phone), [STRESS_TAG])
+
+
+def check_contact(contact: dict, violations: List[str]) -> None:
+    phones = {phone for phone in contact['phones'] if phone.startswith(STRESS_PHONE_PREFIX)}
+    notes = {note['note'] for note in contact['notes'] if note['note'].startswith(stress_note(STRESS_PHONE_PREFIX))}
+    if {stress_note(phone) for phone in phones} != notes:
+        violations.append(f'{contact["name"]} read in the middle of a change: {sorted(phones)} {sorted(notes)}')
+
+
+def check_rendered(record: Record, violations: List[str]) -> None:
+    lines = str(record).splitlines()
+    phones = next(line for line in lines if line.startswith('|phones'))
+    notes = next(line for line in lines if line.startswith('|notes'))
+    if phones.count(STRESS_PHONE_PREFIX) != notes.count(stress_note(STRESS_PHONE_PREFIX)):
+        violations.append(f'{record.name.value} rendered in the middle of a change')
+
+
+class Stress:
+
+    def __init__(self, book: AddressBook, contacts: int, seed: int) -> None:
+        self.book = book
+        self.contacts = contacts
+        self.seed = seed
+        self.violations: List[str] = []
+        self.operations = 0
+        self._stopped = threading.Event()
+        self._counter_lock = threading.Lock()
+
+    def random_name(self, generator: random.Random) -> str:
+        return f'Contact {generator.randrange(self.contacts)}'
+
+    def write(self, generator: random.Random, added: List[str]) -> None:
+        name = self.random_name(generator)
+        choice = generator.random()
+        if choice < 0.1:
+            name = f'Stress {threading.current_thread().name} {generator.randrange(10 ** 9)}'
+            self.book.add_record({'name': name, 'numbers': [f'+1{generator.randrange(10 ** 9):09d}'],
+                                  'birthday': None, 'address': [], 'email': None})
+            added.append(name)
+        elif choice < 0.15 and added:
+            name = added.pop(generator.randrange(len(added)))
+            self.book.delete_record(name)
+        elif choice < 0.2:
+            self.book.delete_record(name)
+        else:
+            record = self.book.get_record_by_name(name)
+            if choice < 0.5:
+                add_stress_phone(record, f'{STRESS_PHONE_PREFIX}{generator.randrange(10 ** 9):09d}')
+            elif choice < 0.6:
+                record.modify_email(f'stress{generator.randrange(10 ** 6)}@mail.com')
+            elif choice < 0.7:
+                record.modify_birthday(f'{generator.randint(1, 28):02d}.{generator.randint(1, 12):02d}.1990')
+            elif choice < 0.8:
+                record.modify_address(generator.choice(record.field_values('address') or ['']),
+                                      f'{generator.randrange(100)} Stress street')
+            else:
+                notes = [note for note in record.note if not note.value.startswith(stress_note(''))]
+                if notes:
+                    record.modify_note(generator.choice(notes).value, f'changed {generator.randrange(10 ** 6)}')
+        self.book.log_change(name)
+
+    def read(self, generator: random.Random, _: List[str]) -> None:
+        choice = generator.random()
+        if choice < 0.3:
+            found = self.book.find_record(self.random_name(generator)[:-1])
+            for record in (record for records in found.values() for record in records):
+                check_rendered(record, self.violations)
+                check_contact(record_to_contact(record), self.violations)
+        elif choice < 0.5:
+            records = list(self.book.page(generator.randrange(self.contacts), sort_by='name'))
+            names = [record.name.value for record in records]
+            if names != sorted(names):
+                self.violations.append(f'page out of order: {names}')
+            for record in records:
+                check_contact(record_to_contact(record), self.violations)
+        elif choice < 0.7:
+            for name, note in self.book.find_tagged_notes([[STRESS_TAG]]):
+                if not note.value.startswith(stress_note(STRESS_PHONE_PREFIX)):
+                    self.violations.append(f'{name} has {note.value!r} tagged {STRESS_TAG}')
+        elif choice < 0.75:
+            for _, name, note in self.book.search_notes(stress_note(STRESS_PHONE_PREFIX), 5):
+                if note not in self.book.get_record_by_name(name).note:
+                    self.violations.append(f'{name} has no found note {note.value!r}')
+        elif choice < 0.8:
+            # the stored contacts are listed out of the lock of the book, while the others take them
+            listed: Set[str] = set()
+            for contact in self.book.contacts():
+                if contact['name'] in listed:
+                    self.violations.append(f'{contact["name"]} is listed twice')
+                listed.add(contact['name'])
+                check_contact(contact, self.violations)
+        elif choice < 0.9:
+            record = self.book.get_record_by_name(self.random_name(generator))
+            for phone in record.field_values('phone'):
+                self.book.find_by_phone(phone)
+            check_rendered(record, self.violations)
+        else:
+            self.book.get_birthdays_in_range(0, 30)
+
+    def worker(self, work: Callable[[random.Random, List[str]], None], number: int) -> None:
+        generator = random.Random(self.seed * 1000 + number)
+        # names of the contacts added by the writer
+        added: List[str] = []
+        operations = 0
+        while not self._stopped.is_set():
+            try:
+                work(generator, added)
+            except EXPECTED_ERRORS:
+                pass
+            except Exception as error:
+                self.violations.append(f'{threading.current_thread().name}: {type(error).__name__}: {error}')
+                self._stopped.set()
+            operations += 1
+        with self._counter_lock:
+            self.operations += operations
+
+    def run(self, threads: int, seconds: float) -> None:
+        workers = [threading.Thread(target=self.worker, args=(self.write if number % 2 else self.read, number),
+                                    name=f'{"writer" if number % 2 else "reader"}-{number}')
+                   for number in range(threads)]
+        for worker in workers:
+            worker.start()
+        self._stopped.wait(seconds)
+        self._stopped.set()
+        for worker in workers:
+            worker.join()
+
+
+def found_names(book: AddressBook, sought_string: str) -> Dict[str, List[str]]:
+    return {field: [record.name.value for record in records]
+            for field, records in book.find_record(sought_string).items()}
+
+
+def check_book(book: AddressBook, saved_storage: Callable[[], ContactsStorage], violations: List[str]) -> None:
+    """Compares the book with the one built from its contacts from scratch and with the saved one"""
+    contacts: Dict[str, dict] = {}
+    for contact in book.contacts():
+        if contact['name'] in contacts:
+            violations.append(f'{contact["name"]} is in the book twice')
+        contacts[contact['name']] = contact
+        check_contact(contact, violations)
+    if len(contacts) != len(book):
+        violations.append(f'{len(book)} contacts counted, {len(contacts)} listed')
+    rebuilt = AddressBook()
+    for contact in contacts.values():
+        rebuilt[contact['name']] = contact_to_record(contact)
+    book._take_all_from_storage()
+    for name, record in book.data.items():
+        if record.version % 2 or record.book is not book:
+            violations.append(f'{name} is left in the middle of a change')
+        if str(record) != ContactOutput(record).render():
+            violations.append(f'{name} has a stale render')
+        for field in ('name', 'phone', 'email', 'address'):
+            for value in record.field_values(field):
+                if found_names(book, value) != found_names(rebuilt, value):
+                    violations.append(f'search index of {field} differs for {value!r}')
+    if [record.name.value for record in book.page(0, len(book), 'name')] != sorted(contacts):
+        violations.append('names are out of order')
+    if book.duplicate_phones() != rebuilt.duplicate_phones():
+        violations.append('phone index differs')
+    tagged = sorted((name, note.value) for name, note in book.find_tagged_notes([[STRESS_TAG]]))
+    if tagged != sorted((name, note.value) for name, note in rebuilt.find_tagged_notes([[STRESS_TAG]])):
+        violations.append('tag index differs')
+    if book.get_birthdays_in_range(0, 366) != rebuilt.get_birthdays_in_range(0, 366):
+        violations.append('birthday index differs')
+    book.close()
+    saved = AddressBook(saved_storage())
+    saved.load(lazy=True)
+    if {contact['name']: contact for contact in saved.contacts()} != contacts:
+        violations.append('saved book differs from the one in memory')
+    saved.close()
+
+
+def book_storage(book_path: Path, storage_type: str) -> Callable[[], ContactsStorage]:
+    if storage_type == 'sqlite':
+        return lambda: SqliteStorage(book_path.with_suffix('.db'), import_from=book_path)
+    return lambda: CsvStorage(book_path)
+
+
+def stress_book(book_path: Path, storage_type: str, contacts: int, threads: int, seconds: float,
+                seed: int) -> Stress:
+    """Runs the threads over the book and checks it after them, the violations are in the result"""
+    storage = book_storage(book_path, storage_type)
+    book = AddressBook(storage())
+    book.load(lazy=True)
+    stress = Stress(book, contacts, seed)
+    stress.run(threads, seconds)
+    if not stress.violations:
+        check_book(book, storage, stress.violations)
+    # closing again after the check does nothing
+    book.close()
+    return stress
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=CONTACTS, help='amount of contacts in the synthetic book')
+    parser.add_argument('--threads', type=int, default=THREADS, help='amount of threads, half of them write')
+    parser.add_argument('--seconds', type=float, default=SECONDS, help='how long the threads run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', choices=('csv', 'sqlite'), default='csv')
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        book_path = write_book(Path(work_dir) / 'book.csv', arguments.contacts, arguments.seed)
+        start = time.perf_counter()
+        stress = stress_book(book_path, arguments.storage, arguments.contacts, arguments.threads, arguments.seconds,
+                             arguments.seed)
+        elapsed = time.perf_counter() - start
+    print(f'{stress.operations} operations in {elapsed:.1f} s from {arguments.threads} threads, '
+          f'{len(stress.violations)} violations')
+    for violation in stress.violations[:20]:
+        print(violation)
+    sys.exit(1 if stress.violations else 0)
+
+
+if __name__ == '__main__':
+    main()
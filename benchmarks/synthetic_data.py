@@ -0,0 +1,86 @@
+"""Synthetic contact books and directory trees for the benchmarks"""
+import random
+import shutil
+import sys
+import zipfile
+from pathlib import Path
+from typing import Iterator, List
+
+SRC_PATH = Path(__file__).absolute().parent.parent / 'contact_book_bot' / 'src'
+if str(SRC_PATH) not in sys.path:
+    sys.path.insert(0, str(SRC_PATH))
+
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import contact_to_row, \
+    write_contacts_file  # noqa: E402
+
+TAGS = ('urgent', 'work', 'home', 'family', 'friends', 'birthday', 'gift', 'call', 'meeting', 'travel')
+WORDS = ('call', 'back', 'about', 'the', 'meeting', 'buy', 'gift', 'for', 'birthday', 'send', 'documents',
+         'project', 'deadline', 'dinner', 'on', 'friday', 'remind', 'pay', 'rent', 'tickets')
+STREETS = ('Main street', 'Shevchenka', 'Khreshchatyk', 'Baker street', 'Sadova', 'Lesi Ukrainky')
+CITIES = ('Kyiv', 'Lviv', 'Odesa', 'Kharkiv', 'Dnipro', 'London')
+FILE_NAMES = ('report', 'фото', 'відео', 'song', 'notes', 'документ', 'backup', 'scan', 'image', 'draft')
+FILE_EXTENSIONS = ('.jpg', '.png', '.svg', '.mp4', '.avi', '.mp3', '.ogg', '.txt', '.pdf', '.docx',
+                   '.xlsx', '.bin', '.dat', '')
+ARCHIVE_SHARE = 100
+
+
+def generate_contact(number: int, generator: random.Random) -> dict:
+    notes = []
+    for _ in range(generator.randint(0, 3)):
+        notes.append({
+            'note': ' '.join(generator.choices(WORDS, k=generator.randint(3, 10))),
+            'tags': generator.sample(TAGS, generator.randint(1, 3)),
+        })
+    return {
+        'name': f'Contact {number}',
+        'phones': [f'+380{generator.randrange(10 ** 9):09d}' for _ in range(generator.randint(1, 3))],
+        'birthday': f'{generator.randint(1, 28):02d}.{generator.randint(1, 12):02d}.{generator.randint(1950, 2010)}'
+        if generator.random() < 0.8 else None,
+        'addresses': [f'{generator.randint(1, 200)} {generator.choice(STREETS)}, {generator.choice(CITIES)}'
+                      .replace(',', '')
+                      for _ in range(generator.randint(0, 2))],
+        'email': f'contact{number}@mail.com' if generator.random() < 0.7 else None,
+        'notes': notes,
+    }
+
+
+def generate_contacts(amount: int, seed: int = 0) -> Iterator[dict]:
+    generator = random.Random(seed)
+    for number in range(amount):
+        yield generate_contact(number, generator)
+
+
+def write_book(path: Path, amount: int, seed: int = 0) -> Path:
+    """Writes the contacts csv file with the amount of synthetic contacts"""
+    write_contacts_file(path, (contact_to_row(contact) for contact in generate_contacts(amount, seed)))
+    return path
+
+
+def file_stems(amount: int, distinct: int, seed: int = 0) -> List[str]:
+    """Stems of the files to normalize, drawn from the distinct ones like the names of copies and numbered photos"""
+    generator = random.Random(seed)
+    stems = [f'{generator.choice(FILE_NAMES)} {number} ({generator.randint(1, 9)})' for number in range(distinct)]
+    return [generator.choice(stems) for _ in range(amount)]
+
+
+def write_tree(root: Path, files_amount: int, seed: int = 0, files_per_dir: int = 50) -> Path:
+    """Creates the messy directory with nested folders, files of all kinds and some zip archives"""
+    generator = random.Random(seed)
+    if root.exists():
+        shutil.rmtree(root)
+    root.mkdir(parents=True)
+    current_dir = root
+    for number in range(files_amount):
+        if number % files_per_dir == 0 and number:
+            parent = generator.choice([root, current_dir])
+            current_dir = parent / f'папка {number}'
+            current_dir.mkdir()
+        stem = f'{generator.choice(FILE_NAMES)} {number}'
+        if number % ARCHIVE_SHARE == 0:
+            with zipfile.ZipFile(current_dir / f'{stem}.zip', 'w') as archive:
+                for member in range(3):
+                    archive.writestr(f'member {member}.txt', 'archived text ' * 100)
+        else:
+            (current_dir / f'{stem}{generator.choice(FILE_EXTENSIONS)}').write_bytes(
+                generator.randbytes(generator.randint(16, 2048)))
+    return root
@@ -1,14 +1,87 @@
-from collections import UserDict
-from datetime import datetime
-from typing import Optional, List
+from bisect import bisect_left, insort
+from collections import OrderedDict, UserDict
+from collections.abc import MutableSequence
+from contextlib import contextmanager, nullcontext
+from heapq import merge, nsmallest
+from itertools import chain, groupby, islice
+from datetime import date, datetime
+from sys import intern
+from threading import Lock, RLock
+from operator import itemgetter
+from time import sleep
+from typing import Any, Callable, ContextManager, Dict, Iterable, NamedTuple, Optional, List, Iterator, Set, Tuple, \
+    TypeVar
 from . import bot_exceptions
+from .bot_indexes import SubstringIndex, BirthdayIndex, TagIndex, NoteSearchIndex, FuzzyIndex, ExactIndex, \
+    days_to_next_birthday, birthdays_calendar_days
+from .bot_phones import MAX_PHONE_DIGITS, compact_phone, normalize_phone
+from .bot_storage import ContactsStorage, CsvStorage
 from re import search
-from csv import DictReader, DictWriter
 from pathlib import Path
 from abc import abstractmethod, ABC
 
-FIELD_NAMES = ('name', 'numbers', 'birthday', 'addresses', 'email', 'notes')
+SEARCH_FIELDS = ('name', 'phone', 'email', 'address')
 CONTACTS_PATH = Path(__file__).parent.absolute().parent.parent / Path("contact_book.csv")
+CONTACTS_DB_PATH = CONTACTS_PATH.with_suffix('.db')
+PAGE_SIZE = 20
+SORT_KEYS = ('name', 'birthday')
+SEARCH_RESULTS = 10
+# rendered contacts and notes kept by the render cache, the least recently shown go first
+RENDER_CACHE_SIZE = 4096
+# records of a book are locked by the stripe of their name, a lock per record would weigh more than the record
+RECORD_LOCK_STRIPES = 1024
+# records out of any book are changed only by the thread building them
+DETACHED_RECORD_LOCK = RLock()
+T = TypeVar('T')
+
+
+class RenderCache:
+    """Rendered output of records and notes, bounded LRU.
+    Entries are dropped by the mutators of the rendered object and are kept with the version of the record
+    they were rendered from, so a render, that raced with a change, is never a hit"""
+
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._rendered: 'OrderedDict[Any, Tuple[int, str]]' = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._rendered)
+
+    def rendered(self, data: Any, render: Callable[[], str], version: int = 0) -> str:
+        with self._lock:
+            entry = self._rendered.get(data)
+            if entry is not None and entry[0] == version:
+                self._rendered.move_to_end(data)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        output = render()
+        with self._lock:
+            self._rendered[data] = (version, output)
+            self._rendered.move_to_end(data)
+            if len(self._rendered) > self.max_size:
+                self._rendered.popitem(last=False)
+        return output
+
+    def discard(self, data: Any) -> None:
+        with self._lock:
+            self._rendered.pop(data, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rendered.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._rendered),
+                'hit_rate': self.hits / requests if requests else 0.0}
+
+
+RENDER_CACHE = RenderCache()
 
 
 class UserOutput(ABC):
@@ -25,22 +98,25 @@ class UserOutput(ABC):
 class ContactOutput(UserOutput):
 
     def prepare_data_for_output(self):
+        return self.data.consistent(lambda version: RENDER_CACHE.rendered(self.data, self.render, version))
+
+    def render(self):
         phones = 'None'
-        if len(self.data.phone) > 0:
-            phones = ', '.join([phone.value for phone in self.data.phone])
+        if len(self.data.field_values('phone')) > 0:
+            phones = ', '.join(self.data.field_values('phone'))
         birthday = 'None'
         if self.data.birthday:
             birthday = self.data.birthday.value.strftime('%d.%m.%Y')
         addresses = 'None'
-        if len(self.data.address) > 0:
-            addresses = ', '.join([addr.value for addr in self.data.address])
+        if len(self.data.field_values('address')) > 0:
+            addresses = ', '.join(self.data.field_values('address'))
         email = 'None'
         if self.data.email:
             email = self.data.email.value
         notes = ''
         if len(self.data.note) > 0:
             for note in self.data.note:
-                notes += f"/'{note.value}', tags: {', '.join([tag.value for tag in note.tag])}/ "
+                notes += f"/'{note.value}', tags: {', '.join(note.tag_values())}/ "
             notes = notes.strip()
         return f"\n|Contact {self.data.name.value} :\n" \
                f"|phones : {phones}\n" \
@@ -53,88 +129,231 @@ class ContactOutput(UserOutput):
 class NoteOutput(UserOutput):
 
     def prepare_data_for_output(self):
+        record = self.data.record
+        if record is None:
+            return RENDER_CACHE.rendered(self.data, self.render)
+        return record.consistent(lambda version: RENDER_CACHE.rendered(self.data, self.render, version))
+
+    def render(self):
         return f"The note is '{self.data.value}'. And the tags are " \
-               f"{','.join([note_tag.value for note_tag in self.data.tag])}"
+               f"{','.join(self.data.tag_values())}"
 
 
-class Name:
-    """Name of the contact"""
+class FieldValue:
+    """Value of the contact field, slotted so it weighs no more than the string inside"""
+    __slots__ = ('value',)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+    @classmethod
+    def from_stored(cls, value: str) -> 'FieldValue':
+        """Value, that was already checked, when it was stored in the record"""
+        field_value = cls.__new__(cls)
+        field_value.value = value
+        return field_value
+
+
+class FieldValues(MutableSequence):
+    """Phones, addresses or notes of the record, or tags of the note, as a list. The owner keeps them as a tuple
+    of plain strings (notes as they are), so every change of the list replaces the tuple under the lock
+    of the record and updates the indexes, like the methods of the record do. Phone, Address and Tag values
+    of the list are built on access, a value changed in place doesn't change the record, replace it instead"""
+    __slots__ = ('_owner', '_field')
+
+    def __init__(self, owner: Any, field: str) -> None:
+        self._owner = owner
+        self._field = field
+
+    def _stored(self) -> tuple:
+        return self._owner.stored_values(self._field)
+
+    def _wrap(self, value: Any) -> Any:
+        value_class = FIELD_VALUE_CLASSES[self._field]
+        return value if value_class is Note else value_class.from_stored(value)
+
+    def _unwrap(self, value: Any) -> Any:
+        value_class = FIELD_VALUE_CLASSES[self._field]
+        if value_class is Note:
+            if not isinstance(value, Note):
+                raise TypeError(f'Notes of the record are Note values, not {type(value).__name__}')
+            return value
+        if isinstance(value, FieldValue):
+            value = value.value
+        # phones are checked and normalized by Phone, the other values are taken as they are
+        return intern(value_class(value).value)
+
+    def __len__(self) -> int:
+        return len(self._stored())
+
+    def __iter__(self) -> Iterator[Any]:
+        return map(self._wrap, self._stored())
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self._wrap(value) for value in self._stored()[index]]
+        return self._wrap(self._stored()[index])
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        new_value = [self._unwrap(item) for item in value] if isinstance(index, slice) else self._unwrap(value)
+
+        def change(values: list) -> None:
+            values[index] = new_value
+        self._owner.change_values(self._field, change)
 
-    def __init__(self, name: str) -> None:
-        self.value = name
+    def __delitem__(self, index: Any) -> None:
+        def change(values: list) -> None:
+            del values[index]
+        self._owner.change_values(self._field, change)
+
+    def insert(self, index: int, value: Any) -> None:
+        new_value = self._unwrap(value)
+        self._owner.change_values(self._field, lambda values: values.insert(index, new_value))
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, FieldValues):
+            return self._stored() == other._stored()
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class Name(FieldValue):
+    """Name of the contact"""
+    __slots__ = ()
 
 
 class Birthday:
-    """Birthday of the contact"""
+    """Birthday of the contact, packed as the ordinal of the date"""
+    __slots__ = ('ordinal',)
 
     def __init__(self, birthday: str) -> None:
         try:
-            self.value = datetime.strptime(birthday, "%d.%m.%Y")
+            self.ordinal = datetime.strptime(birthday, "%d.%m.%Y").toordinal()
         except (ValueError, TypeError):
             raise bot_exceptions.BirthdayError(
                 "Data must match pattern '%d.%m.%Y'")
 
+    @property
+    def value(self) -> datetime:
+        return datetime.fromordinal(self.ordinal)
+
 
-class Phone:
-    """Phone / phones of the contact"""
+class Phone(FieldValue):
+    """Phone / phones of the contact, kept in the canonical + and digits form"""
+    __slots__ = ()
 
     def __init__(self, phone: str) -> None:
-        if phone[0] != '+':
+        phone = normalize_phone(phone)
+        if phone[:1] != '+':
             raise bot_exceptions.PhoneError("Phone number must starts from +")
-        if not phone[1:].isalnum():
+        if not phone[1:].isdigit() or not phone[1:].isascii():
             raise bot_exceptions.PhoneError("Phone must contain only digits")
-        self.value = phone
+        if len(phone) - 1 > MAX_PHONE_DIGITS:
+            raise bot_exceptions.PhoneError(f"Phone must contain no more than {MAX_PHONE_DIGITS} digits")
+        super().__init__(phone)
 
 
-class Tag:
+class Tag(FieldValue):
     """Tag for notes of the contact"""
-
-    def __init__(self, tag):
-        self.value = tag
+    __slots__ = ()
 
     def __str__(self):
         return f"{self.value}"
 
 
 class Note:
-    """Notes of the contact"""
+    """Notes of the contact, tags are kept as interned strings.
+    The note knows its record, so a changed note drops the rendered record too and is changed under its lock"""
+    __slots__ = ('_value', '_tags', 'record')
 
     # list of strings or empty list
     def __init__(self, note: str, tags: List[str] or list) -> None:
-        self.value = note
-        self.tag = []
-        if len(tags) > 0:
-            self.tag = [Tag(new_tag) for new_tag in tags]
+        self._value = note
+        self._tags = ()
+        if tags:
+            self._tags = tuple(intern(new_tag) for new_tag in tags)
+        self.record = None
+
+    def _changed(self) -> None:
+        RENDER_CACHE.discard(self)
+        if self.record is not None:
+            self.record._changed('note')
+
+    def _changing(self) -> ContextManager[None]:
+        return self.record.changing() if self.record is not None else nullcontext()
+
+    @property
+    def value(self) -> str:
+        return self._value
+
+    @value.setter
+    def value(self, new_note: str) -> None:
+        with self._changing():
+            self._value = new_note
+            self._changed()
 
     def __str__(self) -> str:
         raw_note = NoteOutput(self)
         return raw_note.prepare_data_for_output()
 
+    @property
+    def tag(self) -> FieldValues:
+        return FieldValues(self, 'tag')
+
+    def tag_values(self) -> Tuple[str, ...]:
+        return self._tags
+
+    def stored_values(self, field: str) -> tuple:
+        return self._tags
+
+    def change_values(self, field: str, change: Callable[[list], None]) -> None:
+        with self._changing():
+            tags = list(self._tags)
+            change(tags)
+            self._tags = tuple(tags)
+            self._changed()
+
     def add_tag(self, input_tag: str) -> None:
-        all_tags = [tag.value for tag in self.tag]
-        if input_tag not in all_tags:
-            self.tag.append(Tag(input_tag))
+        with self._changing():
+            if input_tag not in self._tags:
+                self._tags += (intern(input_tag),)
+                self._changed()
 
 
-class Address:
+class Address(FieldValue):
     """Address of the contact"""
+    __slots__ = ()
 
-    def __init__(self, address: str) -> None:
-        self.value = address
 
-
-class Email:
+class Email(FieldValue):
     """Email of the contact"""
+    __slots__ = ()
 
     def __init__(self, email: str) -> None:
         if not search(r"[.a-z0-9-_]+@[a-z]{1,8}\.[a-z]{1,3}", email):
             raise bot_exceptions.EmailError
-        self.value = email
+        super().__init__(email)
+
+
+FIELD_VALUE_CLASSES = {'phone': Phone, 'address': Address, 'note': Note, 'tag': Tag}
+# slots of the record keeping the values of its list fields
+RECORD_FIELD_SLOTS = {'phone': '_phones', 'address': '_addresses', 'note': '_notes'}
 
 
 class Record:
     """Records(contacts) in users contact book.
-    Only one name , birthday and email, but it can be more than one phone and more than one address"""
+    Only one name , birthday and email, but it can be more than one phone and more than one address.
+    Phones and addresses are kept as tuples of interned strings and notes as a tuple, the phone, address
+    and note attributes give them as lists of Phone, Address and Note values, that change the record.
+
+    Fields are never changed in place, every change replaces them under the lock of the record and makes its
+    version odd while it goes on. Readers don't lock: they read the record again, if its version was odd
+    or changed while they read it"""
+    __slots__ = ('name', '_phones', 'birthday', '_addresses', 'email', '_notes', 'book', 'version')
 
     def __init__(
             self,
@@ -144,12 +363,12 @@ class Record:
             addresses: List[str] = None,
             email: str = None,
     ) -> None:
-        self.phone = []
+        self._phones = ()
         if phones:
-            self.phone = [Phone(new_phone) for new_phone in phones]
-        self.address = []
+            self._phones = tuple(intern(Phone(new_phone).value) for new_phone in phones)
+        self._addresses = ()
         if addresses:
-            self.address = [Address(new_addr) for new_addr in addresses]
+            self._addresses = tuple(intern(new_addr) for new_addr in addresses)
         self.name = Name(name)
         if birthday:
             self.birthday = Birthday(birthday)
@@ -159,23 +378,100 @@ class Record:
             self.email = Email(email)
         else:
             self.email = None
-        self.note = []
+        self._notes: Tuple[Note, ...] = ()
+        self.book = None
+        self.version = 0
+
+    @property
+    def phone(self) -> FieldValues:
+        return FieldValues(self, 'phone')
+
+    @property
+    def address(self) -> FieldValues:
+        return FieldValues(self, 'address')
+
+    @property
+    def note(self) -> FieldValues:
+        return FieldValues(self, 'note')
+
+    def stored_values(self, field: str) -> tuple:
+        return getattr(self, RECORD_FIELD_SLOTS[field])
+
+    def change_values(self, field: str, change: Callable[[list], None]) -> None:
+        """Changes the list of the field values, the record keeps them as a tuple"""
+        with self.changing():
+            values = list(self.stored_values(field))
+            change(values)
+            if field == 'note':
+                for note in self._notes:
+                    if note not in values:
+                        note.record = None
+                for note in values:
+                    note.record = self
+            setattr(self, RECORD_FIELD_SLOTS[field], tuple(values))
+            self._changed(field)
+
+    @property
+    def lock(self) -> RLock:
+        if self.book is None:
+            return DETACHED_RECORD_LOCK
+        return self.book.record_locks[hash(self.name.value) % RECORD_LOCK_STRIPES]
+
+    @contextmanager
+    def changing(self) -> Iterator[None]:
+        """Takes the lock of the record for a change, the change may be made of the nested ones"""
+        with self.lock:
+            if self.version % 2:
+                # the change is already going on in this thread
+                yield
+                return
+            self.version += 1
+            try:
+                yield
+            finally:
+                self.version += 1
+
+    def consistent(self, read: Callable[[int], T]) -> T:
+        """Result of read(version) for a state of the record, that no change was going on in"""
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                result = read(version)
+                if self.version == version:
+                    return result
+            elif self.lock.acquire(blocking=False):
+                # the lock is reentrant, so the change is made by this very thread, or it is over already
+                try:
+                    return read(self.version)
+                finally:
+                    self.lock.release()
+            else:
+                sleep(0)
+
+    def _changed(self, field: str) -> None:
+        RENDER_CACHE.discard(self)
+        if self.book is not None:
+            self.book.update_record_index(self, field)
+
+    def field_values(self, field: str) -> List[str]:
+        if field == 'name':
+            return [self.name.value]
+        if field == 'phone':
+            return list(self._phones)
+        if field == 'email':
+            return [self.email.value] if self.email else []
+        if field == 'address':
+            return list(self._addresses)
+        return []
 
     def days_to_birthday(self) -> int:
         if self.birthday:
-            current_date = datetime.now().date()
-            this_year_birthday = datetime(
-                year=current_date.year,
-                month=self.birthday.value.month,
-                day=self.birthday.value.day,
-            ).date()
-            if current_date > this_year_birthday:
-                this_year_birthday = datetime(
-                    year=current_date.year + 1,
-                    month=self.birthday.value.month,
-                    day=self.birthday.value.day,
-                ).date()
-            return (this_year_birthday - current_date).days
+            birthday = date.fromordinal(self.birthday.ordinal)
+            return days_to_next_birthday(
+                birthday.month,
+                birthday.day,
+                datetime.now().date(),
+            )
 
     def __str__(self) -> str:
         raw_record = ContactOutput(self)
@@ -183,65 +479,281 @@ class Record:
 
     def add_note(self, input_note: str, input_tag: Optional[List[str]] = None) -> None:
         note_to_add = Note(input_note, input_tag)
-        self.note.append(note_to_add)
+        with self.changing():
+            note_to_add.record = self
+            self._notes += (note_to_add,)
+            self._changed('note')
 
     def get_note(self, note: str) -> Note:
-        for this_note in self.note:
+        for this_note in self._notes:
             if this_note.value == note:
                 return this_note
         else:
-            raise bot_exceptions.UnknownNoteError
+            raise bot_exceptions.UnknownNoteError(self.book.similar_notes(self, note) if self.book is not None else [])
 
     def modify_note(self, note: str, new_note: str) -> None:
-        note_to_modify = self.get_note(note)
-        note_to_modify.value = new_note
+        with self.changing():
+            note_to_modify = self.get_note(note)
+            note_to_modify.value = new_note
 
     def delete_note(self, note: str) -> None:
-        note_to_delete = self.get_note(note)
-        self.note.remove(note_to_delete)
+        with self.changing():
+            note_to_delete = self.get_note(note)
+            self._notes = tuple(this_note for this_note in self._notes if this_note is not note_to_delete)
+            note_to_delete.record = None
+            self._changed('note')
 
     def search_for_notes(self, search_symbols: str) -> List[Note]:
         found_notes = []
-        for note in self.note:
+        for note in self._notes:
             if search_symbols in note.value:
                 found_notes.append(note)
         return found_notes
 
     def modify_email(self, new_email: str) -> None:
-        self.email = Email(new_email)
+        email = Email(new_email)
+        with self.changing():
+            self.email = email
+            self._changed('email')
 
     def modify_phone(self, old_phone: str, new_phone: str) -> None:
-        if self.phone:
-            for phone in self.phone:
-                if phone.value == old_phone:
-                    phone.value = new_phone
+        with self.changing():
+            if self._phones:
+                old_phone = normalize_phone(old_phone)
+                if old_phone in self._phones:
+                    phone_index = self._phones.index(old_phone)
+                    self._phones = (*self._phones[:phone_index], intern(Phone(new_phone).value),
+                                    *self._phones[phone_index + 1:])
+                    self._changed('phone')
                     return None
-            raise bot_exceptions.UnknownPhoneError
-        else:
-            self.add_phone(new_phone)
+                raise bot_exceptions.UnknownPhoneError
+            else:
+                self.add_phone(new_phone)
 
     def modify_address(self, old_address: str, new_address: str) -> None:
-        if self.address:
-            for address in self.address:
-                if address.value == old_address:
-                    address.value = new_address
+        with self.changing():
+            if self._addresses:
+                if old_address in self._addresses:
+                    address_index = self._addresses.index(old_address)
+                    self._addresses = (*self._addresses[:address_index], intern(new_address),
+                                       *self._addresses[address_index + 1:])
+                    self._changed('address')
                     return None
-            raise bot_exceptions.UnknownAddressError
-        else:
-            self.add_address(new_address)
+                raise bot_exceptions.UnknownAddressError
+            else:
+                self.add_address(new_address)
 
     def modify_birthday(self, new_birthday: str) -> None:
-        self.birthday = Birthday(new_birthday)
+        birthday = Birthday(new_birthday)
+        with self.changing():
+            self.birthday = birthday
+            self._changed('birthday')
 
     def add_phone(self, new_phone: str) -> None:
-        self.phone.append(Phone(new_phone))
+        phone = intern(Phone(new_phone).value)
+        with self.changing():
+            self._phones += (phone,)
+            self._changed('phone')
 
     def add_address(self, new_address: str) -> None:
-        self.address.append(Address(new_address))
+        with self.changing():
+            self._addresses += (intern(new_address),)
+            self._changed('address')
+
+
+def contact_to_record(contact: dict) -> Record:
+    record = Record(
+        contact['name'],
+        None,
+        contact['birthday'],
+        contact['addresses'] or None,
+        contact['email'],
+    )
+    # stored phones are only normalized: the ones older versions of the bot accepted, with letters
+    # or more digits than Phone allows now, are kept as they are, so the contact is still read
+    record._phones = tuple(intern(normalize_phone(phone)) for phone in contact['phones'])
+    # records are built under the lock of the book, that is taken after the locks of the records,
+    # so the notes of the record, that no other thread sees yet, are set without its lock
+    record._notes = tuple(Note(note['note'], note['tags']) for note in contact['notes'])
+    for note in record._notes:
+        note.record = record
+    return record
+
+
+def record_state(record: Record) -> dict:
+    """Contact of the record as it is, the caller makes sure it isn't read in the middle of a change"""
+    return {
+        'name': record.name.value,
+        'phones': record.field_values('phone'),
+        'birthday': record.birthday.value.strftime("%d.%m.%Y") if record.birthday else None,
+        'addresses': record.field_values('address'),
+        'email': record.email.value if record.email else None,
+        'notes': [{'note': note.value, 'tags': list(note.tag_values())} for note in record.note],
+    }
+
+
+def record_to_contact(record: Record) -> dict:
+    return record.consistent(lambda _: record_state(record))
+
+
+class StoredNote(NamedTuple):
+    """Note of the contact, that is not taken from the storage yet, in the full text index"""
+    name: str
+    position: int
+
+
+def index_stored_notes(note_search: NoteSearchIndex, notes: Iterable[Tuple[str, int, str]]) -> None:
+    for name, contact_notes in groupby(notes, key=itemgetter(0)):
+        note_search.update(name, ((StoredNote(name, position), text) for _, position, text in contact_notes))
 
 
 class AddressBook(UserDict):
-    """All contacts data"""
+    """All contacts data.
+    Records are taken into memory from the storage only when they are needed.
+
+    The records, the indexes and the storage are changed under the lock of the book. Queries hold it only to
+    take the found contacts from the storage and to copy the postings of the indexes, the storage is queried,
+    the candidates are checked and the records are read and rendered out of it. A record changed under its own
+    lock takes the lock of the book to update the indexes, so the lock of the book is never the first one
+    to be taken"""
+
+    def __init__(self, storage: Optional[ContactsStorage] = None) -> None:
+        self.search_index = {field: SubstringIndex() for field in SEARCH_FIELDS}
+        self.birthday_index = BirthdayIndex()
+        # normalized phone -> names of the contacts with it
+        self.phone_index = ExactIndex()
+        self.tag_index = TagIndex()
+        # full text index of the notes, built by the first search over them and kept up to date after it
+        self.note_search: Optional[NoteSearchIndex] = None
+        # trigram indexes for 'did you mean' suggestions, built by the first mistyped name or note
+        self._names_matcher: Optional[FuzzyIndex] = None
+        self._notes_matcher: Optional[FuzzyIndex] = None
+        self.storage = storage
+        self._storage_opened = False
+        self._changes_deferred = False
+        # all names of the book in order, built by the first page sorted by name and kept up to date after it
+        self._sorted_names: Optional[List[str]] = None
+        # birthdays of the stored contacts, built by the first page sorted by birthday
+        self._stored_birthdays: Optional[BirthdayIndex] = None
+        # changed by every added or deleted contact, the orders built out of the lock are checked by it
+        self._names_version = 0
+        self._lock = RLock()
+        # a record keeps the book it was held by, even deleted, so its lock never changes under a change
+        self.record_locks = tuple(RLock() for _ in range(RECORD_LOCK_STRIPES))
+        super().__init__()
+
+    def _opened_storage(self) -> Optional[ContactsStorage]:
+        return self.storage if self._storage_opened else None
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            storage = self._opened_storage()
+            return name in self.data or (storage is not None and name in storage)
+
+    def __len__(self) -> int:
+        with self._lock:
+            storage = self._opened_storage()
+            return len(self.data) + (len(storage) if storage is not None else 0)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self.data)
+        storage = self._opened_storage()
+        if storage is not None:
+            yield from storage.names()
+
+    def __missing__(self, name: str) -> Record:
+        with self._lock:
+            storage = self._opened_storage()
+            if storage is not None:
+                contact = storage.pop_contact(name)
+                if contact is not None:
+                    self._hold(name, contact_to_record(contact))
+                    return self.data[name]
+            raise KeyError(name)
+
+    def __setitem__(self, name: str, record: Record) -> None:
+        with self._lock:
+            self._names_version += 1
+            ordered_or_matched = self._sorted_names is not None or self._names_matcher is not None
+            if ordered_or_matched and name not in self:
+                if self._sorted_names is not None:
+                    insort(self._sorted_names, name)
+                if self._names_matcher is not None:
+                    self._names_matcher.add(name)
+            self._hold(name, record)
+
+    def _hold(self, name: str, record: Record) -> None:
+        """Keeps the record in memory instead of the stored or the older version of the contact,
+        the name is already counted in the book"""
+        storage = self._opened_storage()
+        if storage is not None:
+            storage.forget(name)
+            if self._stored_birthdays is not None:
+                self._stored_birthdays.remove(name)
+        self.data[name] = record
+        record.book = self
+        for field in (*SEARCH_FIELDS, 'birthday', 'note'):
+            self.update_record_index(record, field)
+
+    def __delitem__(self, name: str) -> None:
+        with self._lock:
+            self._names_version += 1
+            ordered_or_matched = self._sorted_names is not None or self._names_matcher is not None
+            if ordered_or_matched and name in self:
+                if self._sorted_names is not None:
+                    self._sorted_names.pop(bisect_left(self._sorted_names, name))
+                if self._names_matcher is not None:
+                    self._names_matcher.discard(name)
+            if name not in self.data:
+                storage = self._opened_storage()
+                if storage is None or name not in storage:
+                    raise KeyError(name)
+                storage.forget(name)
+                if self._stored_birthdays is not None:
+                    self._stored_birthdays.remove(name)
+                if self.note_search is not None:
+                    self.note_search.remove(name)
+                return None
+            self.data.pop(name)
+            for field in SEARCH_FIELDS:
+                self.search_index[field].remove(name)
+            self.birthday_index.remove(name)
+            self.phone_index.remove(name)
+            self.tag_index.remove(name)
+            if self.note_search is not None:
+                self.note_search.remove(name)
+            if self._notes_matcher is not None:
+                self._notes_matcher.remove(name)
+
+    def _take_from_storage(self, names: List[str]) -> None:
+        storage = self._opened_storage()
+        if storage is None:
+            return None
+        for name in names:
+            # the lock is taken for every contact, so the changes are not held up by a long batch
+            with self._lock:
+                contact = storage.pop_contact(name)
+                if contact is not None:
+                    self._hold(name, contact_to_record(contact))
+
+    def update_record_index(self, record: Record, field: str) -> None:
+        with self._lock:
+            # the record was deleted or replaced, while its change waited for the lock
+            if self.data.get(record.name.value) is not record:
+                return None
+            if field in self.search_index:
+                self.search_index[field].update(record.name.value, record.field_values(field))
+                if field == 'phone':
+                    self.phone_index.update(record.name.value, record.field_values(field))
+            elif field == 'birthday':
+                birthday = record.birthday.value if record.birthday else None
+                self.birthday_index.update(record.name.value, (birthday.month, birthday.day) if birthday else None)
+            elif field == 'note':
+                self.tag_index.update(record.name.value, ((note, note.tag_values()) for note in record.note))
+                if self.note_search is not None:
+                    self.note_search.update(record.name.value, ((note, note.value) for note in record.note))
+                if self._notes_matcher is not None:
+                    self._notes_matcher.update(record.name.value, (note.value for note in record.note))
 
     def add_record(self, record: dict) -> None:
         new_record = Record(
@@ -251,121 +763,327 @@ class AddressBook(UserDict):
             addresses=record['address'],
             email=record['email'],
         )
-        self.data[new_record.name.value] = new_record
+        self[new_record.name.value] = new_record
+
+    def _records(self, names: Iterable[str]) -> List[Record]:
+        """Records of the found names, the ones deleted since they were found are skipped"""
+        records = (self.data.get(name) for name in names)
+        return [record for record in records if record is not None]
 
     def find_record(self, sought_string: str) -> dict:
-        found_contacts = {
-            'by_name': [],
-            'by_phone': [],
-            'by_email': [],
-            'by_address': [],
-        }
-        for name, record in self.data.items():
-            if sought_string in name:
-                found_contacts['by_name'].append(str(record))
-            elif sought_string in '|,|'.join([phone.value for phone in record.phone]):
-                found_contacts['by_phone'].append(str(record))
-            elif record.email and sought_string in record.email.value:
-                found_contacts['by_email'].append(str(record))
-            elif sought_string in '|,|'.join(addr.value for addr in record.address):
-                found_contacts['by_address'].append(str(record))
+        # phones are kept without separators, so '+38 (050)' finds '+38050...'
+        sought_phone = compact_phone(sought_string) or sought_string
+        storage = self._opened_storage()
+        if storage is not None:
+            self._take_from_storage(storage.find_names(sought_string))
+            if sought_phone != sought_string:
+                self._take_from_storage(storage.find_names(sought_phone))
+        found_contacts = {}
+        already_found = set()
+        for field in SEARCH_FIELDS:
+            field_string = sought_phone if field == 'phone' else sought_string
+            found_names = self.search_index[field].search(field_string, self._lock) - already_found
+            already_found |= found_names
+            found_contacts[f'by_{field}'] = self._records(sorted(found_names))
         return found_contacts
 
-    def load(self) -> None:
-        with open(CONTACTS_PATH, 'r') as tr:
-            contacts_reader = DictReader(tr)
-            for row in contacts_reader:
-                contact_phones = None
-                if row['numbers'] != 'None':
-                    contact_phones = row['numbers'].split(',')
-                contact_birthday = None
-                if row['birthday'] != 'None':
-                    contact_birthday = row['birthday']
-                contact_addresses = None
-                if row['addresses'] != 'None':
-                    contact_addresses = row['addresses'].split(',')
-                contact_email = None
-                if row['email'] != 'None':
-                    contact_email = row['email']
-                if row['notes'] != 'None':
-                    raw_notes = (row['notes'].split(','))[:-1]
-                    self.data[row['name']] = Record(
-                                                row['name'],
-                                                contact_phones,
-                                                contact_birthday,
-                                                contact_addresses,
-                                                contact_email,
-                                             )
-                    contact = self.get_record_by_name(row['name'])
-                    for raw_note in raw_notes:
-                        prepared_note, raw_tags = raw_note.split('|tags:|')
-                        prepared_tags = raw_tags.split('/|')
-                        contact.add_note(prepared_note, prepared_tags)
-                else:
-                    self.data[row['name']] = Record(
-                                                row['name'],
-                                                contact_phones,
-                                                contact_birthday,
-                                                contact_addresses,
-                                                contact_email,
-                                             )
+    def find_by_phone(self, phone: str) -> List[Record]:
+        """Contacts with the phone, whatever format it is written in"""
+        phone = Phone(phone).value
+        storage = self._opened_storage()
+        if storage is not None:
+            self._take_from_storage(storage.phone_names(phone))
+        with self._lock:
+            found_names = self.phone_index.keys_of(phone)
+        return self._records(sorted(found_names))
+
+    def duplicate_phones(self) -> Dict[str, List[str]]:
+        """Phones of more than one contact, with the names of these contacts"""
+        storage = self._opened_storage()
+        stored_owners: Dict[str, Set[str]] = {}
+        for name, phone in (storage.phones() if storage is not None else []):
+            stored_owners.setdefault(phone, set()).add(name)
+        with self._lock:
+            duplicates = {}
+            for phone in chain(self.phone_index.duplicated(), stored_owners):
+                owners = self.phone_index.keys_of(phone) | stored_owners.get(phone, set())
+                if len(owners) > 1:
+                    duplicates[phone] = sorted(owners)
+            return dict(sorted(duplicates.items()))
+
+    def find_tagged_notes(self, tag_groups: List[List[str]]) -> List[Tuple[str, Note]]:
+        """(contact name, note) of the notes having all tags of any of the groups.
+        The storage finds its notes itself, the stored contacts are not taken into memory"""
+        storage = self._opened_storage()
+        stored_notes: Dict[Tuple[str, int], Note] = {}
+        if storage is not None:
+            for group in tag_groups:
+                for name, position, text, tags in storage.tagged_notes(set(group)):
+                    stored_notes.setdefault((name, position), Note(text, tags))
+        with self._lock:
+            found_notes = self.tag_index.search(tag_groups)
+            # the contacts taken from the storage meanwhile are found in memory
+            found_notes += [(name, note) for (name, _), note in sorted(stored_notes.items(), key=itemgetter(0))
+                            if name not in self.data]
+        return sorted(found_notes, key=itemgetter(0))
+
+    def search_notes(self, query: str, limit: int) -> List[Tuple[float, str, Note]]:
+        """(score, contact name, note) of the notes of all contacts, that match the query best.
+        Notes of the stored contacts are indexed as they are, only the contacts with the best notes are taken
+        into memory"""
+        found_notes = self._note_search_built().search(query, limit, self._lock)
+        self._take_from_storage([name for _, name, note in found_notes if isinstance(note, StoredNote)])
+        taken_notes = []
+        for score, name, note in found_notes:
+            if isinstance(note, StoredNote):
+                record = self.data.get(name)
+                # the taken contact was deleted or its notes changed meanwhile
+                if record is None or note.position >= len(record.note):
+                    continue
+                note = record.note[note.position]
+            taken_notes.append((score, name, note))
+        return taken_notes
+
+    def _note_search_built(self) -> NoteSearchIndex:
+        """Full text index of the notes, the stored ones are indexed out of the lock by the first search"""
+        while True:
+            with self._lock:
+                if self.note_search is not None:
+                    return self.note_search
+                version = self._names_version
+                storage = self._opened_storage()
+            note_search = NoteSearchIndex()
+            if storage is not None:
+                index_stored_notes(note_search, storage.notes())
+            with self._lock:
+                if self._names_version == version:
+                    # notes of the contacts in memory replace the stored ones of the contacts taken meanwhile
+                    for name, record in self.data.items():
+                        note_search.update(name, ((note, note.value) for note in record.note))
+                    self.note_search = note_search
+
+    def load(self, lazy: bool = False) -> None:
+        """Opens the storage (contacts csv file by default),
+        in lazy mode the records are read from it only when they are needed"""
+        with self._lock:
+            if self.storage is None:
+                self.storage = CsvStorage(CONTACTS_PATH)
+            self.storage.open()
+            self._storage_opened = True
+            if not lazy:
+                for contact in self.storage.pop_all():
+                    self._hold(contact['name'], contact_to_record(contact))
+
+    def log_change(self, name: str) -> None:
+        """Persists the current state of the contact, so the change survives without rewriting the whole book"""
+        with self._lock:
+            storage = self._opened_storage()
+            if storage is None or self._changes_deferred:
+                return None
+            if name in self:
+                # a change replaces the field of the record before it takes the lock of the book to update
+                # the indexes, so under this lock the record is never in the middle of a change
+                storage.write_contact(record_state(self[name]))
+            else:
+                storage.delete_contact(name)
+
+    def defer_changes(self) -> None:
+        """Changes are not persisted one by one any more, save() writes them all at once"""
+        self._changes_deferred = True
+
+    def add_contacts(self, contacts: List[dict]) -> None:
+        """Adds the batch of checked new contacts, they go straight to the storage and are read when needed"""
+        with self._lock:
+            self._names_version += 1
+            self._sorted_names = None
+            self._stored_birthdays = None
+            storage = self._opened_storage()
+            if storage is not None:
+                storage.add_contacts(contacts)
+                if self.note_search is not None:
+                    index_stored_notes(self.note_search, ((contact['name'], position, note['note'])
+                                                          for contact in contacts
+                                                          for position, note in enumerate(contact['notes'])))
+                if self._names_matcher is not None:
+                    for contact in contacts:
+                        self._names_matcher.add(contact['name'])
+            else:
+                for contact in contacts:
+                    self[contact['name']] = contact_to_record(contact)
+
+    def contacts(self) -> Iterator[dict]:
+        """All contacts of the book, when it is called, the ones in the storage are not taken into memory.
+        They are read out of the lock, so the other threads may use the book meanwhile"""
+        with self._lock:
+            records = list(self.data.values())
+            storage = self._opened_storage()
+            stored_contacts = storage.contacts() if storage is not None else iter(())
+        return chain(map(record_to_contact, records), stored_contacts)
 
     def save(self) -> None:
-        with open(CONTACTS_PATH, 'w') as tw:
-            contacts_writer = DictWriter(tw, FIELD_NAMES, )
-            contacts_writer.writeheader()
-            for name, record in self.data.items():
-                contact_phones = 'None'
-                if len(record.phone) > 0:
-                    contact_phones = ','.join([phone.value for phone in record.phone])
-                contact_birthday = 'None'
-                if record.birthday:
-                    contact_birthday = record.birthday.value.strftime("%d.%m.%Y")
-                contact_addresses = 'None'
-                if len(record.address) > 0:
-                    contact_addresses = ','.join([addr.value for addr in record.address])
-                notes = ''
-                if len(record.note) != 0:
-                    for this_note in record.note:
-                        this_note_tags = ""
-                        if len(this_note.tag) > 0:
-                            this_note_tags = "/|".join([tag.value for tag in this_note.tag])
-                        notes += f'{this_note.value}' \
-                                 f'|tags:|' \
-                                 f'{this_note_tags},'
-                else:
-                    notes = 'None'
-                contact_email = 'None'
-                if record.email:
-                    contact_email = record.email.value
-                contacts_writer.writerow({'name': name,
-                                          'numbers': contact_phones,
-                                          'birthday': contact_birthday,
-                                          'addresses': contact_addresses,
-                                          'email': contact_email,
-                                          'notes': notes,
-                                          })
+        """Writes the whole book to the storage"""
+        with self._lock:
+            storage = self._opened_storage()
+            if storage is not None:
+                storage.save(record_state(record) for record in list(self.data.values()))
+
+    def close(self) -> None:
+        """All changes are already persisted, so closing only waits for the storage to finish its writes"""
+        with self._lock:
+            storage = self._opened_storage()
+            if storage is not None:
+                storage.close()
+                self._storage_opened = False
+
+    def _take_all_from_storage(self) -> None:
+        with self._lock:
+            storage = self._opened_storage()
+            if storage is not None:
+                for contact in storage.pop_all():
+                    self._hold(contact['name'], contact_to_record(contact))
 
     def see_all_contacts(self) -> str:
-        all_records = [str(record) for record in self.data.values()]
+        self._take_all_from_storage()
+        with self._lock:
+            records = list(self.data.values())
+        all_records = [str(record) for record in records]
         return '\n'.join(all_records)
 
+    def _sorted_names_built(self) -> List[str]:
+        """All names in order, sorted out of the lock by the first page and kept up to date after it.
+        The list is kept only if no contact was added or deleted, while it was sorted"""
+        while True:
+            with self._lock:
+                if self._sorted_names is not None:
+                    return self._sorted_names
+                version = self._names_version
+                storage = self._opened_storage()
+            # a contact taken from the storage after its names are listed is found in memory
+            stored_names = storage.names() if storage is not None else []
+            with self._lock:
+                names = set(self.data)
+            names.update(stored_names)
+            sorted_names = sorted(names)
+            with self._lock:
+                if self._names_version == version:
+                    self._sorted_names = sorted_names
+
+    def _stored_birthdays_built(self) -> BirthdayIndex:
+        """Birthdays of the stored contacts, read out of the lock by the first page sorted by birthday"""
+        while True:
+            with self._lock:
+                if self._stored_birthdays is not None:
+                    return self._stored_birthdays
+                version = self._names_version
+                storage = self._opened_storage()
+            stored_birthdays = BirthdayIndex()
+            for name, month_and_day in (storage.birthdays() if storage is not None else []):
+                stored_birthdays.update(name, month_and_day)
+            with self._lock:
+                if self._names_version == version:
+                    # contacts taken from the storage meanwhile have their birthdays in memory
+                    for name in self.data:
+                        stored_birthdays.remove(name)
+                    self._stored_birthdays = stored_birthdays
+
+    def _names_in_order(self, sort_by: str) -> Iterator[str]:
+        """Names of all contacts in the order, that the storage can't page itself.
+        The storage is read and the orders are built out of the lock, the names are iterated under it"""
+        if sort_by == 'name':
+            return iter(self._sorted_names_built())
+        storage = self._opened_storage()
+        stored_names = storage.names() if storage is not None else []
+        # names taken from the storage after they were listed are in memory
+        stored_names = (name for name in stored_names if name not in self.data)
+        stored_birthdays = self._stored_birthdays_built()
+        today = date.today()
+        return chain((name for _, name in merge(self.birthday_index.upcoming(today),
+                                                stored_birthdays.upcoming(today))),
+                     (name for name in self.data if name not in self.birthday_index),
+                     (name for name in stored_names if name not in stored_birthdays))
+
+    def page_names(self, offset: int = 0, size: int = PAGE_SIZE, sort_by: Optional[str] = None) -> List[str]:
+        """Names of the page, records are not taken from the storage here. The names in memory go first,
+        the storage pages its names itself, so the first pages don't list all of them"""
+        storage = self._opened_storage()
+        if sort_by == 'birthday' or (sort_by == 'name' and (storage is None or not storage.orders_names)):
+            names_in_order = self._names_in_order(sort_by)
+            with self._lock:
+                return list(islice(names_in_order, offset, offset + size))
+        with self._lock:
+            storage = self._opened_storage()
+            if sort_by == 'name':
+                # the names taken from the storage are in memory only, so the two orders are merged
+                stored_names = storage.names_page(0, offset + size, by_name=True) if storage is not None else []
+                return list(islice(merge(nsmallest(offset + size, self.data), stored_names), offset, offset + size))
+            names = list(islice(self.data, offset, offset + size))
+            if storage is not None and len(names) < size:
+                names += storage.names_page(max(offset - len(self.data), 0), size - len(names))
+            return names
+
+    def records(self, names: Iterable[str]) -> Iterator[Record]:
+        """Records of the names taken into memory one by one, the deleted contacts are skipped"""
+        for name in names:
+            record = self.get(name)
+            # the contact was deleted after its name was taken
+            if record is not None:
+                yield record
+
+    def page(self, offset: int = 0, size: int = PAGE_SIZE, sort_by: Optional[str] = None) -> Iterator[Record]:
+        """Records of the page, only they are taken into memory and one by one, as the page is consumed"""
+        return self.records(self.page_names(offset, size, sort_by))
+
+    def similar_names(self, name: str) -> List[str]:
+        """Names of the contacts, that the mistyped name may mean"""
+        with self._lock:
+            if self._names_matcher is None:
+                self._names_matcher = FuzzyIndex()
+                storage = self._opened_storage()
+                for contact_name in chain(self.data, storage.names() if storage is not None else []):
+                    self._names_matcher.add(contact_name)
+            return self._names_matcher.similar(name)
+
+    def similar_notes(self, record: Record, note: str) -> List[str]:
+        """Notes of the record, that the mistyped note may mean"""
+        with self._lock:
+            if self._notes_matcher is None:
+                self._notes_matcher = FuzzyIndex()
+                for name, book_record in self.data.items():
+                    self._notes_matcher.update(name, (this_note.value for this_note in book_record.note))
+            return self._notes_matcher.similar(note, among={this_note.value for this_note in record.note})
+
     def get_record_by_name(self, name: str) -> Record:
         try:
-            return self.data[name]
+            return self[name]
         except KeyError:
-            raise bot_exceptions.UnknownContactError
+            raise bot_exceptions.UnknownContactError(self.similar_names(name))
 
     def delete_record(self, name: str) -> None:
-        self.get_record_by_name(name)
-        self.data.pop(name)
+        with self._lock:
+            self.get_record_by_name(name)
+            del self[name]
+
+    def _birthdays_in_range(self, first_day: int, last_day: int) -> List[Tuple[int, str]]:
+        """(days to birthday, name) of the birthdays in the range, the storage finds its birthdays itself"""
+        storage = self._opened_storage()
+        stored_birthdays = BirthdayIndex()
+        if storage is not None:
+            for name, month_and_day in storage.birthdays_on(birthdays_calendar_days(first_day, last_day)):
+                stored_birthdays.update(name, month_and_day)
+        with self._lock:
+            return sorted(self.birthday_index.in_range(first_day, last_day) +
+                          [(days, name) for days, name in stored_birthdays.in_range(first_day, last_day)
+                           if name not in self.data])
 
     def get_birthdays_by_days(self, days_from_now: int) -> str:
-        birthdays_in_future = []
-        for name, record in self.data.items():
-            if record.birthday:
-                if record.days_to_birthday() == days_from_now:
-                    birthdays_in_future.append(name)
+        birthdays_in_future = [name for _, name in self._birthdays_in_range(days_from_now, days_from_now)]
         return f'These people have birthdays in ' \
                f'{days_from_now} days from now: ' \
                f'{",".join(birthdays_in_future) if len(birthdays_in_future) != 0 else "None"}'
+
+    def get_birthdays_in_range(self, first_day: int, last_day: int) -> str:
+        birthdays_in_future = [f'{name} (in {days} days)'
+                               for days, name in self._birthdays_in_range(first_day, last_day)]
+        return f'These people have birthdays from ' \
+               f'{first_day} to {last_day} days from now: ' \
+               f'{", ".join(birthdays_in_future) if len(birthdays_in_future) != 0 else "None"}'
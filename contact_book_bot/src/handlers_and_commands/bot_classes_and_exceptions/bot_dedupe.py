@@ -0,0 +1,211 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from .bot_classes import AddressBook, Record
+from .bot_indexes import grams_similarity, padded_grams
+
+WORD_PATTERN = re.compile(r'\w+')
+# soundex codes of the consonants, the letters without a code only separate the same codes
+SOUNDEX_GROUPS = ('bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r')
+SOUNDEX_CODES = {letter: str(code) for code, letters in enumerate(SOUNDEX_GROUPS, 1) for letter in letters}
+SOUNDEX_SKIPPED = frozenset('aeiouyhwаеєиіїоуюяыэьъй')
+PHONETIC_WORDS_CACHE_SIZE = 65536
+# weights of the matching fields in the score of a pair of contacts
+NAME_WEIGHT = 0.5
+PHONE_WEIGHT = 0.35
+EMAIL_WEIGHT = 0.35
+BIRTHDAY_WEIGHT = 0.2
+# names, that sound the same, are this similar even if they are spelled differently
+SAME_SOUND_SIMILARITY = 0.9
+# pairs scoring at least this are duplicates, a similar name alone or a shared phone alone is not enough
+DUPLICATE_SCORE = 0.7
+# contacts sharing a key with more contacts than this are not compared by it,
+# a key like the phone of an office would make the comparison quadratic
+MAX_BLOCK_SIZE = 50
+
+
+class ContactSummary(NamedTuple):
+    name: str
+    name_key: str
+    phones: FrozenSet[str]
+    email: Optional[str]
+    birthday: Optional[str]
+
+
+class DuplicateGroup(NamedTuple):
+    names: List[str]
+    # score of the weakest pair, that joined the group
+    score: float
+
+
+class DisjointSet:
+    """Union-find of the contacts indexes, pairs of duplicates join their groups"""
+
+    def __init__(self) -> None:
+        self._parents: Dict[int, int] = {}
+
+    def find(self, item: int) -> int:
+        parent = self._parents.setdefault(item, item)
+        while parent != item:
+            grandparent = self._parents[parent]
+            self._parents[item] = grandparent
+            item, parent = parent, grandparent
+        return item
+
+    def union(self, item: int, other: int) -> None:
+        root, other_root = self.find(item), self.find(other)
+        if root != other_root:
+            self._parents[max(root, other_root)] = min(root, other_root)
+
+    def groups(self) -> Dict[int, List[int]]:
+        groups = defaultdict(list)
+        for item in self._parents:
+            groups[self.find(item)].append(item)
+        return groups
+
+
+@lru_cache(maxsize=PHONETIC_WORDS_CACHE_SIZE)
+def phonetic_word(word: str) -> str:
+    if word.isdigit():
+        return word
+    key, last_code = word[:1], SOUNDEX_CODES.get(word[:1])
+    for char in word[1:]:
+        if char in SOUNDEX_SKIPPED:
+            last_code = None
+            continue
+        code = SOUNDEX_CODES.get(char, char)
+        if code != last_code:
+            key += code
+        last_code = code
+    return key
+
+
+def name_key(name: str) -> str:
+    """Sound of the name, the same for 'Jon Smith' and 'Smyth John'"""
+    return ' '.join(sorted(phonetic_word(word) for word in WORD_PATTERN.findall(name.casefold())))
+
+
+def summarize(contact: dict) -> ContactSummary:
+    return ContactSummary(
+        contact['name'],
+        name_key(contact['name']),
+        frozenset(contact['phones']),
+        contact['email'].lower() if contact['email'] else None,
+        contact['birthday'],
+    )
+
+
+def blocking_keys(contact: ContactSummary) -> Iterator[str]:
+    """Only contacts sharing one of these keys are compared"""
+    yield 'name:' + contact.name_key
+    for phone in contact.phones:
+        yield 'phone:' + phone
+    if contact.email:
+        yield 'email:' + contact.email
+
+
+def pair_score(contact: ContactSummary, other: ContactSummary, grams: Set[str], other_grams: Set[str]) -> float:
+    name_similarity = grams_similarity(grams, other_grams)
+    if contact.name_key == other.name_key:
+        name_similarity = max(name_similarity, SAME_SOUND_SIMILARITY)
+    score = NAME_WEIGHT * name_similarity
+    if contact.phones & other.phones:
+        score += PHONE_WEIGHT
+    if contact.email and contact.email == other.email:
+        score += EMAIL_WEIGHT
+    if contact.birthday and contact.birthday == other.birthday:
+        score += BIRTHDAY_WEIGHT
+    return score
+
+
+def find_duplicates(contacts: Iterable[dict]) -> List[DuplicateGroup]:
+    """Groups of contacts, that are likely the same person.
+    Contacts are compared only inside the blocks of the same key, so the work grows with the book almost linearly"""
+    summaries: List[ContactSummary] = []
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for contact in contacts:
+        summary = summarize(contact)
+        for key in blocking_keys(summary):
+            blocks[key].append(len(summaries))
+        summaries.append(summary)
+    names_grams: Dict[int, Set[str]] = {}
+
+    def grams_of(index: int) -> Set[str]:
+        if index not in names_grams:
+            names_grams[index] = padded_grams(summaries[index].name)
+        return names_grams[index]
+
+    compared: Set[Tuple[int, int]] = set()
+    duplicate_pairs: List[Tuple[int, int, float]] = []
+    groups = DisjointSet()
+    for members in blocks.values():
+        if not 2 <= len(members) <= MAX_BLOCK_SIZE:
+            continue
+        for index, other_index in combinations(members, 2):
+            if (index, other_index) in compared:
+                continue
+            compared.add((index, other_index))
+            score = pair_score(summaries[index], summaries[other_index], grams_of(index), grams_of(other_index))
+            if score >= DUPLICATE_SCORE:
+                groups.union(index, other_index)
+                duplicate_pairs.append((index, other_index, score))
+    weakest_scores: Dict[int, float] = {}
+    for index, _, score in duplicate_pairs:
+        root = groups.find(index)
+        weakest_scores[root] = min(score, weakest_scores.get(root, score))
+    return sorted(
+        (DuplicateGroup(sorted(summaries[index].name for index in members), weakest_scores[root])
+         for root, members in groups.groups().items() if len(members) > 1),
+        key=lambda group: group.names,
+    )
+
+
+def filled_fields(record: Record) -> int:
+    return len(record.field_values('phone')) + len(record.field_values('address')) + len(record.note) + \
+        bool(record.email) + bool(record.birthday)
+
+
+def merge_records(primary: Record, duplicate: Record) -> None:
+    """Adds everything the duplicate knows and the primary doesn't to the primary, in one change of it.
+    The values of the duplicate are copied as they are stored, without checking them again, so the phones,
+    that older versions of the bot accepted, don't stop the merge"""
+    with primary.changing():
+        primary_phones = primary.field_values('phone')
+        new_phones = [phone for phone in duplicate.field_values('phone') if phone not in primary_phones]
+        if new_phones:
+            primary.change_values('phone', lambda phones: phones.extend(new_phones))
+        primary_addresses = primary.field_values('address')
+        new_addresses = [address for address in duplicate.field_values('address') if address not in primary_addresses]
+        if new_addresses:
+            primary.change_values('address', lambda addresses: addresses.extend(new_addresses))
+        if primary.email is None and duplicate.email is not None:
+            primary.modify_email(duplicate.email.value)
+        if primary.birthday is None and duplicate.birthday is not None:
+            primary.modify_birthday(duplicate.birthday.value.strftime('%d.%m.%Y'))
+        primary_notes = {note.value: note for note in primary.note}
+        for note in duplicate.note:
+            if note.value in primary_notes:
+                for tag in note.tag_values():
+                    primary_notes[note.value].add_tag(tag)
+            else:
+                primary.add_note(note.value, list(note.tag_values()))
+
+
+def merge_duplicates(contacts_book: AddressBook, groups: List[DuplicateGroup]) -> List[Tuple[str, List[str]]]:
+    """Merges every group into its most filled contact, (kept name, merged names) of every group"""
+    merged_groups = []
+    for group in groups:
+        records = [contacts_book.get_record_by_name(name) for name in group.names]
+        primary = max(records, key=filled_fields)
+        merged_names = []
+        for record in records:
+            if record is not primary:
+                merge_records(primary, record)
+                contacts_book.delete_record(record.name.value)
+                contacts_book.log_change(record.name.value)
+                merged_names.append(record.name.value)
+        contacts_book.log_change(primary.name.value)
+        merged_groups.append((primary.name.value, merged_names))
+    return merged_groups
@@ -44,3 +44,27 @@ class UnknownFieldError(Exception):
 
 class UnknownAddressError(Exception):
     """Unknown address for selected contact"""
+
+
+class UnknownFileFormatError(Exception):
+    """Unsupported format of the import or export file"""
+
+
+class InvalidFilePathError(Exception):
+    """Invalid file path"""
+
+
+class PageError(Exception):
+    """Invalid page size, offset or sort of the contacts page"""
+
+
+class TagQueryError(Exception):
+    """Empty tag query"""
+
+
+class SearchQueryError(Exception):
+    """Search query without words or invalid amount of results"""
+
+
+class FileTypesConfigError(Exception):
+    """Unreadable or invalid file types config of the dir sorter"""
@@ -0,0 +1,326 @@
+import re
+from csv import DictReader, DictWriter
+from datetime import date
+from itertools import islice
+from json import dumps, loads, JSONDecodeError
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from . import bot_exceptions
+from .bot_classes import AddressBook
+from .bot_phones import MAX_PHONE_DIGITS, normalize_phone
+from .bot_storage import CSV_VALUE_SEPARATORS, FIELD_NAMES, CONTACTS_FILE_ENCODING, row_to_contact, \
+    contact_to_row, has_separators
+
+IMPORT_CHUNK_SIZE = 10_000
+CSV_FORMAT, JSONL_FORMAT, VCARD_FORMAT = 'csv', 'jsonl', 'vcard'
+FILE_FORMATS = {
+    '.csv': CSV_FORMAT,
+    '.jsonl': JSONL_FORMAT,
+    '.ndjson': JSONL_FORMAT,
+    '.vcf': VCARD_FORMAT,
+    '.vcard': VCARD_FORMAT,
+}
+# the same rules as Phone, Birthday and Email values check one by one
+PHONE_PATTERN = re.compile(rf'\+[0-9]{{1,{MAX_PHONE_DIGITS}}}')
+BIRTHDAY_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+EMAIL_PATTERN = re.compile(r'[.a-z0-9-_]+@[a-z]{1,8}\.[a-z]{1,3}')
+VCARD_BIRTHDAY_PATTERN = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})')
+VCARD_ESCAPES = {'n': '\n', 'N': '\n', ',': ',', ';': ';', '\\': '\\'}
+VCARD_ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+# raw record of the file: line number, where it starts, and the text or the csv row
+RawRecord = Tuple[int, object]
+
+
+def file_format(path: Path) -> str:
+    try:
+        return FILE_FORMATS[path.suffix.lower()]
+    except KeyError:
+        raise bot_exceptions.UnknownFileFormatError
+
+
+def empty_contact(name: str) -> dict:
+    return {'name': name, 'phones': [], 'birthday': None, 'addresses': [], 'email': None, 'notes': []}
+
+
+def read_csv_records(import_file) -> Iterator[RawRecord]:
+    csv_reader = DictReader(import_file)
+    line_number = csv_reader.line_num + 1
+    for row in csv_reader:
+        yield line_number, row
+        line_number = csv_reader.line_num + 1
+
+
+def parse_csv_record(row: dict) -> dict:
+    """Row of the contacts file format, missing columns are empty"""
+    if not row.get('name'):
+        raise ValueError('there is no name')
+    return row_to_contact({field: row.get(field) or 'None' for field in FIELD_NAMES})
+
+
+def read_jsonl_records(import_file) -> Iterator[RawRecord]:
+    for line_number, line in enumerate(import_file, 1):
+        if line.strip():
+            yield line_number, line
+
+
+def parse_jsonl_record(line: str) -> dict:
+    """Contact as the storage keeps it, single phone, address or tag may be given as a string"""
+    try:
+        raw_contact = loads(line)
+    except JSONDecodeError as error:
+        raise ValueError(f'invalid json: {error}')
+    if not isinstance(raw_contact, dict) or not raw_contact.get('name'):
+        raise ValueError('there is no name')
+    contact = empty_contact(str(raw_contact['name']))
+    for field in ('phones', 'addresses'):
+        values = raw_contact.get(field) or []
+        contact[field] = [str(value) for value in ([values] if isinstance(values, str) else values)]
+    for field in ('birthday', 'email'):
+        if raw_contact.get(field):
+            contact[field] = str(raw_contact[field])
+    for note in raw_contact.get('notes') or []:
+        if isinstance(note, str):
+            note = {'note': note}
+        tags = note.get('tags') or []
+        contact['notes'].append({'note': str(note.get('note', '')),
+                                 'tags': [str(tag) for tag in ([tags] if isinstance(tags, str) else tags)]})
+    return contact
+
+
+def read_vcard_records(import_file) -> Iterator[RawRecord]:
+    """Cards with the folded lines already joined"""
+    card_lines, card_start = None, 0
+    for line_number, line in enumerate(import_file, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and card_lines:
+            card_lines[-1] += line[1:]
+            continue
+        if line.upper() == 'BEGIN:VCARD':
+            card_lines, card_start = [], line_number
+        elif line.upper() == 'END:VCARD' and card_lines is not None:
+            yield card_start, card_lines
+            card_lines = None
+        elif card_lines is not None and line:
+            card_lines.append(line)
+
+
+def unescape_vcard(value: str) -> str:
+    return VCARD_ESCAPE_PATTERN.sub(lambda match: VCARD_ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def split_unquoted(text: str, separator: str, max_split: int = -1) -> List[str]:
+    """Splits the content line of the card, separators inside the quoted parameter values are kept"""
+    parts, start, quoted = [], 0, False
+    for position, symbol in enumerate(text):
+        if symbol == '"':
+            quoted = not quoted
+        elif symbol == separator and not quoted and len(parts) != max_split:
+            parts.append(text[start:position])
+            start = position + 1
+    parts.append(text[start:])
+    return parts
+
+
+def quote_parameter(value: str) -> str:
+    """Parameter value with the ^ escapes of RFC 6868, quoted"""
+    return '"' + value.replace('^', '^^').replace('\n', '^n').replace('"', "^'") + '"'
+
+
+def unquote_parameter(value: str) -> str:
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    return re.sub(r"\^([\^n'])", lambda match: {'^': '^', 'n': '\n', "'": '"'}[match.group(1)], value)
+
+
+def parse_vcard_record(card_lines: List[str]) -> dict:
+    """FN, TEL, BDAY, ADR, EMAIL and NOTE properties of the card.
+    Tags of a note are in its X-TAGS parameter, notes of other programs get the CATEGORIES of the card"""
+    properties: Dict[str, List[str]] = {}
+    note_tags: List[Optional[str]] = []
+    for line in card_lines:
+        name, *value = split_unquoted(line, ':', 1)
+        if value:
+            # groups like item1.EMAIL and parameters like TEL;TYPE=cell don't matter, except the tags of notes
+            property_name, *parameters = split_unquoted(name, ';')
+            property_name = property_name.split('.')[-1].upper()
+            properties.setdefault(property_name, []).append(value[0])
+            if property_name == 'NOTE':
+                note_tags.append(next((unquote_parameter(parameter.partition('=')[2]) for parameter in parameters
+                                       if parameter.upper().startswith('X-TAGS=')), None))
+    if not properties.get('FN') or not properties['FN'][0].strip():
+        raise ValueError('there is no FN (name)')
+    contact = empty_contact(unescape_vcard(properties['FN'][0]).strip())
+    contact['phones'] = list(properties.get('TEL', []))
+    for address in properties.get('ADR', []):
+        parts = [unescape_vcard(part).strip() for part in re.split(r'(?<!\\);', address)]
+        contact['addresses'].append(' '.join(part for part in parts if part))
+    if properties.get('BDAY'):
+        birthday = VCARD_BIRTHDAY_PATTERN.fullmatch(properties['BDAY'][0].strip())
+        if not birthday:
+            raise ValueError(f"BDAY '{properties['BDAY'][0]}' is not a date")
+        year, month, day = birthday.groups()
+        contact['birthday'] = f'{day}.{month}.{year}'
+    if properties.get('EMAIL'):
+        contact['email'] = properties['EMAIL'][0].strip()
+    tags = [unescape_vcard(tag).strip() for categories in properties.get('CATEGORIES', [])
+            for tag in re.split(r'(?<!\\),', categories) if tag.strip()]
+    for note, this_note_tags in zip(properties.get('NOTE', []), note_tags):
+        if this_note_tags is not None:
+            this_note_tags = [tag for tag in this_note_tags.split(',') if tag]
+        contact['notes'].append({'note': unescape_vcard(note),
+                                 'tags': tags if this_note_tags is None else this_note_tags})
+    return contact
+
+
+READERS: Dict[str, Tuple[Callable[[object], Iterator[RawRecord]], Callable[[object], dict]]] = {
+    CSV_FORMAT: (read_csv_records, parse_csv_record),
+    JSONL_FORMAT: (read_jsonl_records, parse_jsonl_record),
+    VCARD_FORMAT: (read_vcard_records, parse_vcard_record),
+}
+
+
+def separators_error(separators: str) -> str:
+    return "values can't contain " + ' or '.join(f"'{separator}'" for separator in separators)
+
+
+def check_contacts(
+        contacts: List[dict],
+        known_names: Callable[[str], bool],
+        seen_names: Set[str],
+        separators: str = CSV_VALUE_SEPARATORS,
+) -> List[str]:
+    """Errors of the chunk of contacts ('' for the good ones), every field is checked for the whole chunk at once.
+    Values can't contain the separators of the storage, the contacts go to"""
+    errors = [''] * len(contacts)
+
+    def reject(index: int, error: str) -> None:
+        if not errors[index]:
+            errors[index] = error
+
+    if separators:
+        for index, contact in enumerate(contacts):
+            if has_separators(contact, separators):
+                reject(index, separators_error(separators))
+    for contact in contacts:
+        contact['phones'] = [normalize_phone(phone) for phone in contact['phones']]
+    for index, phones in enumerate(contact['phones'] for contact in contacts):
+        if not all(map(PHONE_PATTERN.fullmatch, phones)):
+            reject(index, f'phone number must start with + and contain only digits, up to {MAX_PHONE_DIGITS}')
+    for index, birthday in enumerate(contact['birthday'] for contact in contacts):
+        if birthday:
+            matched_birthday = BIRTHDAY_PATTERN.fullmatch(birthday)
+            try:
+                day, month, year = map(int, matched_birthday.groups())
+                contacts[index]['birthday'] = date(year, month, day).strftime('%d.%m.%Y')
+            except (AttributeError, ValueError):
+                reject(index, "birthday must match pattern 'day.month.year'")
+    for index, email in enumerate(contact['email'] for contact in contacts):
+        if email and not EMAIL_PATTERN.search(email):
+            reject(index, 'invalid email address')
+    for index, name in enumerate(contact['name'] for contact in contacts):
+        if name in seen_names or known_names(name):
+            reject(index, f"contact '{name}' already exists")
+        elif not errors[index]:
+            seen_names.add(name)
+    return errors
+
+
+def import_contacts(import_path: Path, contacts_book: AddressBook) -> Tuple[int, int, Optional[Path]]:
+    """Streams the file into the book by chunks, rejected records with the reasons go to the errors file.
+    Returns the amounts of imported and rejected records and the errors file path, if there were rejected ones"""
+    import_path = Path(import_path)
+    read_records, parse_record = READERS[file_format(import_path)]
+    if not import_path.is_file():
+        raise bot_exceptions.InvalidFilePathError
+    errors_path = import_path.with_name(import_path.name + '.errors.jsonl')
+    imported, rejected = 0, 0
+    seen_names: Set[str] = set()
+    # SQLite keeps any characters, the contacts file can't keep its separators
+    separators = contacts_book.storage.value_separators if contacts_book.storage is not None else ''
+    # exports of other programs often start with the byte order mark
+    with open(import_path, 'r', encoding='utf-8-sig', newline='') as import_file, \
+            open(errors_path, 'w', encoding=CONTACTS_FILE_ENCODING) as errors_file:
+        raw_records = read_records(import_file)
+        while True:
+            chunk = list(islice(raw_records, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            parsed, rejected_records = [], []
+            for line_number, raw_record in chunk:
+                try:
+                    parsed.append((line_number, raw_record, parse_record(raw_record)))
+                except (ValueError, TypeError, AttributeError) as error:
+                    rejected_records.append((line_number, raw_record, str(error)))
+            errors = check_contacts([contact for _, _, contact in parsed], contacts_book.__contains__, seen_names,
+                                    separators)
+            accepted = [contact for (_, _, contact), error in zip(parsed, errors) if not error]
+            if accepted:
+                contacts_book.add_contacts(accepted)
+            rejected_records += [(line_number, raw_record, error)
+                                 for (line_number, raw_record, _), error in zip(parsed, errors) if error]
+            for line_number, raw_record, error in sorted(rejected_records, key=lambda record: record[0]):
+                errors_file.write(dumps({'line': line_number, 'error': error, 'record': raw_record},
+                                        ensure_ascii=False) + '\n')
+            imported += len(accepted)
+            rejected += len(rejected_records)
+    if not rejected:
+        errors_path.unlink()
+        return imported, rejected, None
+    return imported, rejected, errors_path
+
+
+def escape_vcard(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace(',', '\\,').replace(';', '\\;')
+
+
+def contact_to_vcard(contact: dict) -> str:
+    lines = ['BEGIN:VCARD', 'VERSION:3.0', f"FN:{escape_vcard(contact['name'])}",
+             f"N:{escape_vcard(contact['name'])};;;;"]
+    lines += [f'TEL:{phone}' for phone in contact['phones']]
+    lines += [f'ADR:;;{escape_vcard(address)};;;;' for address in contact['addresses']]
+    if contact['birthday']:
+        day, month, year = contact['birthday'].split('.')
+        lines.append(f'BDAY:{year}-{int(month):02d}-{int(day):02d}')
+    if contact['email']:
+        lines.append(f"EMAIL:{contact['email']}")
+    lines += [f"NOTE;X-TAGS={quote_parameter(','.join(note['tags']))}:{escape_vcard(note['note'])}"
+              for note in contact['notes']]
+    tags = list(dict.fromkeys(tag for note in contact['notes'] for tag in note['tags']))
+    if tags:
+        lines.append(f"CATEGORIES:{','.join(escape_vcard(tag) for tag in tags)}")
+    lines.append('END:VCARD')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def write_contacts(export_path: Path, contacts: Iterable[dict]) -> Tuple[int, int]:
+    """Amounts of the exported contacts and of the skipped ones: a csv file can't keep the contacts with
+    its separators in the values, it couldn't be imported again"""
+    export_format = file_format(export_path)
+    exported, skipped = 0, 0
+    with open(export_path, 'w', encoding=CONTACTS_FILE_ENCODING, newline='') as export_file:
+        if export_format == CSV_FORMAT:
+            contacts_writer = DictWriter(export_file, FIELD_NAMES)
+            contacts_writer.writeheader()
+        for contact in contacts:
+            if export_format == CSV_FORMAT:
+                if has_separators(contact, CSV_VALUE_SEPARATORS):
+                    skipped += 1
+                    continue
+                contacts_writer.writerow(contact_to_row(contact))
+            elif export_format == JSONL_FORMAT:
+                export_file.write(dumps(contact, ensure_ascii=False) + '\n')
+            else:
+                export_file.write(contact_to_vcard(contact))
+            exported += 1
+    return exported, skipped
+
+
+def export_contacts(export_path: Path, contacts_book: AddressBook) -> Tuple[int, int]:
+    """Streams all contacts of the book to the file, the stored ones are not taken into memory.
+    Returns the amounts of the exported and of the skipped contacts"""
+    export_path = Path(export_path)
+    file_format(export_path)
+    if not export_path.parent.is_dir():
+        raise bot_exceptions.InvalidFilePathError
+    return write_contacts(export_path, contacts_book.contacts())
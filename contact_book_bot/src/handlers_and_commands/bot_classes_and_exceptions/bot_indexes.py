@@ -0,0 +1,547 @@
+import re
+from array import array
+from bisect import bisect_left
+from calendar import isleap
+from contextlib import nullcontext
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from heapq import nlargest
+from itertools import islice
+from math import ceil, log
+from typing import Any, Collection, ContextManager, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# slots of the birthday calendar are the days of a leap year, so 29 February has its own slot
+BIRTHDAY_SLOTS = 366
+MONTH_FIRST_SLOTS = (0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335)
+FEBRUARY_29_SLOT = 59
+TOKEN_PATTERN = re.compile(r'\w+')
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# words found by a prefix or by a typo count less than the word itself
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.5
+# words of the index, that one query word may expand to by its prefix
+MAX_PREFIX_EXPANSIONS = 50
+# shorter words are not corrected, one typo makes them a different word
+FUZZY_MIN_LENGTH = 4
+# share of the trigrams (Dice coefficient), that a suggestion must have in common with the mistyped string
+SUGGESTION_SIMILARITY = 0.5
+# candidates sharing the most rare trigrams with the mistyped string, that are compared with it
+COMPARED_CANDIDATES = 5000
+# trigrams of more than this share of the values (like 'con' of a book full of 'Contact ...') do not tell
+# the values apart, their postings are not read while there are rarer trigrams
+COMMON_GRAM_SHARE = 0.05
+
+
+class SubstringIndex:
+    """N-gram index of string values, that answers 'which keys contain this substring' without full scan.
+    Only the grams of the full size are kept, a value shorter than them is a gram itself. A shorter string
+    is found among the grams, there are much less of them than of the values"""
+
+    def __init__(self, gram_size: int = 3) -> None:
+        self.gram_size = gram_size
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._values: Dict[str, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _make_grams(self, values: Iterable[str]) -> Set[str]:
+        grams = set()
+        for value in values:
+            if len(value) < self.gram_size:
+                if value:
+                    grams.add(value)
+                continue
+            for start in range(len(value) - self.gram_size + 1):
+                grams.add(value[start:start + self.gram_size])
+        return grams
+
+    def update(self, key: str, values: Iterable[str]) -> None:
+        new_values = tuple(values)
+        old_values = self._values.pop(key, ())
+        new_grams = self._make_grams(new_values)
+        old_grams = self._make_grams(old_values)
+        for gram in old_grams - new_grams:
+            postings = self._postings[gram]
+            postings.discard(key)
+            if not postings:
+                del self._postings[gram]
+        for gram in new_grams - old_grams:
+            self._postings[gram].add(key)
+        if new_values:
+            self._values[key] = new_values
+
+    def remove(self, key: str) -> None:
+        self.update(key, ())
+
+    def search(self, sought_string: str, lock: ContextManager = nullcontext()) -> Set[str]:
+        """Keys with a value containing the string. The postings are read under the lock,
+        the candidates are checked out of it"""
+        grams = {sought_string[start:start + self.gram_size]
+                 for start in range(len(sought_string) - self.gram_size + 1)}
+        with lock:
+            if not sought_string:
+                return set(self._values)
+            if len(sought_string) == self.gram_size:
+                return set(self._postings.get(sought_string, ()))
+            if len(sought_string) < self.gram_size:
+                # every occurrence of the string is inside a gram of the value
+                found = set()
+                for gram, postings in self._postings.items():
+                    if sought_string in gram:
+                        found.update(postings)
+                return found
+            candidates = None
+            for gram in sorted(grams, key=lambda this_gram: len(self._postings.get(this_gram, ()))):
+                postings = self._postings.get(gram)
+                if not postings:
+                    return set()
+                candidates = set(postings) if candidates is None else candidates & postings
+                if not candidates:
+                    return set()
+        return {key for key in candidates
+                if any(sought_string in value for value in self._values.get(key, ()))}
+
+
+class ExactIndex:
+    """Hash index of whole values: value -> keys having it, values of more than one key are tracked"""
+
+    def __init__(self) -> None:
+        self._keys: Dict[str, Set[str]] = {}
+        self._values: Dict[str, Tuple[str, ...]] = {}
+        self._duplicated: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def update(self, key: str, values: Iterable[str]) -> None:
+        for value in self._values.pop(key, ()):
+            keys = self._keys[value]
+            keys.discard(key)
+            if len(keys) < 2:
+                self._duplicated.discard(value)
+            if not keys:
+                del self._keys[value]
+        new_values = tuple(dict.fromkeys(values))
+        for value in new_values:
+            keys = self._keys.setdefault(value, set())
+            keys.add(key)
+            if len(keys) > 1:
+                self._duplicated.add(value)
+        if new_values:
+            self._values[key] = new_values
+
+    def remove(self, key: str) -> None:
+        self.update(key, ())
+
+    def keys_of(self, value: str) -> Set[str]:
+        return set(self._keys.get(value, ()))
+
+    def duplicated(self) -> List[str]:
+        return sorted(self._duplicated)
+
+
+class TagIndex:
+    """Inverted index of the notes tags, tag -> notes having it, with the key (contact name) of every note"""
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Dict[Any, str]] = defaultdict(dict)
+        self._notes: Dict[str, Tuple[Tuple[Any, Tuple[str, ...]], ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def tags(self) -> List[str]:
+        return sorted(self._postings)
+
+    def update(self, key: str, tagged_notes: Iterable[Tuple[Any, Iterable[str]]]) -> None:
+        """Replaces the (note, tags) pairs of the key"""
+        for note, tags in self._notes.pop(key, ()):
+            for tag in tags:
+                postings = self._postings[tag]
+                postings.pop(note, None)
+                if not postings:
+                    del self._postings[tag]
+        new_notes = tuple((note, tuple(dict.fromkeys(tags))) for note, tags in tagged_notes if tags)
+        for note, tags in new_notes:
+            for tag in tags:
+                self._postings[tag][note] = key
+        if new_notes:
+            self._notes[key] = new_notes
+
+    def remove(self, key: str) -> None:
+        self.update(key, ())
+
+    def search(self, tag_groups: Iterable[Iterable[str]]) -> List[Tuple[str, Any]]:
+        """(key, note) pairs of the notes having all tags of any group, ordered by key.
+        Every group walks only its rarest tag, so the search costs about as much as its result"""
+        found_notes: Dict[Any, str] = {}
+        for group in tag_groups:
+            postings = sorted((self._postings.get(tag, {}) for tag in set(group)), key=len)
+            if not postings:
+                continue
+            rarest, others = postings[0], postings[1:]
+            for note, key in rarest.items():
+                if all(note in other for other in others):
+                    found_notes[note] = key
+        return sorted(((key, note) for note, key in found_notes.items()), key=lambda found: found[0])
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def single_deletes(word: str) -> Set[str]:
+    return {word[:position] + word[position + 1:] for position in range(len(word))}
+
+
+def within_one_edit(word: str, other: str) -> bool:
+    """One insertion, deletion or substitution turns the word into the other one"""
+    if abs(len(word) - len(other)) > 1:
+        return False
+    if len(word) > len(other):
+        word, other = other, word
+    position = 0
+    while position < len(word) and word[position] == other[position]:
+        position += 1
+    if len(word) == len(other):
+        return word[position + 1:] == other[position + 1:]
+    return word[position:] == other[position + 1:]
+
+
+class NoteSearchIndex:
+    """Full text index of the notes: word -> notes with the word frequencies, results are ranked by BM25.
+    Query words also match the words they are prefixes of and the words one typo away"""
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Dict[Any, int]] = {}
+        self._lengths: Dict[Any, int] = {}
+        self._total_length = 0
+        self._keys: Dict[Any, str] = {}
+        self._notes: Dict[str, Dict[Any, str]] = {}
+        # built by the first prefix or fuzzy lookup, the prefix list is rebuilt after the words change
+        self._sorted_words: Optional[List[str]] = None
+        self._deletes: Optional[Dict[str, Set[str]]] = None
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def update(self, key: str, notes: Iterable[Tuple[Any, str]]) -> None:
+        """Replaces the (note, text) pairs of the key, only added, deleted or changed notes are reindexed"""
+        old_notes = self._notes.pop(key, {})
+        new_notes = dict(notes)
+        for note, text in old_notes.items():
+            if new_notes.get(note) != text:
+                self._remove_note(note, text)
+        for note, text in new_notes.items():
+            if old_notes.get(note) != text:
+                self._add_note(key, note, text)
+        if new_notes:
+            self._notes[key] = new_notes
+
+    def remove(self, key: str) -> None:
+        self.update(key, ())
+
+    def _add_note(self, key: str, note: Any, text: str) -> None:
+        words = tokenize(text)
+        for word, frequency in Counter(words).items():
+            if word not in self._postings:
+                self._postings[word] = {}
+                self._word_added(word)
+            self._postings[word][note] = frequency
+        self._lengths[note] = len(words)
+        self._total_length += len(words)
+        self._keys[note] = key
+
+    def _remove_note(self, note: Any, text: str) -> None:
+        for word in set(tokenize(text)):
+            postings = self._postings[word]
+            postings.pop(note, None)
+            if not postings:
+                del self._postings[word]
+                self._word_removed(word)
+        self._total_length -= self._lengths.pop(note)
+        del self._keys[note]
+
+    def _word_added(self, word: str) -> None:
+        self._sorted_words = None
+        if self._deletes is not None and len(word) >= FUZZY_MIN_LENGTH - 1:
+            for variant in single_deletes(word) | {word}:
+                self._deletes.setdefault(variant, set()).add(word)
+
+    def _word_removed(self, word: str) -> None:
+        self._sorted_words = None
+        if self._deletes is not None and len(word) >= FUZZY_MIN_LENGTH - 1:
+            for variant in single_deletes(word) | {word}:
+                words = self._deletes[variant]
+                words.discard(word)
+                if not words:
+                    del self._deletes[variant]
+
+    def _words_with_prefix(self, prefix: str) -> Iterator[str]:
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self._postings)
+        for word in islice(self._sorted_words, bisect_left(self._sorted_words, prefix), None):
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def _words_with_typo(self, word: str) -> Set[str]:
+        if self._deletes is None:
+            self._deletes = {}
+            for indexed_word in self._postings:
+                if len(indexed_word) >= FUZZY_MIN_LENGTH - 1:
+                    for variant in single_deletes(indexed_word) | {indexed_word}:
+                        self._deletes.setdefault(variant, set()).add(indexed_word)
+        candidates = set()
+        for variant in single_deletes(word) | {word}:
+            candidates |= self._deletes.get(variant, set())
+        return {candidate for candidate in candidates if candidate != word and within_one_edit(word, candidate)}
+
+    def _expand(self, word: str) -> Dict[str, float]:
+        """Words of the index the query word matches, with their weights"""
+        expanded = {}
+        if len(word) >= FUZZY_MIN_LENGTH:
+            expanded.update((typo_word, FUZZY_WEIGHT) for typo_word in self._words_with_typo(word))
+        expanded.update((longer_word, PREFIX_WEIGHT)
+                        for longer_word in islice(self._words_with_prefix(word), MAX_PREFIX_EXPANSIONS + 1))
+        if word in self._postings:
+            expanded[word] = 1.0
+        return expanded
+
+    def search(self, query: str, limit: int, lock: ContextManager = nullcontext()) -> List[Tuple[float, str, Any]]:
+        """(score, key, note) of the best matching notes, the best first.
+        The postings of the query words are copied under the lock, the notes are scored out of it"""
+        with lock:
+            if not self._lengths:
+                return []
+            notes_amount = len(self._lengths)
+            average_length = self._total_length / notes_amount or 1
+            # query word -> (weight, postings) of the words it expanded to
+            expansions = [[(weight, dict(self._postings[matched_word]))
+                           for matched_word, weight in self._expand(word).items()]
+                          for word in dict.fromkeys(tokenize(query))]
+        scores: Dict[Any, float] = defaultdict(float)
+        for expanded in expansions:
+            # a note scores by the best of the words the query word expanded to, not by all of them
+            word_scores: Dict[Any, float] = {}
+            for weight, postings in expanded:
+                idf = log(1 + (notes_amount - len(postings) + 0.5) / (len(postings) + 0.5))
+                for note, frequency in postings.items():
+                    # the note is removed, after its postings were copied
+                    length = self._lengths.get(note)
+                    if length is None:
+                        continue
+                    length_norm = 1 - BM25_B + BM25_B * length / average_length
+                    score = weight * idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                    if score > word_scores.get(note, 0):
+                        word_scores[note] = score
+            for note, score in word_scores.items():
+                scores[note] += score
+        best_notes = nlargest(limit, scores.items(), key=lambda scored: scored[1])
+        keys = ((score, self._keys.get(note), note) for note, score in best_notes)
+        return [(score, key, note) for score, key, note in keys if key is not None]
+
+
+def padded_grams(value: str, gram_size: int = 3) -> Set[str]:
+    """Grams of the casefolded value, padded so the first letters weigh more than the middle ones"""
+    padded = ' ' * (gram_size - 1) + value.casefold() + ' '
+    return {padded[start:start + gram_size] for start in range(len(padded) - gram_size + 1)}
+
+
+def grams_similarity(grams: Set[str], other_grams: Set[str]) -> float:
+    """Dice coefficient of the grams sets"""
+    if not grams and not other_grams:
+        return 1.0
+    return 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+
+
+class FuzzyIndex:
+    """Trigram index of strings for 'did you mean' suggestions.
+    Postings are compact arrays of value ids, a removed value leaves its id there and the search skips it"""
+
+    def __init__(self, gram_size: int = 3) -> None:
+        self.gram_size = gram_size
+        self._postings: Dict[str, array] = {}
+        self._values: List[Optional[str]] = []
+        self._ids: Dict[str, int] = {}
+        # values added more than once, note texts may repeat
+        self._extra_references: Dict[str, int] = {}
+        self._key_values: Dict[str, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._ids
+
+    def _make_grams(self, value: str) -> Set[str]:
+        return padded_grams(value, self.gram_size)
+
+    def add(self, value: str) -> None:
+        if value in self._ids:
+            self._extra_references[value] = self._extra_references.get(value, 0) + 1
+            return None
+        value_id = len(self._values)
+        self._values.append(value)
+        self._ids[value] = value_id
+        for gram in self._make_grams(value):
+            postings = self._postings.get(gram)
+            if postings is None:
+                self._postings[gram] = array('I', (value_id,))
+            else:
+                postings.append(value_id)
+
+    def discard(self, value: str) -> None:
+        extra_references = self._extra_references.get(value)
+        if extra_references:
+            if extra_references == 1:
+                del self._extra_references[value]
+            else:
+                self._extra_references[value] = extra_references - 1
+            return None
+        value_id = self._ids.pop(value, None)
+        if value_id is not None:
+            self._values[value_id] = None
+            # ids of the removed values are dropped from the postings once they are the majority
+            if len(self._values) > 2 * len(self._ids) + 1000:
+                self._compact()
+
+    def _compact(self) -> None:
+        values = [value for value in self._values if value is not None]
+        self._postings, self._values, self._ids = {}, [], {}
+        extra_references = self._extra_references
+        for value in values:
+            self.add(value)
+        self._extra_references = extra_references
+
+    def update(self, key: str, values: Iterable[str]) -> None:
+        """Replaces the values of the key"""
+        old_values = self._key_values.pop(key, ())
+        new_values = tuple(values)
+        for value in new_values:
+            self.add(value)
+        for value in old_values:
+            self.discard(value)
+        if new_values:
+            self._key_values[key] = new_values
+
+    def remove(self, key: str) -> None:
+        self.update(key, ())
+
+    def similar(
+            self,
+            sought_string: str,
+            limit: int = 3,
+            cutoff: float = SUGGESTION_SIMILARITY,
+            among: Optional[Collection[str]] = None,
+    ) -> List[str]:
+        """Values most similar to the string, only the ones of among if it is given.
+        A value with enough trigrams in common must have one of the rarest of them, so only their postings
+        are read (except the too common ones) and only the values found there most often are compared
+        with the string"""
+        sought_grams = self._make_grams(sought_string)
+        needed_grams = max(1, ceil(cutoff * len(sought_grams) / (2 - cutoff)))
+        rare_grams = sorted(sought_grams, key=lambda gram: len(self._postings.get(gram, ())))
+        probed_grams = rare_grams[:len(sought_grams) - needed_grams + 1]
+        common_postings = max(1000, int(len(self._ids) * COMMON_GRAM_SHARE))
+        probed_grams = [gram for gram in probed_grams
+                        if len(self._postings.get(gram, ())) <= common_postings] or probed_grams[:1]
+        found_ids = Counter()
+        for gram in probed_grams:
+            found_ids.update(self._postings.get(gram, ()))
+        if among is not None:
+            candidates = [self._values[value_id] for value_id in found_ids if self._values[value_id] in among]
+        else:
+            candidates = [self._values[value_id] for value_id, _ in found_ids.most_common(COMPARED_CANDIDATES)]
+        scored_values = []
+        for value in candidates:
+            if value is None:
+                continue
+            similarity = grams_similarity(self._make_grams(value), sought_grams)
+            if similarity >= cutoff:
+                scored_values.append((-similarity, abs(len(value) - len(sought_string)), value))
+        return [value for *_, value in sorted(scored_values)[:limit]]
+
+
+def birthday_slot(month: int, day: int) -> int:
+    return MONTH_FIRST_SLOTS[month - 1] + day - 1
+
+
+def celebration_date(year: int, month: int, day: int) -> date:
+    """29 February birthdays are celebrated on 28 February in non-leap years"""
+    if month == 2 and day == 29 and not isleap(year):
+        return date(year, 2, 28)
+    return date(year, month, day)
+
+
+def days_to_next_birthday(month: int, day: int, today: date) -> int:
+    next_birthday = celebration_date(today.year, month, day)
+    if next_birthday < today:
+        next_birthday = celebration_date(today.year + 1, month, day)
+    return (next_birthday - today).days
+
+
+def birthdays_calendar_days(first_day: int, last_day: int, today: Optional[date] = None) -> Set[Tuple[int, int]]:
+    """(month, day) pairs of birthdays, that are celebrated from first_day to last_day days from today"""
+    today = today or date.today()
+    calendar_days = set()
+    for days in range(max(first_day, 0), min(last_day, BIRTHDAY_SLOTS - 1) + 1):
+        celebration_day = today + timedelta(days=days)
+        calendar_days.add((celebration_day.month, celebration_day.day))
+        if celebration_day.month == 2 and celebration_day.day == 28 and not isleap(celebration_day.year):
+            calendar_days.add((2, 29))
+    return calendar_days
+
+
+class BirthdayIndex:
+    """Calendar of the contacts birthdays, bucketed by the day of the year"""
+
+    def __init__(self) -> None:
+        self._slots: List[Set[str]] = [set() for _ in range(BIRTHDAY_SLOTS)]
+        self._birthdays: Dict[str, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._birthdays)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._birthdays
+
+    def update(self, key: str, month_and_day: Optional[Tuple[int, int]]) -> None:
+        old_birthday = self._birthdays.pop(key, None)
+        if old_birthday:
+            self._slots[birthday_slot(*old_birthday)].discard(key)
+        if month_and_day:
+            self._slots[birthday_slot(*month_and_day)].add(key)
+            self._birthdays[key] = month_and_day
+
+    def remove(self, key: str) -> None:
+        self.update(key, None)
+
+    def _celebrating_on(self, day: date) -> Iterable[str]:
+        yield from self._slots[birthday_slot(day.month, day.day)]
+        if day.month == 2 and day.day == 28 and not isleap(day.year):
+            yield from self._slots[FEBRUARY_29_SLOT]
+
+    def in_range(self, first_day: int, last_day: int, today: Optional[date] = None) -> List[Tuple[int, str]]:
+        """(days to birthday, key) pairs for birthdays from first_day to last_day days from today inclusive"""
+        today = today or date.today()
+        found_birthdays = []
+        for days in range(max(first_day, 0), min(last_day, BIRTHDAY_SLOTS - 1) + 1):
+            for key in self._celebrating_on(today + timedelta(days=days)):
+                if days_to_next_birthday(*self._birthdays[key], today) == days:
+                    found_birthdays.append((days, key))
+        return sorted(found_birthdays)
+
+    def upcoming(self, today: Optional[date] = None) -> Iterator[Tuple[int, str]]:
+        """(days to birthday, key) pairs from the nearest birthday on, produced day by day"""
+        today = today or date.today()
+        for days in range(BIRTHDAY_SLOTS):
+            for key in sorted(self._celebrating_on(today + timedelta(days=days))):
+                if days_to_next_birthday(*self._birthdays[key], today) == days:
+                    yield days, key
+
+    def in_days(self, days: int, today: Optional[date] = None) -> List[str]:
+        return [key for _, key in self.in_range(days, days, today)]
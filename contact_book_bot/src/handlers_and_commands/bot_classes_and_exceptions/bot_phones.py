@@ -0,0 +1,19 @@
+import re
+
+# spaces, brackets, dots, dashes and slashes people put into phone numbers
+PHONE_SEPARATORS_PATTERN = re.compile(r'[\s().\-/]')
+# E.164 numbers have up to 15 digits after the +
+MAX_PHONE_DIGITS = 15
+
+
+def compact_phone(phone: str) -> str:
+    return PHONE_SEPARATORS_PATTERN.sub('', phone)
+
+
+def normalize_phone(phone: str) -> str:
+    """Canonical form of the phone: + and digits, the 00 international prefix becomes +.
+    It is not checked here, Phone checks the numbers from the user"""
+    phone = compact_phone(phone)
+    if phone.startswith('00'):
+        phone = '+' + phone[2:]
+    return phone
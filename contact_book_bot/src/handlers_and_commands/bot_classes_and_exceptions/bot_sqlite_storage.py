@@ -0,0 +1,379 @@
+import sqlite3
+from datetime import datetime
+from json import dumps
+from os import replace
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .bot_storage import CONTACTS_FILE_ENCODING, ContactsStorage, CsvStorage, row_to_contact
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    birthday TEXT,
+    birth_month INTEGER,
+    birth_day INTEGER,
+    email TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_birthday ON contacts (birth_month, birth_day);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email);
+
+CREATE TABLE IF NOT EXISTS phones (
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_contact ON phones (contact_id);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+
+CREATE TABLE IF NOT EXISTS addresses (
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    address TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS addresses_contact ON addresses (contact_id);
+
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    note TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_contact ON notes (contact_id);
+
+CREATE TABLE IF NOT EXISTS tags (
+    note_id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_note ON tags (note_id);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+'''
+
+# names of the stored contacts, that the book took into memory or deleted there, for the queries, that page the names
+TAKEN_SCHEMA = 'CREATE TEMP TABLE IF NOT EXISTS taken (name TEXT PRIMARY KEY)'
+# trigram full text index over the searchable fields of every contact, its rowid is the contact id
+SEARCH_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_search USING fts5(terms, tokenize='trigram')"
+TRIGRAM_SIZE = 3
+# sqlite limits the amount of variables in one statement
+IDS_CHUNK_SIZE = 500
+
+
+class SqliteStorage(ContactsStorage):
+    """Contacts in a SQLite database, every change is written at once and queries run on its indexes"""
+    orders_names = True
+
+    def __init__(self, path: Path, import_from: Optional[Path] = None) -> None:
+        self.path = Path(path)
+        self.import_from = Path(import_from) if import_from else None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._full_text = False
+        # stored contacts, that the book took into memory or deleted there
+        self._taken: Set[str] = set()
+        # taken names, that are not in the taken table yet, they are written there by the next page of names
+        self._unwritten_taken: Set[str] = set()
+        self._taken_lock = Lock()
+        # rows of the csv file, that the first open couldn't import
+        self.rejected = 0
+
+    def open(self) -> None:
+        if not self.path.exists() and self.import_from and self.import_from.exists():
+            # the csv file is imported next to the database and swapped in at once, so a failed or interrupted
+            # import leaves no database and is repeated by the next run
+            importing_path = self.path.with_name(self.path.name + '.importing')
+            for stale_path in (importing_path, importing_path.with_name(importing_path.name + '-journal')):
+                stale_path.unlink(missing_ok=True)
+            self._connect(importing_path)
+            try:
+                self.rejected = self._import_csv()
+            finally:
+                self.close()
+            replace(importing_path, self.path)
+        self._connect(self.path)
+
+    def _connect(self, path: Path) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        # readers of their own connections see the database as it was, when they started, and don't stop the writes
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        # lower() of sqlite knows only ascii letters
+        self._connection.create_function('casefold', 1, str.casefold, deterministic=True)
+        self._connection.executescript(SCHEMA)
+        self._connection.execute(TAKEN_SCHEMA)
+        self._unwritten_taken = set(self._taken)
+        try:
+            self._connection.execute(SEARCH_SCHEMA)
+            self._full_text = True
+        except sqlite3.OperationalError:
+            self._full_text = False
+
+    def _import_csv(self) -> int:
+        """Inserts the contacts of the csv file in one transaction, the rows, that can't be inserted, go with
+        the reasons to the errors file next to it. Returns the amount of these rows"""
+        errors_path = self.import_from.with_name(self.import_from.name + '.errors.jsonl')
+        contacts_file = CsvStorage(self.import_from)
+        contacts_file.open()
+        rejected = 0
+        try:
+            with self._connection, open(errors_path, 'w', encoding=CONTACTS_FILE_ENCODING) as errors_file:
+                for row in contacts_file.pop_all_rows():
+                    try:
+                        self._insert(row_to_contact(row))
+                    except (ValueError, TypeError, AttributeError) as error:
+                        errors_file.write(dumps({'error': str(error), 'record': row}, ensure_ascii=False) + '\n')
+                        rejected += 1
+        finally:
+            contacts_file.close()
+        if not rejected:
+            errors_path.unlink()
+        return rejected
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _names_of(self, query: str, parameters: Iterable = ()) -> List[str]:
+        return [name for (name,) in self._connection.execute(query, tuple(parameters)) if name not in self._taken]
+
+    def __len__(self) -> int:
+        (stored,) = self._connection.execute('SELECT COUNT(*) FROM contacts').fetchone()
+        return stored - len(self._taken)
+
+    def __contains__(self, name: str) -> bool:
+        return name not in self._taken and self._contact_id(name) is not None
+
+    def _contact_id(self, name: str) -> Optional[int]:
+        found = self._connection.execute('SELECT id FROM contacts WHERE name = ?', (name,)).fetchone()
+        return found[0] if found else None
+
+    def names(self) -> List[str]:
+        return self._names_of('SELECT name FROM contacts ORDER BY id')
+
+    def _take(self, name: str) -> None:
+        with self._taken_lock:
+            self._taken.add(name)
+            self._unwritten_taken.add(name)
+
+    def _give_back(self, name: str) -> None:
+        """The contact is stored again, it is written in the open transaction"""
+        with self._taken_lock:
+            self._taken.discard(name)
+            self._unwritten_taken.discard(name)
+            self._connection.execute('DELETE FROM taken WHERE name = ?', (name,))
+
+    def names_page(self, offset: int, size: int, by_name: bool = False) -> List[str]:
+        with self._taken_lock:
+            with self._connection:
+                self._connection.executemany('INSERT OR IGNORE INTO taken VALUES (?)',
+                                             ((name,) for name in self._unwritten_taken))
+            self._unwritten_taken = set()
+        order = 'name' if by_name else 'id'
+        return [name for (name,) in self._connection.execute(
+            f'SELECT name FROM contacts WHERE name NOT IN (SELECT name FROM taken) ORDER BY {order} LIMIT ? OFFSET ?',
+            (size, offset))]
+
+    def _read_contacts(self, contact_ids: List[int], connection: Optional[sqlite3.Connection] = None) -> List[dict]:
+        connection = connection or self._connection
+        contacts: Dict[int, dict] = {}
+        for start in range(0, len(contact_ids), IDS_CHUNK_SIZE):
+            ids_chunk = contact_ids[start:start + IDS_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(ids_chunk))
+            for contact_id, name, birthday, email in connection.execute(
+                    f'SELECT id, name, birthday, email FROM contacts WHERE id IN ({placeholders})', ids_chunk):
+                contacts[contact_id] = {
+                    'name': name,
+                    'phones': [],
+                    'birthday': birthday,
+                    'addresses': [],
+                    'email': email,
+                    'notes': [],
+                }
+            for contact_id, phone in connection.execute(
+                    f'SELECT contact_id, phone FROM phones WHERE contact_id IN ({placeholders}) '
+                    f'ORDER BY contact_id, position', ids_chunk):
+                contacts[contact_id]['phones'].append(phone)
+            for contact_id, address in connection.execute(
+                    f'SELECT contact_id, address FROM addresses WHERE contact_id IN ({placeholders}) '
+                    f'ORDER BY contact_id, position', ids_chunk):
+                contacts[contact_id]['addresses'].append(address)
+            notes: Dict[int, dict] = {}
+            for note_id, contact_id, note in connection.execute(
+                    f'SELECT id, contact_id, note FROM notes WHERE contact_id IN ({placeholders}) '
+                    f'ORDER BY contact_id, position', ids_chunk):
+                notes[note_id] = {'note': note, 'tags': []}
+                contacts[contact_id]['notes'].append(notes[note_id])
+            for note_id, tag in connection.execute(
+                    f'SELECT tags.note_id, tags.tag FROM tags JOIN notes ON notes.id = tags.note_id '
+                    f'WHERE notes.contact_id IN ({placeholders}) ORDER BY tags.note_id, tags.position', ids_chunk):
+                notes[note_id]['tags'].append(tag)
+        return [contacts[contact_id] for contact_id in contact_ids if contact_id in contacts]
+
+    def contacts(self) -> Iterator[dict]:
+        # a connection of its own reads the contacts as they are now, while the book goes on changing them
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('BEGIN')
+        with self._taken_lock:
+            taken = set(self._taken)
+        contact_ids = [contact_id for contact_id, name
+                       in connection.execute('SELECT id, name FROM contacts ORDER BY id') if name not in taken]
+        return self._contacts_read(connection, contact_ids)
+
+    def _contacts_read(self, connection: sqlite3.Connection, contact_ids: List[int]) -> Iterator[dict]:
+        try:
+            for start in range(0, len(contact_ids), IDS_CHUNK_SIZE):
+                yield from self._read_contacts(contact_ids[start:start + IDS_CHUNK_SIZE], connection)
+        finally:
+            connection.close()
+
+    def pop_contact(self, name: str) -> Optional[dict]:
+        if name in self._taken:
+            return None
+        contact_id = self._contact_id(name)
+        if contact_id is None:
+            return None
+        self._take(name)
+        return self._read_contacts([contact_id])[0]
+
+    def pop_all(self) -> Iterator[dict]:
+        for contact in self.contacts():
+            self._take(contact['name'])
+            yield contact
+
+    def forget(self, name: str) -> None:
+        if name not in self._taken and self._contact_id(name) is not None:
+            self._take(name)
+
+    def find_names(self, sought_string: str) -> List[str]:
+        if self._full_text and len(sought_string) >= TRIGRAM_SIZE:
+            phrase = '"' + sought_string.replace('"', '""') + '"'
+            return self._names_of(
+                'SELECT contacts.name FROM contacts_search JOIN contacts ON contacts.id = contacts_search.rowid '
+                'WHERE contacts_search MATCH ?', (phrase,))
+        return self._names_of(
+            'SELECT name FROM contacts WHERE instr(name, ?) OR instr(email, ?) '
+            'UNION SELECT contacts.name FROM phones JOIN contacts ON contacts.id = phones.contact_id '
+            'WHERE instr(phones.phone, ?) '
+            'UNION SELECT contacts.name FROM addresses JOIN contacts ON contacts.id = addresses.contact_id '
+            'WHERE instr(addresses.address, ?)', (sought_string,) * 4)
+
+    def birthdays_on(self, calendar_days: Set[Tuple[int, int]]) -> List[Tuple[str, Tuple[int, int]]]:
+        return [(name, (month, day)) for month, day in sorted(calendar_days)
+                for name in self._names_of('SELECT name FROM contacts WHERE birth_month = ? AND birth_day = ?',
+                                           (month, day))]
+
+    def birthdays(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        for name, birth_month, birth_day in self._connection.execute(
+                'SELECT name, birth_month, birth_day FROM contacts WHERE birth_month IS NOT NULL'):
+            if name not in self._taken:
+                yield name, (birth_month, birth_day)
+
+    def tag_names(self, tag: str) -> List[str]:
+        return self._names_of(
+            'SELECT DISTINCT contacts.name FROM tags JOIN notes ON notes.id = tags.note_id '
+            'JOIN contacts ON contacts.id = notes.contact_id WHERE tags.tag = ?', (tag,))
+
+    def tagged_notes(self, tags: Set[str]) -> List[Tuple[str, int, str, List[str]]]:
+        if not tags:
+            return []
+        tag_placeholders = ','.join('?' * len(tags))
+        found_notes = [found_note for found_note in self._connection.execute(
+            'SELECT notes.id, contacts.name, notes.position, notes.note FROM notes '
+            'JOIN contacts ON contacts.id = notes.contact_id WHERE notes.id IN '
+            f'(SELECT note_id FROM tags WHERE tag IN ({tag_placeholders}) GROUP BY note_id '
+            'HAVING COUNT(DISTINCT tag) = ?) ORDER BY contacts.name, notes.position', (*tags, len(tags)))
+            if found_note[1] not in self._taken]
+        # only the tags of the found notes are read
+        note_tags: Dict[int, List[str]] = {}
+        note_ids = [found_note[0] for found_note in found_notes]
+        for start in range(0, len(note_ids), IDS_CHUNK_SIZE):
+            ids_chunk = note_ids[start:start + IDS_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(ids_chunk))
+            for note_id, tag in self._connection.execute(
+                    f'SELECT note_id, tag FROM tags WHERE note_id IN ({placeholders}) ORDER BY note_id, position',
+                    ids_chunk):
+                note_tags.setdefault(note_id, []).append(tag)
+        return [(name, position, note, note_tags.get(note_id, [])) for note_id, name, position, note in found_notes]
+
+    def phone_names(self, phone: str) -> List[str]:
+        return self._names_of(
+            'SELECT DISTINCT contacts.name FROM phones JOIN contacts ON contacts.id = phones.contact_id '
+            'WHERE phones.phone = ?', (phone,))
+
+    def phones(self) -> Iterator[Tuple[str, str]]:
+        for name, phone in self._connection.execute(
+                'SELECT contacts.name, phones.phone FROM phones JOIN contacts ON contacts.id = phones.contact_id'):
+            if name not in self._taken:
+                yield name, phone
+
+    def notes(self) -> Iterator[Tuple[str, int, str]]:
+        for name, position, note in self._connection.execute(
+                'SELECT contacts.name, notes.position, notes.note FROM notes '
+                'JOIN contacts ON contacts.id = notes.contact_id ORDER BY notes.contact_id, notes.position'):
+            if name not in self._taken:
+                yield name, position, note
+
+    def _delete(self, name: str) -> None:
+        contact_id = self._contact_id(name)
+        if contact_id is not None:
+            if self._full_text:
+                self._connection.execute('DELETE FROM contacts_search WHERE rowid = ?', (contact_id,))
+            self._connection.execute('DELETE FROM contacts WHERE id = ?', (contact_id,))
+
+    def _insert(self, contact: dict) -> None:
+        birth_month, birth_day = None, None
+        if contact['birthday']:
+            birthday = datetime.strptime(contact['birthday'], '%d.%m.%Y')
+            birth_month, birth_day = birthday.month, birthday.day
+        contact_id = self._connection.execute(
+            'INSERT INTO contacts (name, birthday, birth_month, birth_day, email) VALUES (?, ?, ?, ?, ?)',
+            (contact['name'], contact['birthday'], birth_month, birth_day, contact['email'])).lastrowid
+        self._connection.executemany('INSERT INTO phones (contact_id, position, phone) VALUES (?, ?, ?)',
+                                     [(contact_id, position, phone)
+                                      for position, phone in enumerate(contact['phones'])])
+        self._connection.executemany('INSERT INTO addresses (contact_id, position, address) VALUES (?, ?, ?)',
+                                     [(contact_id, position, address)
+                                      for position, address in enumerate(contact['addresses'])])
+        for position, note in enumerate(contact['notes']):
+            note_id = self._connection.execute(
+                'INSERT INTO notes (contact_id, position, note) VALUES (?, ?, ?)',
+                (contact_id, position, note['note'])).lastrowid
+            self._connection.executemany('INSERT INTO tags (note_id, position, tag) VALUES (?, ?, ?)',
+                                         [(note_id, tag_position, tag)
+                                          for tag_position, tag in enumerate(note['tags'])])
+        if self._full_text:
+            terms = '\n'.join([contact['name'], *contact['phones'], contact['email'] or '', *contact['addresses']])
+            self._connection.execute('INSERT INTO contacts_search (rowid, terms) VALUES (?, ?)', (contact_id, terms))
+
+    def write_contact(self, contact: dict) -> None:
+        with self._connection:
+            self._delete(contact['name'])
+            self._insert(contact)
+        self._take(contact['name'])
+
+    def add_contacts(self, contacts: List[dict]) -> None:
+        with self._connection:
+            for contact in contacts:
+                self._delete(contact['name'])
+                self._insert(contact)
+                self._give_back(contact['name'])
+
+    def delete_contact(self, name: str) -> None:
+        with self._connection:
+            self._delete(name)
+        self._give_back(name)
+
+    def save(self, contacts: Iterable[dict]) -> None:
+        saved_names = set()
+        with self._connection:
+            for contact in contacts:
+                self._delete(contact['name'])
+                self._insert(contact)
+                saved_names.add(contact['name'])
+            for deleted_name in self._taken - saved_names:
+                self._delete(deleted_name)
+            with self._taken_lock:
+                self._connection.execute('DELETE FROM taken')
+                self._taken = saved_names
+                self._unwritten_taken = set(saved_names)
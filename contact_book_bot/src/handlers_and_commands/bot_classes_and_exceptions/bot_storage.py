@@ -0,0 +1,853 @@
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_right
+from csv import DictReader, DictWriter, reader, writer
+from io import StringIO
+from itertools import chain, islice
+from json import dumps, loads, JSONDecodeError
+from os import replace, SEEK_END
+from pathlib import Path
+from tempfile import TemporaryFile
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .bot_phones import normalize_phone
+
+FIELD_NAMES = ('name', 'numbers', 'birthday', 'addresses', 'email', 'notes')
+# the contacts file separates the values of a field by these, so the values can't contain them
+CSV_VALUE_SEPARATORS = ',|'
+CONTACTS_FILE_ENCODING = 'utf-8'
+# amount of journaled changes, after which they are folded into the contacts file in the background
+JOURNAL_FOLDING_SIZE = 1000
+
+
+class ContactsStorage(ABC):
+    """Where the contacts live between sessions.
+    Contacts are passed as plain dicts with name, phones, birthday, addresses, email and notes keys.
+    Storage answers only for the contacts, that the book hasn't taken into memory yet"""
+    # characters, that the storage can't keep in the values of the contacts
+    value_separators = ''
+    # the storage pages the names in order of names without sorting all of them
+    orders_names = False
+
+    @abstractmethod
+    def open(self) -> None:
+        """Prepares the storage, must be fast, so the bot is interactive at once"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Waits for the pending writes and releases the storage"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Amount of contacts, that are not taken into memory"""
+
+    @abstractmethod
+    def __contains__(self, name: str) -> bool:
+        """Is there such contact, that is not taken into memory"""
+
+    @abstractmethod
+    def names(self) -> List[str]:
+        """Names of the contacts, that are not taken into memory"""
+
+    @abstractmethod
+    def names_page(self, offset: int, size: int, by_name: bool = False) -> List[str]:
+        """Names from the offset in the order of names() or in order of names, without listing all of them"""
+
+    @abstractmethod
+    def pop_contact(self, name: str) -> Optional[dict]:
+        """Reads the contact and hands it over to the book"""
+
+    @abstractmethod
+    def pop_all(self) -> Iterator[dict]:
+        """Hands over all the contacts, that are not taken into memory yet"""
+
+    @abstractmethod
+    def forget(self, name: str) -> None:
+        """The book has its own version of the contact or has deleted it"""
+
+    @abstractmethod
+    def find_names(self, sought_string: str) -> List[str]:
+        """Names of the contacts, whose name, phones, email or addresses may contain the string"""
+
+    @abstractmethod
+    def birthdays_on(self, calendar_days: Set[Tuple[int, int]]) -> List[Tuple[str, Tuple[int, int]]]:
+        """(name, (month, day)) of the contacts, that have birthdays on one of the (month, day) pairs"""
+
+    @abstractmethod
+    def birthdays(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        """(name, (month, day)) of the contacts with birthdays, that are not taken into memory"""
+
+    @abstractmethod
+    def tag_names(self, tag: str) -> List[str]:
+        """Names of the contacts, that have notes with this tag"""
+
+    @abstractmethod
+    def tagged_notes(self, tags: Set[str]) -> List[Tuple[str, int, str, List[str]]]:
+        """(name, position, text, tags) of the notes having all the tags, ordered by the names and positions.
+        The contacts stay in the storage"""
+
+    @abstractmethod
+    def phone_names(self, phone: str) -> List[str]:
+        """Names of the contacts with the normalized phone"""
+
+    @abstractmethod
+    def phones(self) -> Iterator[Tuple[str, str]]:
+        """(name, normalized phone) of the contacts, that are not taken into memory"""
+
+    @abstractmethod
+    def notes(self) -> Iterator[Tuple[str, int, str]]:
+        """(name, position, text) of the notes of the stored contacts, in order of the contacts,
+        the text may be casefolded"""
+
+    @abstractmethod
+    def contacts(self) -> Iterator[dict]:
+        """Contacts, that are not taken into memory, when it is called, they stay in the storage.
+        They are read later, while the book may be used by other threads"""
+
+    @abstractmethod
+    def write_contact(self, contact: dict) -> None:
+        """Persists the current state of the contact"""
+
+    @abstractmethod
+    def add_contacts(self, contacts: List[dict]) -> None:
+        """Persists the batch of new contacts, that the book hasn't taken into memory"""
+
+    @abstractmethod
+    def delete_contact(self, name: str) -> None:
+        """Persists the deletion of the contact"""
+
+    @abstractmethod
+    def save(self, contacts: Iterable[dict]) -> None:
+        """Persists the whole book, that consists of the given contacts and the contacts not taken into memory"""
+
+
+def row_to_contact(row: dict) -> dict:
+    contact = {
+        'name': row['name'],
+        'phones': [],
+        'birthday': None,
+        'addresses': [],
+        'email': None,
+        'notes': [],
+    }
+    if row['numbers'] != 'None':
+        contact['phones'] = [normalize_phone(phone) for phone in row['numbers'].split(',')]
+    if row['birthday'] != 'None':
+        contact['birthday'] = row['birthday']
+    if row['addresses'] != 'None':
+        contact['addresses'] = row['addresses'].split(',')
+    if row['email'] != 'None':
+        contact['email'] = row['email']
+    if row['notes'] != 'None':
+        raw_notes = (row['notes'].split(','))[:-1]
+        for raw_note in raw_notes:
+            prepared_note, raw_tags = raw_note.split('|tags:|')
+            prepared_tags = raw_tags.split('/|')
+            contact['notes'].append({'note': prepared_note, 'tags': prepared_tags})
+    return contact
+
+
+def contact_values(contact: dict) -> Iterator[str]:
+    """All string values of the contact, the ones of its notes too"""
+    yield contact['name']
+    yield from contact['phones']
+    yield from contact['addresses']
+    if contact['email']:
+        yield contact['email']
+    for note in contact['notes']:
+        yield note['note']
+        yield from note['tags']
+
+
+def has_separators(contact: dict, separators: str) -> bool:
+    return any(separator in value for value in contact_values(contact) for separator in separators)
+
+
+def contact_to_row(contact: dict) -> dict:
+    contact_phones = 'None'
+    if len(contact['phones']) > 0:
+        contact_phones = ','.join(contact['phones'])
+    contact_addresses = 'None'
+    if len(contact['addresses']) > 0:
+        contact_addresses = ','.join(contact['addresses'])
+    notes = ''
+    if len(contact['notes']) != 0:
+        for this_note in contact['notes']:
+            notes += f"{this_note['note']}" \
+                     f"|tags:|" \
+                     f"{'/|'.join(this_note['tags'])},"
+    else:
+        notes = 'None'
+    return {'name': contact['name'],
+            'numbers': contact_phones,
+            'birthday': contact['birthday'] or 'None',
+            'addresses': contact_addresses,
+            'email': contact['email'] or 'None',
+            'notes': notes,
+            }
+
+
+# rows of the contacts file parsed at once by the background scan
+SCAN_BATCH_SIZE = 1024
+# texts of the rows index joined into one string, a substring of them is found by str.find at C speed
+TEXT_BLOCK_SIZE = 4096
+TEXTS_SEPARATOR = '\x00'
+VALUES_SEPARATOR = '\x1f'
+
+
+class TextColumn:
+    """Texts of the index entries, joined into blocks, so the entries containing a string are found
+    by str.find over the blocks instead of a loop over the texts"""
+
+    def __init__(self) -> None:
+        self._blocks: List[str] = []
+        self._starts: List[array] = []
+        self._pending: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._blocks) * TEXT_BLOCK_SIZE + len(self._pending)
+
+    def append(self, text: str) -> None:
+        self._pending.append(text.replace(TEXTS_SEPARATOR, ''))
+        if len(self._pending) == TEXT_BLOCK_SIZE:
+            starts = array('l')
+            position = 0
+            for pending_text in self._pending:
+                starts.append(position)
+                position += len(pending_text) + 1
+            self._blocks.append(TEXTS_SEPARATOR.join(self._pending))
+            self._starts.append(starts)
+            self._pending = []
+
+    def __getitem__(self, number: int) -> str:
+        block_number, text_number = divmod(number, TEXT_BLOCK_SIZE)
+        if block_number == len(self._blocks):
+            return self._pending[text_number]
+        block, starts = self._blocks[block_number], self._starts[block_number]
+        end = starts[text_number + 1] - 1 if text_number + 1 < TEXT_BLOCK_SIZE else len(block)
+        return block[starts[text_number]:end]
+
+    def find(self, sought_string: str) -> Iterator[int]:
+        """Numbers of the texts containing the string, in order and every one once"""
+        if TEXTS_SEPARATOR in sought_string:
+            return None
+        for block_number, (block, starts) in enumerate(zip(self._blocks, self._starts)):
+            position = block.find(sought_string)
+            while position != -1:
+                text_number = bisect_right(starts, position) - 1
+                yield block_number * TEXT_BLOCK_SIZE + text_number
+                if text_number + 1 == TEXT_BLOCK_SIZE:
+                    break
+                position = block.find(sought_string, starts[text_number + 1])
+        first_pending = len(self._blocks) * TEXT_BLOCK_SIZE
+        for text_number, text in enumerate(self._pending):
+            if sought_string in text:
+                yield first_pending + text_number
+
+
+def joined_values(values: Iterable[str]) -> str:
+    """Values joined so that every one of them is found exactly by the separators around it"""
+    values = [value.replace(VALUES_SEPARATOR, '') for value in values]
+    return VALUES_SEPARATOR + VALUES_SEPARATOR.join(values) + VALUES_SEPARATOR if values else ''
+
+
+def exact_value(value: str) -> str:
+    return VALUES_SEPARATOR + value + VALUES_SEPARATOR
+
+
+class RowsIndex:
+    """Compact index of the stored rows: their searchable values, phones, tags, notes and birthdays.
+    Entries are only appended, an entry is valid while the name of its row still has the same row id,
+    so a row taken by the book or replaced by a newer one is simply skipped"""
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.row_ids = array('q')
+        # month * 32 + day, 0 without a birthday
+        self.birthdays = array('H')
+        self.values = TextColumn()
+        self.phones = TextColumn()
+        self.tags = TextColumn()
+        self.notes = TextColumn()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, row_id: int, row: dict) -> None:
+        try:
+            contact = row_to_contact(row)
+        except ValueError:
+            # a broken row is found by its name only, reading it fails as it always did
+            contact = {'name': row['name'], 'phones': [], 'birthday': None, 'addresses': [], 'email': None,
+                       'notes': []}
+        self.names.append(contact['name'])
+        self.row_ids.append(row_id)
+        month_and_day = birthday_month_and_day(contact['birthday'])
+        self.birthdays.append(month_and_day[0] * 32 + month_and_day[1] if month_and_day else 0)
+        self.values.append(joined_values([contact['name'], *contact['phones'], contact['email'] or '',
+                                          *contact['addresses']]))
+        self.phones.append(joined_values(contact['phones']))
+        self.tags.append(joined_values(tag for note in contact['notes'] for tag in note['tags']))
+        self.notes.append(VALUES_SEPARATOR.join(note['note'].casefold() for note in contact['notes']))
+
+
+def birthday_month_and_day(birthday: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(month, day) of the stored dd.mm.yyyy birthday, None for no or a broken birthday"""
+    try:
+        day, month = birthday.split('.')[:2]
+        return int(month), int(day)
+    except (AttributeError, ValueError):
+        return None
+
+
+class ContactsFile:
+    """Offset table over the rows of the contacts csv file, rows are read only when they are needed.
+    The background scan also builds the compact index of the rows, so the queries never parse the file.
+
+    The rows changed since the file was written, like the imported ones, are written to a temporary file
+    next to it and are read from there the same way, so they don't have to fit in memory either"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # row id of every stored contact: the offset of its row in the file, or a negative id of a changed row
+        self._row_ids: Dict[str, int] = {}
+        # id of a changed row -> offset of the row in the file of the changed rows
+        self._changed_offsets: Dict[int, int] = {}
+        self._last_changed_id = 0
+        self._index = RowsIndex()
+        self._header: List[str] = []
+        self._rows_start = 0
+        self._file = None
+        self._changes_file = None
+        # the rows are read by seeking the files, every read or write of them is done under this lock
+        self._file_lock = Lock()
+        self._scanned = Event()
+
+    def open(self, operations: Iterable[dict] = ()) -> None:
+        """Opens the file and starts building the offset table in the background, returns immediately.
+        Journaled operations are put over the file rows, when the table is ready"""
+        self._file = open(self.path, 'rb')
+        Thread(target=self._scan, args=(operations,), daemon=True).start()
+
+    def close(self) -> None:
+        self._scanned.wait()
+        self._row_ids.clear()
+        self._changed_offsets.clear()
+        self._index = RowsIndex()
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._close_changes_file()
+
+    def _close_changes_file(self) -> None:
+        if self._changes_file:
+            self._changes_file.close()
+            self._changes_file = None
+
+    def _scan(self, operations: Iterable[dict]) -> None:
+        try:
+            with open(self.path, 'rb') as contacts_file:
+                self._header = self._parse_line(contacts_file.readline())
+                self._rows_start = contacts_file.tell()
+                lines = self._iter_lines(contacts_file)
+                while True:
+                    batch = list(islice(lines, SCAN_BATCH_SIZE))
+                    if not batch:
+                        break
+                    # one reader parses the whole batch, quoted values may span lines inside one item
+                    rows = reader((line.decode(CONTACTS_FILE_ENCODING) for _, _, line in batch))
+                    for (name, offset, _), values in zip(batch, rows):
+                        self._row_ids[name] = offset
+                        self._index.add(offset, dict(zip(self._header, values)))
+            operations = iter(operations)
+            while True:
+                # the journal of a big import may not fit in memory either
+                batch = list(islice(operations, SCAN_BATCH_SIZE))
+                if not batch:
+                    break
+                self._apply(batch)
+        finally:
+            self._scanned.set()
+
+    def _iter_lines(self, contacts_file) -> Iterator[tuple]:
+        while True:
+            offset = contacts_file.tell()
+            line = self._read_csv_line(contacts_file)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            if line.startswith(b'"'):
+                name = self._parse_line(line)[0]
+            else:
+                name = line.split(b',', 1)[0].decode(CONTACTS_FILE_ENCODING)
+            yield name, offset, line
+
+    @staticmethod
+    def _read_csv_line(contacts_file) -> bytes:
+        line = contacts_file.readline()
+        while line.count(b'"') % 2:
+            next_line = contacts_file.readline()
+            if not next_line:
+                break
+            line += next_line
+        return line
+
+    @staticmethod
+    def _parse_line(line: bytes) -> List[str]:
+        return next(reader(StringIO(line.decode(CONTACTS_FILE_ENCODING), newline='')), [])
+
+    def _line_to_row(self, line: bytes, header: Iterable[str]) -> dict:
+        return dict(zip(header, self._parse_line(line)))
+
+    def __len__(self) -> int:
+        self._scanned.wait()
+        return len(self._row_ids)
+
+    def __contains__(self, name: str) -> bool:
+        self._scanned.wait()
+        return name in self._row_ids
+
+    def names(self) -> List[str]:
+        self._scanned.wait()
+        return list(self._row_ids)
+
+    def names_page(self, offset: int, size: int) -> List[str]:
+        self._scanned.wait()
+        return list(islice(self._row_ids, offset, offset + size))
+
+    def _write_changed_rows(self, rows: List[dict]) -> List[int]:
+        """Appends the rows to the file of the changed rows in one write, returns their offsets"""
+        lines = []
+        for row in rows:
+            line = StringIO()
+            writer(line).writerow(row[field_name] for field_name in FIELD_NAMES)
+            lines.append(line.getvalue().encode(CONTACTS_FILE_ENCODING))
+        with self._file_lock:
+            if self._changes_file is None:
+                self._changes_file = TemporaryFile(dir=self.path.parent, prefix=self.path.name + '.')
+            offset = self._changes_file.seek(0, SEEK_END)
+            self._changes_file.write(b''.join(lines))
+        offsets = []
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line)
+        return offsets
+
+    def _apply(self, operations: List[dict]) -> None:
+        upserts = [operation['contact'] for operation in operations if operation['op'] == 'upsert']
+        rows = [contact_to_row(contact) for contact in upserts]
+        offsets = iter(self._write_changed_rows(rows)) if rows else iter(())
+        rows = iter(rows)
+        for operation in operations:
+            if operation['op'] == 'upsert':
+                row = next(rows)
+                self._changed_offsets.pop(self._row_ids.get(row['name']), None)
+                self._last_changed_id -= 1
+                self._row_ids[row['name']] = self._last_changed_id
+                self._changed_offsets[self._last_changed_id] = next(offsets)
+                self._index.add(self._last_changed_id, row)
+            elif operation['op'] == 'delete':
+                self._changed_offsets.pop(self._row_ids.pop(operation['name'], None), None)
+
+    def add_rows(self, contacts: List[dict]) -> None:
+        self._scanned.wait()
+        self._apply([{'op': 'upsert', 'contact': contact} for contact in contacts])
+
+    def pop_row(self, name: str) -> Optional[dict]:
+        """Reads the row of the contact and forgets it, the contact is in memory from now on"""
+        self._scanned.wait()
+        row_id = self._row_ids.pop(name, None)
+        if row_id is None:
+            return None
+        row = self._read_row(row_id)
+        self._changed_offsets.pop(row_id, None)
+        return row
+
+    def read_row(self, name: str) -> Optional[dict]:
+        """Reads the row of the contact, that stays unread"""
+        self._scanned.wait()
+        row_id = self._row_ids.get(name)
+        return self._read_row(row_id) if row_id is not None else None
+
+    def _read_row(self, row_id: int) -> Optional[dict]:
+        if row_id < 0:
+            stored_file, offset, header = self._changes_file, self._changed_offsets.get(row_id), FIELD_NAMES
+            if offset is None:
+                return None
+        else:
+            stored_file, offset, header = self._file, row_id, self._header
+        with self._file_lock:
+            stored_file.seek(offset)
+            line = self._read_csv_line(stored_file)
+        return self._line_to_row(line, header)
+
+    def pop_all_rows(self) -> Iterator[dict]:
+        self._scanned.wait()
+        for row in self.unloaded_rows():
+            self._row_ids.pop(row['name'], None)
+            yield row
+        self._changed_offsets.clear()
+        self._index = RowsIndex()
+        with self._file_lock:
+            self._close_changes_file()
+
+    def forget(self, name: str) -> None:
+        self._scanned.wait()
+        self._changed_offsets.pop(self._row_ids.pop(name, None), None)
+
+    def unloaded_rows(self) -> Iterator[dict]:
+        """Rows of the contacts, that are not read, when it is called, in one sequential pass over the file.
+        The contacts read meanwhile are produced too"""
+        self._scanned.wait()
+        changed_offsets = set(self._changed_offsets.values())
+        file_offsets = {row_id for row_id in self._row_ids.values() if row_id >= 0}
+        return chain(self._rows_of(self._changes_file, 0, changed_offsets, FIELD_NAMES),
+                     self._rows_of(self._file, self._rows_start, file_offsets, self._header))
+
+    def _rows_of(self, stored_file, position: int, offsets: Set[int], header: Iterable[str]) -> Iterator[dict]:
+        while offsets:
+            # the file is read by batches, so the other threads reading their rows wait only for one batch
+            with self._file_lock:
+                stored_file.seek(position)
+                batch = list(islice(self._iter_lines(stored_file), SCAN_BATCH_SIZE))
+                position = stored_file.tell()
+            if not batch:
+                break
+            for _, offset, line in batch:
+                if offset in offsets:
+                    offsets.discard(offset)
+                    yield self._line_to_row(line, header)
+
+    def _valid_name(self, number: int) -> Optional[str]:
+        name = self._index.names[number]
+        return name if self._row_ids.get(name) == self._index.row_ids[number] else None
+
+    def _valid_names(self, numbers: Iterable[int]) -> List[str]:
+        self._scanned.wait()
+        return [name for name in map(self._valid_name, numbers) if name is not None]
+
+    def find_names(self, sought_string: str) -> List[str]:
+        """Names of not yet read contacts, whose name, phone, email or address contains the string"""
+        return self._valid_names(self._index.values.find(sought_string.replace(VALUES_SEPARATOR, '')))
+
+    def phone_names(self, phone: str) -> List[str]:
+        return self._valid_names(self._index.phones.find(exact_value(phone)))
+
+    def tag_names(self, tag: str) -> List[str]:
+        return self._valid_names(self._index.tags.find(exact_value(tag)))
+
+    def birthdays_on(self, calendar_days: Set[Tuple[int, int]]) -> List[Tuple[str, Tuple[int, int]]]:
+        self._scanned.wait()
+        packed_days = {month * 32 + day for month, day in calendar_days}
+        found_birthdays = []
+        for number, packed_day in enumerate(self._index.birthdays):
+            if packed_day in packed_days:
+                name = self._valid_name(number)
+                if name is not None:
+                    found_birthdays.append((name, divmod(packed_day, 32)))
+        return found_birthdays
+
+    def birthdays(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        self._scanned.wait()
+        for number, packed_day in enumerate(self._index.birthdays):
+            if packed_day:
+                name = self._valid_name(number)
+                if name is not None:
+                    yield name, divmod(packed_day, 32)
+
+    def phones(self) -> Iterator[Tuple[str, str]]:
+        self._scanned.wait()
+        phones = self._index.phones
+        for number in range(len(phones)):
+            phones_text = phones[number]
+            if phones_text:
+                name = self._valid_name(number)
+                if name is not None:
+                    for phone in phones_text.strip(VALUES_SEPARATOR).split(VALUES_SEPARATOR):
+                        yield name, phone
+
+    def notes(self) -> Iterator[Tuple[str, int, str]]:
+        self._scanned.wait()
+        notes = self._index.notes
+        for number in range(len(notes)):
+            notes_text = notes[number]
+            if notes_text:
+                name = self._valid_name(number)
+                if name is not None:
+                    for position, text in enumerate(notes_text.split(VALUES_SEPARATOR)):
+                        yield name, position, text
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names())
+
+
+class Journal:
+    """Append-only log of the contacts changes, it is folded into the contacts file from time to time"""
+
+    def __init__(self, contacts_path: Path) -> None:
+        self.path = Path(contacts_path).with_suffix('.journal')
+        self.folding_path = Path(contacts_path).with_suffix('.journal.folding')
+        self.entries = 0
+        self._file = None
+
+    def read(self) -> Iterator[dict]:
+        """Operations of the folding and of the current journal, lines torn by a crash are skipped.
+        Only the operations written, when it is called, are read, also if the journal is folded meanwhile"""
+        journal_files = []
+        for journal_path in (self.folding_path, self.path):
+            try:
+                journal_file = open(journal_path, 'rb')
+            except FileNotFoundError:
+                continue
+            journal_files.append((journal_file, journal_file.seek(0, SEEK_END)))
+        return self._read_files(journal_files)
+
+    @staticmethod
+    def _read_files(journal_files: List[tuple]) -> Iterator[dict]:
+        try:
+            for journal_file, size in journal_files:
+                journal_file.seek(0)
+                yield from read_operations_of(journal_file, size)
+        finally:
+            for journal_file, _ in journal_files:
+                journal_file.close()
+
+    def open(self) -> None:
+        torn_tail = False
+        if self.path.exists():
+            self.entries = sum(1 for _ in read_operations(self.path))
+            with open(self.path, 'rb') as journal_file:
+                if journal_file.seek(0, SEEK_END) > 0:
+                    journal_file.seek(-1, SEEK_END)
+                    torn_tail = journal_file.read(1) != b'\n'
+        self._file = open(self.path, 'a', encoding=CONTACTS_FILE_ENCODING)
+        if torn_tail:
+            self._file.write('\n')
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def append(self, operation: dict) -> None:
+        self.extend([operation])
+
+    def extend(self, operations: List[dict]) -> None:
+        self._file.write(''.join(dumps(operation, ensure_ascii=False) + '\n' for operation in operations))
+        self._file.flush()
+        self.entries += len(operations)
+
+    def rotate(self) -> Path:
+        """Moves the current entries aside for folding and starts an empty journal"""
+        self.close()
+        if self.folding_path.exists():
+            with open(self.folding_path, 'a', encoding=CONTACTS_FILE_ENCODING) as folding_file:
+                for operation in read_operations(self.path):
+                    folding_file.write(dumps(operation, ensure_ascii=False) + '\n')
+            self.path.unlink()
+        else:
+            replace(self.path, self.folding_path)
+        self.entries = 0
+        self._file = open(self.path, 'a', encoding=CONTACTS_FILE_ENCODING)
+        return self.folding_path
+
+    def truncate(self) -> None:
+        """Forgets all entries, after the whole book was written to the contacts file"""
+        self.close()
+        self.folding_path.unlink(missing_ok=True)
+        self.entries = 0
+        self._file = open(self.path, 'w', encoding=CONTACTS_FILE_ENCODING)
+
+
+def read_operations(journal_path: Path) -> Iterator[dict]:
+    with open(journal_path, 'rb') as journal_file:
+        yield from read_operations_of(journal_file)
+
+
+def read_operations_of(journal_file, size: Optional[int] = None) -> Iterator[dict]:
+    """Operations of the open journal from its position, up to the size, if it is given"""
+    while size is None or journal_file.tell() < size:
+        line = journal_file.readline()
+        if not line:
+            break
+        try:
+            yield loads(line)
+        except (JSONDecodeError, UnicodeDecodeError):
+            continue
+
+
+def write_contacts_file(contacts_path: Path, rows: Iterable[dict]) -> None:
+    """Writes the rows next to the contacts file and swaps it in at once, so a crash leaves a whole file"""
+    written_path = Path(contacts_path).with_suffix('.written')
+    with open(written_path, 'w', encoding=CONTACTS_FILE_ENCODING, newline='') as tw:
+        contacts_writer = DictWriter(tw, FIELD_NAMES, )
+        contacts_writer.writeheader()
+        for row in rows:
+            contacts_writer.writerow(row)
+    replace(written_path, contacts_path)
+
+
+def fold_journal(contacts_path: Path, journal_path: Path) -> None:
+    """Writes the contacts file with the journaled changes applied, upserts and deletes make it safe to repeat.
+    Only the offsets of the last upserts are kept, the contacts are read from the journal, when they are written"""
+    # name -> offset of the last upsert of the contact in the journal, None if it was deleted
+    changed_offsets: Dict[str, Optional[int]] = {}
+    with open(journal_path, 'rb') as journal_file:
+        while True:
+            offset = journal_file.tell()
+            line = journal_file.readline()
+            if not line:
+                break
+            try:
+                operation = loads(line)
+            except (JSONDecodeError, UnicodeDecodeError):
+                continue
+            if operation['op'] == 'upsert':
+                changed_offsets[operation['contact']['name']] = offset
+            elif operation['op'] == 'delete':
+                changed_offsets[operation['name']] = None
+
+        def changed_row(name: str) -> Optional[dict]:
+            offset = changed_offsets.pop(name)
+            if offset is None:
+                return None
+            journal_file.seek(offset)
+            return contact_to_row(loads(journal_file.readline())['contact'])
+
+        def folded_rows() -> Iterator[dict]:
+            with open(contacts_path, 'r', encoding=CONTACTS_FILE_ENCODING, newline='') as tr:
+                for row in DictReader(tr):
+                    if row['name'] in changed_offsets:
+                        row = changed_row(row['name'])
+                    if row:
+                        yield row
+            for name in list(changed_offsets):
+                row = changed_row(name)
+                if row:
+                    yield row
+
+        write_contacts_file(contacts_path, folded_rows())
+    journal_path.unlink()
+
+
+class CsvStorage(ContactsStorage):
+    """Contacts csv file with the journal of changes, that weren't folded into it yet"""
+    value_separators = CSV_VALUE_SEPARATORS
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._contacts_file = ContactsFile(self.path)
+        self._journal = Journal(self.path)
+        self._folding: Optional[Thread] = None
+
+    def open(self) -> None:
+        journaled_operations = self._journal.read()
+        self._journal.open()
+        self._contacts_file.open(journaled_operations)
+
+    def _wait_for_folding(self) -> None:
+        if self._folding is not None:
+            self._folding.join()
+            self._folding = None
+
+    def close(self) -> None:
+        self._wait_for_folding()
+        self._journal.close()
+        self._contacts_file.close()
+
+    def __len__(self) -> int:
+        return len(self._contacts_file)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._contacts_file
+
+    def names(self) -> List[str]:
+        return self._contacts_file.names()
+
+    def names_page(self, offset: int, size: int, by_name: bool = False) -> List[str]:
+        if by_name:
+            # rows are in order of the file, so all names are sorted
+            return sorted(self._contacts_file.names())[offset:offset + size]
+        return self._contacts_file.names_page(offset, size)
+
+    def pop_contact(self, name: str) -> Optional[dict]:
+        row = self._contacts_file.pop_row(name)
+        return row_to_contact(row) if row is not None else None
+
+    def pop_all(self) -> Iterator[dict]:
+        for row in self.pop_all_rows():
+            yield row_to_contact(row)
+
+    def pop_all_rows(self) -> Iterator[dict]:
+        """Rows of all contacts as they are in the file, for the callers checking them one by one"""
+        return self._contacts_file.pop_all_rows()
+
+    def forget(self, name: str) -> None:
+        self._contacts_file.forget(name)
+
+    def find_names(self, sought_string: str) -> List[str]:
+        return self._contacts_file.find_names(sought_string)
+
+    def birthdays_on(self, calendar_days: Set[Tuple[int, int]]) -> List[Tuple[str, Tuple[int, int]]]:
+        return self._contacts_file.birthdays_on(calendar_days)
+
+    def birthdays(self) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        return self._contacts_file.birthdays()
+
+    def tag_names(self, tag: str) -> List[str]:
+        return self._contacts_file.tag_names(tag)
+
+    def tagged_notes(self, tags: Set[str]) -> List[Tuple[str, int, str, List[str]]]:
+        if not tags:
+            return []
+        # the index knows the tags of the contacts, only the rows of the contacts having all of them are read
+        names = set.intersection(*(set(self._contacts_file.tag_names(tag)) for tag in tags))
+        found_notes = []
+        for name in sorted(names):
+            row = self._contacts_file.read_row(name)
+            if row is None:
+                continue
+            for position, note in enumerate(row_to_contact(row)['notes']):
+                if tags.issubset(note['tags']):
+                    found_notes.append((name, position, note['note'], note['tags']))
+        return found_notes
+
+    def phone_names(self, phone: str) -> List[str]:
+        return self._contacts_file.phone_names(phone)
+
+    def phones(self) -> Iterator[Tuple[str, str]]:
+        return self._contacts_file.phones()
+
+    def notes(self) -> Iterator[Tuple[str, int, str]]:
+        return self._contacts_file.notes()
+
+    def contacts(self) -> Iterator[dict]:
+        return map(row_to_contact, self._contacts_file.unloaded_rows())
+
+    def _append(self, *operations: dict) -> None:
+        self._journal.extend(list(operations))
+        if self._journal.entries >= JOURNAL_FOLDING_SIZE and not (self._folding and self._folding.is_alive()):
+            self._folding = Thread(target=fold_journal, args=(self.path, self._journal.rotate()))
+            self._folding.start()
+
+    def write_contact(self, contact: dict) -> None:
+        self._append({'op': 'upsert', 'contact': contact})
+
+    def add_contacts(self, contacts: List[dict]) -> None:
+        self._contacts_file.add_rows(contacts)
+        self._append(*({'op': 'upsert', 'contact': contact} for contact in contacts))
+
+    def delete_contact(self, name: str) -> None:
+        self._append({'op': 'delete', 'name': name})
+
+    def save(self, contacts: Iterable[dict]) -> None:
+        self._wait_for_folding()
+
+        def book_rows() -> Iterator[dict]:
+            yield from self._contacts_file.unloaded_rows()
+            for contact in contacts:
+                yield contact_to_row(contact)
+
+        write_contacts_file(self.path, book_rows())
+        self._journal.truncate()
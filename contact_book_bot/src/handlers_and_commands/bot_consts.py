@@ -16,13 +16,27 @@ ADD_CONTACT = 'name, ' \
 
 FIND_CONTACT = 'find request'
 
-SORT_DIR = 'path to directory you want to sort'
+WATCH_DIR = 'path to directory, which new files you want to sort as they arrive ' \
+            '(add ", link_duplicates" or ", drop_duplicates" to hard link or drop the files with the same content)'
+
+STOP_WATCH = 'path to the watched directory'
+
+SORT_DIR = 'path to directory you want to sort (add ", dry_run" to only see what is going to be moved, ' \
+           '", link_duplicates" or ", drop_duplicates" to hard link or drop the files with the same content)'
 
 DELETE_CONTACT = 'name of the contact you want to delete'
 
-BIRTHDAYS_FROM_NOW = 'how many days from now would you like to lookup birthdays for?'
+WHO_IS_CALLING = 'phone number in any format (for example +38 (050) 123-45-67)'
+
+DUPLICATE_PHONES = None
+
+DEDUPE = '"merge" to merge the found duplicates or just press Enter to only see them'
 
-SHOW_ALL = None
+BIRTHDAYS_FROM_NOW = 'how many days from now would you like to lookup birthdays for? ' \
+                     '(or the range of days, for example 0-7 for the next week)'
+
+SHOW_ALL = 'page size (default 20), offset (default 0), sort by "name" or "birthday" (optional), ' \
+           'separating them by , or just press Enter for the first page'
 
 GOODBYE = None
 
@@ -42,15 +56,26 @@ FIND_NOTES_WITH_TAG = 'name of the contact, tag, ' \
                       'type of the sort ' \
                       '("newest", "name", "length")(default: "oldest"), separating them by ,'
 
+FIND_TAGGED_NOTES = 'tags to find in the notes of all contacts, ' \
+                    'put & between the tags a note must have all of and , between alternatives ' \
+                    '(for example: urgent & work, home)'
+
 CHANGE_NOTE = 'name of the contact, note, new note, separating them by ,'
 
 SEARCH_FOR_NOTES = 'name of the contact, searched symbols, separating them by ,'
 
+SEARCH_ALL_NOTES = 'words to search in the notes of all contacts, ' \
+                   'amount of the best notes to show (optional, default: 10), separating them by ,'
+
 EDIT_CONTACT = 'name of the contact, field to edit, old value (skip this for email and birthday), '\
                'new value, separating them by,'
 
 ADD_INFO = 'name of the contact, field to add (phone or address), new value, separating them by,'
 
+IMPORT_CONTACTS = 'path to the .csv, .jsonl or .vcf file with contacts to import'
+
+EXPORT_CONTACTS = 'path to the .csv, .jsonl or .vcf file to export contacts to'
+
 # command functions with categories and arguments to input in command
 
 COMMANDS = frozendict({
@@ -59,10 +84,15 @@ COMMANDS = frozendict({
     'add_contact': (handlers.add_contact, 'contact_commands', ADD_CONTACT),
     'find_contact': (handlers.find_contact, 'one_argument_book_commands', FIND_CONTACT),
     'delete_contact': (handlers.delete_contact, 'one_argument_book_commands', DELETE_CONTACT),
+    'who_is_calling': (handlers.who_is_calling, 'one_argument_book_commands', WHO_IS_CALLING),
+    'duplicate_phones': (handlers.duplicate_phones, 'only_book_commands', DUPLICATE_PHONES),
+    'dedupe': (handlers.dedupe, 'query_book_commands', DEDUPE),
     'birthdays_from_now': (handlers.get_birthdays_by_days, 'one_argument_book_commands', BIRTHDAYS_FROM_NOW),
     'see_notes': (handlers.see_notes, 'one_argument_book_commands', SEE_NOTES),
     'sort_dir': (handlers.dir_sort, 'sort_commands', SORT_DIR),
-    'show_all': (handlers.show_all, 'only_book_commands', SHOW_ALL),
+    'watch_dir': (handlers.watch_dir, 'sort_commands', WATCH_DIR),
+    'stop_watch': (handlers.stop_watch, 'sort_commands', STOP_WATCH),
+    'show_all': (handlers.show_all, 'page_book_commands', SHOW_ALL),
     'goodbye': (handlers.goodbye, 'none_argument_commands', GOODBYE),
     'exit': (handlers.goodbye, 'none_argument_commands', EXIT),
     'close': (handlers.goodbye, 'none_argument_commands', CLOSE),
@@ -70,8 +100,23 @@ COMMANDS = frozendict({
     'delete_note': (handlers.delete_note, '2args_commands', DELETE_NOTE),
     'add_tag': (handlers.add_tag, '3args_commands', ADD_TAG),
     'find_notes_with_tag': (handlers.find_notes_with_tag, '3args_commands', FIND_NOTES_WITH_TAG),
+    'find_tagged_notes': (handlers.find_tagged_notes, 'query_book_commands', FIND_TAGGED_NOTES),
     'change_note': (handlers.change_note, '3args_commands', CHANGE_NOTE),
     'search_for_notes': (handlers.search_for_notes, '2args_commands', SEARCH_FOR_NOTES),
+    'search_all_notes': (handlers.search_all_notes, 'query_book_commands', SEARCH_ALL_NOTES),
     'edit_contact': [handlers.edit_contact, '4args_commands', EDIT_CONTACT],
     'add_info': [handlers.add_info, '3args_commands', ADD_INFO],
+    'import_contacts': (handlers.import_contacts, 'one_argument_book_commands', IMPORT_CONTACTS),
+    'export_contacts': (handlers.export_contacts, 'one_argument_book_commands', EXPORT_CONTACTS),
 })
+
+# commands, that change the address book
+
+MUTATING_COMMANDS = frozenset({
+    'add_contact', 'delete_contact', 'add_note', 'delete_note', 'add_tag', 'change_note', 'edit_contact', 'add_info',
+    'import_contacts', 'dedupe',
+})
+
+# commands, that may take long and are run off the event loop by the server
+
+SLOW_COMMANDS = frozenset({'sort_dir', 'stop_watch', 'import_contacts', 'export_contacts', 'dedupe'})
@@ -0,0 +1,134 @@
+import gzip
+import os
+import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+# members are copied by chunks, so a huge member never sits in memory as a whole
+COPY_CHUNK_SIZE = 1024 * 1024
+MAX_EXTRACTING_WORKERS = 4
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class UnsafeMemberError(Exception):
+    pass
+
+
+class ArchiveResult(NamedTuple):
+    archive: str
+    target: str
+    members: int = 0
+    error: Optional[str] = None
+
+
+ProgressCallback = Callable[[ArchiveResult, int, int], None]
+
+
+def member_path(target_dir: str, member_name: str) -> str:
+    """Path of the member inside the target dir, members like '../../.bashrc' or '/etc/passwd' are refused"""
+    root = os.path.realpath(target_dir)
+    path = os.path.realpath(os.path.join(root, member_name))
+    if path != root and not path.startswith(root + os.sep):
+        raise UnsafeMemberError(member_name)
+    return path
+
+
+def copy_member(source, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+
+def extract_zip(archive: str, target_dir: str) -> int:
+    members = 0
+    with zipfile.ZipFile(archive) as zip_file:
+        for member in zip_file.infolist():
+            path = member_path(target_dir, member.filename)
+            if member.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            with zip_file.open(member) as source:
+                copy_member(source, path)
+            members += 1
+    return members
+
+
+def extract_tar(archive: str, target_dir: str) -> int:
+    members = 0
+    # the stream mode reads the archive once from the start to the end without seeking back
+    with tarfile.open(archive, 'r|*') as tar_file:
+        for member in tar_file:
+            path = member_path(target_dir, member.name)
+            if member.isdir():
+                os.makedirs(path, exist_ok=True)
+            elif member.isfile():
+                copy_member(tar_file.extractfile(member), path)
+                members += 1
+            # links and devices are skipped, they could point out of the target dir
+    return members
+
+
+def is_gzip_file(archive: str) -> bool:
+    """Gzip archives are recognized by the magic bytes, the sniffed ones may have no extension"""
+    with open(archive, 'rb') as archive_file:
+        return archive_file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def extract_gzip(archive: str, target_dir: str) -> int:
+    with gzip.open(archive) as source:
+        copy_member(source, member_path(target_dir, os.path.splitext(os.path.basename(archive))[0]))
+    return 1
+
+
+def extract_archive(archive: str, target_dir: str) -> ArchiveResult:
+    """Unpacks the archive into the target dir and deletes it, a broken archive is kept next to the dir"""
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        if zipfile.is_zipfile(archive):
+            members = extract_zip(archive, target_dir)
+        elif tarfile.is_tarfile(archive):
+            members = extract_tar(archive, target_dir)
+        elif is_gzip_file(archive):
+            members = extract_gzip(archive, target_dir)
+        else:
+            raise shutil.ReadError('unknown archive format')
+    except (OSError, EOFError, UnsafeMemberError, shutil.ReadError, zipfile.BadZipFile, tarfile.TarError) as error:
+        shutil.rmtree(target_dir, ignore_errors=True)
+        kept_archive = target_dir + os.path.splitext(archive)[1]
+        try:
+            os.replace(archive, kept_archive)
+        except OSError:
+            kept_archive = archive
+        return ArchiveResult(archive, kept_archive, error=f'{type(error).__name__}: {error}')
+    os.unlink(archive)
+    return ArchiveResult(archive, target_dir, members)
+
+
+def extract_archives(
+        archives: List[Tuple[str, str]],
+        progress: Optional[ProgressCallback] = None,
+        workers: Optional[int] = None,
+) -> List[ArchiveResult]:
+    """Unpacks (archive, target dir) pairs on a process pool, progress gets every result with done and total.
+    The workers are spawned, not forked: the move workers, the watchers and the server threads run meanwhile,
+    and a forked worker could get a lock one of them held, that nobody would ever release"""
+    if not archives:
+        return []
+    workers = workers or min(MAX_EXTRACTING_WORKERS, os.cpu_count() or 1, len(archives))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as executor:
+        futures = {executor.submit(extract_archive, archive, target_dir): (archive, target_dir)
+                   for archive, target_dir in archives}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool as error:
+                result = ArchiveResult(*futures[future], error=f'{type(error).__name__}: {error}')
+            results.append(result)
+            if progress:
+                progress(result, len(results), len(archives))
+    return results
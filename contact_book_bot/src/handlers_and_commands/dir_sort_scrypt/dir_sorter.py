@@ -1,117 +1,318 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, repeat
 from pathlib import Path
-import re
-import shutil
-from typing import Generator, List, Tuple, Any, Optional
-
-FOLDERS_NAMES = ('image', 'video', 'audio', 'document', 'archive', 'unknown')
-FILE_TYPES_EXTENSIONS = (
-    ('.jpeg', '.jpg', '.png', '.svg'),
-    ('.avi', '.mp4', '.mov', '.mkv'),
-    ('.mp3', '.ogg', '.wav', '.amr'),
-    ('.doc', '.docx', '.txt', '.pdf', '.xlsx', '.pptx'),
-    ('.zip', '.gz', '.tar')
-)
-
-
-def check_file_extension(extension: str) -> str:
-    for file_types in FILE_TYPES_EXTENSIONS:
-        if extension in file_types:
-            return FOLDERS_NAMES[FILE_TYPES_EXTENSIONS.index(file_types)]
-    return FOLDERS_NAMES[5]
-
-
-def find_all_files(path: Generator[Path, Any, Any], files: List[list]) -> Tuple[List[Path]]:
-    for content in path:
-        if content.is_file():
-            extension = check_file_extension(get_filename_and_extension(content)[1])
-            files[FOLDERS_NAMES.index(extension)].append(content)
-        elif content.name not in FOLDERS_NAMES:
-            inside_dirs = find_all_files(content.iterdir(), files)
-            files = inside_dirs
-    return files
-
-
-def make_dirs(path: Path) -> List[Path]:
-    sort_folders = []
-    for folder_name in FOLDERS_NAMES:
-        if check_is_dir_exist(path / folder_name) is False:
-            ((path / folder_name).mkdir())
-        sort_folders.append(check_is_dir_exist(path / folder_name))
-    return sort_folders
-
-
-def check_is_dir_exist(path: Path) -> Path or bool:
-    if path.exists() is True:
-        return path
-    return path.exists()
-
-
-def move_files(files: Tuple[List[Path]], dirs: List[Path]) -> Tuple[List[Path]]:
-    for file_type in files:
-        for file_path in file_type:
-            file_path.replace(dirs[files.index(file_type)] / file_path.name)
-            files[files.index(file_type)][files[files.index(file_type)].index(file_path)] = \
-                dirs[files.index(file_type)] / file_path.name
-    for archive in files[4]:
-        path_to_archive_dir = dirs[4] / get_filename_and_extension(archive)[0]
-        archive_path = path_to_archive_dir / archive.name
-        path_to_archive_dir.mkdir()
-        archive.replace(archive_path)
-        files[4][files[4].index(archive)] = path_to_archive_dir
-        unpack_archives(archive_path, path_to_archive_dir)
-        archive_path.unlink()
-    return files
-
-
-def unpack_archives(archive: Path, new_dir_path: Path) -> None:
-    shutil.unpack_archive(archive, new_dir_path)
-
-
-def get_filename_and_extension(filename: Path) -> Tuple[str, str]:
-    return filename.resolve().stem, filename.suffix
-
-
-def rename_files(files: Tuple[List[Path]]) -> Tuple[List[Path]]:
-    for category in files:
-        for content in category:
-            filename = normalize(get_filename_and_extension(content)[0]) + get_filename_and_extension(content)[1]
-            content.rename(content.parent / filename)
-            files[files.index(category)][category.index(content)] = content.parent / filename
-    return files
-
-
-def remove_empty_dirs(path: Generator[Path, Any, Any]) -> None:
-    for content in path:
-        if content.is_dir() is True and len(list(content.iterdir())) > 0:
-            remove_empty_dirs(content.iterdir())
-        if content.is_dir() is True and len(list(content.iterdir())) == 0:
-            content.rmdir()
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from .archive_extractor import ArchiveResult, ProgressCallback, extract_archives
+from .duplicate_finder import find_duplicate_files
+from .file_classifier import ARCHIVE_FOLDER, CLASSIFIER, FOLDERS_NAMES, FileClassifier, types_config_path
+from .name_normalizer import normalize
+from .sort_index import SortedIndex, list_folder
+from .sort_journal import JOURNAL_FILES, MoveJournal
+
+# moves of one worker task, a task per file would spend more time in the pool than in the filesystem
+MOVES_PER_TASK = 256
+# what happens to the files, that have the same content as a file sorted before them
+KEEP_DUPLICATES = 'keep'
+LINK_DUPLICATES = 'link'
+DROP_DUPLICATES = 'drop'
+DUPLICATES_OUTCOMES = {KEEP_DUPLICATES: 'kept', LINK_DUPLICATES: 'hard linked to them', DROP_DUPLICATES: 'dropped'}
+
+
+class PlannedMove(NamedTuple):
+    source: str
+    target: str
+    is_archive: bool = False
+    # target of the file with the same content, a dropped duplicate has the same target
+    duplicate_of: Optional[str] = None
+
+
+class SortPlan:
+    """Everything sort_dir is going to do with the directory, computed by one walk over it"""
+
+    def __init__(self, root: str, duplicates: str = KEEP_DUPLICATES) -> None:
+        self.root = root
+        self.duplicates = duplicates
+        self.moves: List[PlannedMove] = []
+        self.folders: Set[str] = set()
+        # walked directories, every directory goes after all of its subdirectories
+        self.walked_dirs: List[str] = []
+        # indexes of the moves finished by an interrupted run
+        self.done: Set[int] = set()
+
+    def pending_moves(self) -> List[Tuple[int, PlannedMove]]:
+        return [(index, move) for index, move in enumerate(self.moves) if index not in self.done]
+
+    def render(self) -> str:
+        pending_moves = self.pending_moves()
+        lines = [f'{len(pending_moves)} files are going to be sorted in {self.root}:']
+        for _, move in pending_moves:
+            source, target = os.path.relpath(move.source, self.root), os.path.relpath(move.target, self.root)
+            if move.is_archive:
+                lines.append(f'unpack {source} -> {target}')
+            elif move.duplicate_of is None:
+                lines.append(f'move {source} -> {target}')
+            elif self.duplicates == DROP_DUPLICATES:
+                lines.append(f'drop {source} (same as {target})')
+            else:
+                action = 'link' if self.duplicates == LINK_DUPLICATES else 'move'
+                lines.append(f'{action} {source} -> {target} '
+                             f'(same as {os.path.relpath(move.duplicate_of, self.root)})')
+        return '\n'.join(lines)
+
+    def duplicate_moves(self) -> List[Tuple[int, PlannedMove]]:
+        """Pending moves of the duplicates, that are linked or dropped after all other files are in place"""
+        if self.duplicates == KEEP_DUPLICATES:
+            return []
+        return [(index, move) for index, move in self.pending_moves() if move.duplicate_of is not None]
+
+
+def walk_files(root: str, walked_dirs: List[str], skipped_dirs: Iterable[str] = FOLDERS_NAMES) -> Iterator[os.DirEntry]:
+    """Files under the root, the sort folders are skipped at any depth"""
+    dirs_to_walk = [root]
+    while dirs_to_walk:
+        current_dir = dirs_to_walk.pop()
+        walked_dirs.append(current_dir)
+        with os.scandir(current_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    if entry.name not in JOURNAL_FILES:
+                        yield entry
+                elif entry.is_dir(follow_symlinks=False) and entry.name not in skipped_dirs:
+                    dirs_to_walk.append(entry.path)
+    # parents were walked before their subdirectories
+    walked_dirs.reverse()
+
+
+def unique_target(target: str, taken: Set[str], suffix: str = '') -> str:
+    """The target or the target with _1, _2 ... added to the name, that no other file has or is going to have"""
+    unique, number = target + suffix, 0
+    while unique in taken:
+        number += 1
+        unique = f'{target}_{number}{suffix}'
+    taken.add(unique)
+    return unique
+
+
+def existing_targets(root: str, folders: Iterable[str], sizes: Optional[Dict[str, int]] = None) -> Set[str]:
+    """Paths in the sort folders, one listing of a folder is cheaper than checking every target in it.
+    Sizes of the files sorted before, except the archives, are added to the sizes"""
+    taken = set()
+    for folder_name in folders:
+        folder = os.path.join(root, folder_name)
+        for name, size in list_folder(folder, sizes is not None and folder_name != ARCHIVE_FOLDER).items():
+            path = os.path.join(folder, name)
+            taken.add(path)
+            if size is not None:
+                sizes[path] = size
+    return taken
+
+
+def plan_entries(
+        plan: SortPlan,
+        entries: Iterable[os.DirEntry],
+        classifier: FileClassifier = CLASSIFIER,
+        workers: Optional[int] = None,
+        index: Optional[SortedIndex] = None,
+) -> SortPlan:
+    """Adds the moves of the files to the plan, the files sorted before are kept, if the new ones are the same.
+    The files sorted before are taken from the index of the directory, if it is given"""
+    root, duplicates = plan.root, plan.duplicates
+    files = []
+    for entry in entries:
+        folder_name = classifier.folder_of(entry)
+        plan.folders.add(folder_name)
+        files.append((entry, folder_name))
+    sorted_sizes: Dict[str, int] = {}
+    if index is not None:
+        taken = index.targets(plan.folders, sorted_sizes)
+    else:
+        taken = existing_targets(root, plan.folders, sorted_sizes)
+    # the files sorted before go first, so they are the kept ones of their groups
+    kept_files = {duplicate: group[0]
+                  for group in find_duplicate_files(chain(sorted_sizes.items(),
+                                                          ((entry.path, entry.stat().st_size)
+                                                           for entry, folder_name in files
+                                                           if folder_name != ARCHIVE_FOLDER)), workers)
+                  for duplicate in group[1:]}
+    # a file sorted before is its own target
+    targets: Dict[str, str] = {path: path for path in sorted_sizes}
+    for entry, folder_name in files:
+        stem, extension = os.path.splitext(entry.name)
+        target = os.path.join(root, folder_name, normalize(stem))
+        kept_file = kept_files.get(entry.path)
+        if folder_name == ARCHIVE_FOLDER:
+            plan.moves.append(PlannedMove(entry.path, unique_target(target, taken), True))
+            continue
+        if kept_file is not None and duplicates == DROP_DUPLICATES:
+            target = targets[kept_file]
         else:
+            target = unique_target(target, taken, extension)
+        targets[entry.path] = target
+        plan.moves.append(PlannedMove(entry.path, target, duplicate_of=targets.get(kept_file)))
+    return plan
+
+
+def plan_sort(
+        root: str,
+        classifier: FileClassifier = CLASSIFIER,
+        duplicates: str = KEEP_DUPLICATES,
+        workers: Optional[int] = None,
+) -> SortPlan:
+    plan = SortPlan(root, duplicates)
+    return plan_entries(plan, walk_files(root, plan.walked_dirs, classifier.folders), classifier, workers)
+
+
+def read_plan(journal: MoveJournal) -> Optional[SortPlan]:
+    """The plan of the interrupted sorting from the journal of the directory"""
+    stored = journal.read()
+    if stored is None:
+        return None
+    stored_plan, done = stored
+    plan = SortPlan(journal.root, stored_plan.get('duplicates', KEEP_DUPLICATES))
+    plan.moves = [PlannedMove(*move) for move in stored_plan['moves']]
+    plan.folders = set(stored_plan['folders'])
+    plan.walked_dirs = stored_plan['walked_dirs']
+    plan.done = done
+    return plan
+
+
+def run_moves(moves: List[Tuple[int, PlannedMove]], journal: Optional[MoveJournal] = None) -> None:
+    for _, move in moves:
+        try:
+            os.replace(move.source, move.target)
+        except FileNotFoundError:
+            # moved by the interrupted run right before it stopped
+            if not os.path.exists(move.target):
+                raise
+    if journal:
+        journal.mark_done([index for index, _ in moves])
+
+
+def group_moves(moves: List[Tuple[int, PlannedMove]]) -> List[List[Tuple[int, PlannedMove]]]:
+    """Targets of the plan are unique, so the moves go to the workers in any order"""
+    return [moves[start:start + MOVES_PER_TASK] for start in range(0, len(moves), MOVES_PER_TASK)]
+
+
+def run_duplicates(
+        moves: List[Tuple[int, PlannedMove]],
+        duplicates: str,
+        journal: Optional[MoveJournal] = None,
+) -> None:
+    """Links or drops the duplicates, the files with their content are already in place"""
+    for _, move in moves:
+        try:
+            if duplicates == LINK_DUPLICATES and not os.path.exists(move.target):
+                os.link(move.duplicate_of, move.target)
+            elif duplicates == DROP_DUPLICATES and not os.path.exists(move.duplicate_of):
+                raise FileNotFoundError(move.duplicate_of)
+        except OSError:
+            # the filesystem has no hard links or the kept file is gone, so the duplicate is moved as it is
+            os.replace(move.source, move.target)
+            continue
+        try:
+            os.unlink(move.source)
+        except FileNotFoundError:
+            # dropped by the interrupted run
             continue
+    if journal:
+        journal.mark_done([index for index, _ in moves])
 
 
-def normalize(name: str) -> str:
-    table_symbols = ('абвгґдеєжзиіїйклмнопрстуфхцчшщюяыэАБВГҐДЕЄЖЗИІЇЙКЛМНОПРСТУФХЦЧШЩЮЯЫЭьъЬЪ',
-                     (
-                         *u'abvhgde', 'ye', 'zh', *u'zyi', 'yi', *u'yklmnoprstuf', 'kh', 'ts',
-                         'ch', 'sh', 'shch', 'yu', 'ya', 'y', 'ye', *u'ABVHGDE', 'Ye', 'Zh', *u'ZYI',
-                         'Yi', *u'YKLMNOPRSTUF', 'KH', 'TS', 'CH', 'SH', 'SHCH', 'YU', 'YA', 'Y', 'YE',
-                         *(u'_' * 4)
-                     )
-                     )
-    map_cyr_to_latin = {ord(src): dest for src, dest in zip(*table_symbols)}
-    rx = re.compile(r"[^\w_]")
-    return rx.sub('_', name.translate(map_cyr_to_latin))
+def remove_empty_dirs(dirs: List[str]) -> None:
+    for directory in dirs:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            continue
+
+
+def run_plan(
+        plan: SortPlan,
+        progress: Optional[ProgressCallback] = None,
+        workers: Optional[int] = None,
+        journal: Optional[MoveJournal] = None,
+) -> List[ArchiveResult]:
+    for folder_name in plan.folders:
+        os.makedirs(os.path.join(plan.root, folder_name), exist_ok=True)
+    pending_moves = plan.pending_moves()
+    duplicate_moves = plan.duplicate_moves()
+    duplicate_indexes = {index for index, _ in duplicate_moves}
+    archive_indexes = {move.source: index for index, move in pending_moves
+                       if move.is_archive and os.path.exists(move.source)}
+
+    def archive_done(result: ArchiveResult, done: int, total: int) -> None:
+        if journal:
+            journal.mark_done([archive_indexes[result.archive]])
+        if progress:
+            progress(result, done, total)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        moved = executor.map(run_moves, group_moves([(index, move) for index, move in pending_moves
+                                                     if not move.is_archive and index not in duplicate_indexes]),
+                             repeat(journal))
+        # archives are unpacked on their own process pool while the files are moved
+        archive_results = extract_archives([(plan.moves[index].source, plan.moves[index].target)
+                                            for index in archive_indexes.values()], archive_done)
+        for _ in moved:
+            pass
+    run_duplicates(duplicate_moves, plan.duplicates, journal)
+    # the root itself stays even if it is empty now
+    remove_empty_dirs(plan.walked_dirs[:-1])
+    remove_empty_dirs([os.path.join(plan.root, folder_name) for folder_name in {*FOLDERS_NAMES, *plan.folders}])
+    return archive_results
 
 
-def sort_dir(dir_name: str) -> Optional[str]:
+def sort_planned(plan: SortPlan, progress: Optional[ProgressCallback] = None) -> List[ArchiveResult]:
+    """Runs the new plan, the journal lets the next sorting of the directory continue it if it is interrupted"""
+    journal = MoveJournal(plan.root)
+    journal.start(plan.moves, plan.folders, plan.walked_dirs, plan.duplicates)
+    archive_results = run_plan(plan, progress, journal=journal)
+    journal.remove()
+    return archive_results
+
+
+def render_results(plan: SortPlan, archive_results: List[ArchiveResult]) -> str:
+    """Archives, that could not be unpacked, and duplicates of the finished plan"""
+    message = ''
+    failed_archives = [result for result in archive_results if result.error]
+    if failed_archives:
+        message += "\nThese archives could not be unpacked and were kept as they are:\n" + \
+                   '\n'.join(f'{result.target} ({result.error})' for result in failed_archives)
+    duplicate_moves = [move for move in plan.moves if move.duplicate_of is not None]
+    if duplicate_moves:
+        message += f"\n{len(duplicate_moves)} files have the same content as other files and were " \
+                   f"{DUPLICATES_OUTCOMES[plan.duplicates]}:\n" + \
+                   '\n'.join(f'{os.path.relpath(move.source, plan.root)} = '
+                             f'{os.path.relpath(move.duplicate_of, plan.root)}' for move in duplicate_moves)
+    return message
+
+
+def sort_dir(
+        dir_name: str,
+        progress: Optional[ProgressCallback] = None,
+        dry_run: bool = False,
+        duplicates: str = KEEP_DUPLICATES,
+) -> Optional[str]:
     p = Path(dir_name)
     if p.is_dir():
-        all_files = find_all_files(p.iterdir(), [[], [], [], [], [], []])
-        all_files = rename_files(all_files)
-        new_dirs = make_dirs(p)
-        move_files(all_files, new_dirs)
-        remove_empty_dirs(p.iterdir())
-        return "Sorted successfully , go check your folder)"
+        journal = MoveJournal(str(p))
+        plan = read_plan(journal)
+        resumed = plan is not None
+        if not resumed:
+            CLASSIFIER.refresh(types_config_path())
+            plan = plan_sort(str(p), duplicates=duplicates)
+        if dry_run:
+            return ('Continuing the interrupted sorting. ' if resumed else '') + plan.render()
+        if resumed:
+            journal.open()
+            archive_results = run_plan(plan, progress, journal=journal)
+            journal.remove()
+        else:
+            archive_results = sort_planned(plan, progress)
+        message = "Sorted successfully , go check your folder)"
+        if resumed:
+            message = "Continued the interrupted sorting. " + message
+        return message + render_results(plan, archive_results)
     else:
         return None
@@ -0,0 +1,198 @@
+import os
+import sys
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from .archive_extractor import ProgressCallback
+from .dir_sorter import KEEP_DUPLICATES, SortPlan, plan_entries, render_results, sort_dir, sort_planned
+from .file_classifier import CLASSIFIER, types_config_path
+from .sort_index import SortedIndex
+from .sort_journal import JOURNAL_FILES, MoveJournal
+
+# seconds between two polls of the watched directory
+WATCH_INTERVAL = 1.0
+
+
+def report_to_stderr(message: str) -> None:
+    """Watchers report from their threads at any time, so their reports never get into the answers of the commands"""
+    print(message, file=sys.stderr)
+
+
+class ArrivedFile(NamedTuple):
+    """File found by the watcher, it is classified and planned like the os.DirEntry of the walk"""
+    name: str
+    path: str
+    stat_result: os.stat_result
+
+    def stat(self) -> os.stat_result:
+        return self.stat_result
+
+
+class DirWatcher:
+    """Sorts the files arriving into the directory.
+
+    Every poll stats only the watched directories and lists again only the ones with a changed mtime, so the poll
+    of a sorted directory costs as many stats as it has unsorted folders, not as many as it has files.
+    A new file is sorted once its size and mtime stay the same between two polls, the files copied
+    together are sorted together. The files sorted before are known from the index of the directory, so a batch
+    costs as much as its files, not as much as the sorted tree.
+    """
+
+    def __init__(
+            self,
+            root: str,
+            report: Callable[[str], None] = report_to_stderr,
+            progress: Optional[ProgressCallback] = None,
+            duplicates: str = KEEP_DUPLICATES,
+            interval: float = WATCH_INTERVAL,
+    ) -> None:
+        self.root = root
+        self.report = report
+        self.progress = progress
+        self.duplicates = duplicates
+        self.interval = interval
+        self.sorted_files = 0
+        self.batches = 0
+        # mtimes of the watched directories at their last listing
+        self._dirs: Dict[str, int] = {}
+        # (mtime, size) of the arrived files at the last poll, None for the files found by this poll
+        self._arrived: Dict[str, Optional[Tuple[int, int]]] = {}
+        self.index = SortedIndex(root)
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def scan(self) -> None:
+        """Lists the new and the changed directories, their new files join the arrived ones"""
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(f'{self.root} is not a directory anymore')
+        dirs_to_list = []
+        for directory, listed_mtime in list(self._dirs.items()):
+            try:
+                if os.stat(directory).st_mtime_ns != listed_mtime:
+                    dirs_to_list.append(directory)
+            except OSError:
+                del self._dirs[directory]
+        if self.root not in self._dirs:
+            dirs_to_list.append(self.root)
+        while dirs_to_list:
+            directory = dirs_to_list.pop()
+            try:
+                # the mtime is taken before the listing, files arriving during it change the mtime again
+                self._dirs[directory] = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            if entry.name not in JOURNAL_FILES:
+                                self._arrived.setdefault(entry.path, None)
+                        elif entry.is_dir(follow_symlinks=False) and entry.name not in CLASSIFIER.folders \
+                                and entry.path not in self._dirs:
+                            dirs_to_list.append(entry.path)
+            except OSError:
+                self._dirs.pop(directory, None)
+
+    def settled_files(self) -> List[ArrivedFile]:
+        """Arrived files, that didn't change since the last poll"""
+        settled = []
+        for path, last_seen in list(self._arrived.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._arrived[path]
+                continue
+            seen = (stat.st_mtime_ns, stat.st_size)
+            if seen == last_seen:
+                settled.append(ArrivedFile(os.path.basename(path), path, stat))
+                del self._arrived[path]
+            else:
+                self._arrived[path] = seen
+        return settled
+
+    def batch_dirs(self, files: List[ArrivedFile]) -> Set[str]:
+        """Directories of the files and all their parents under the root, they are removed if they are empty now"""
+        dirs = set()
+        for file in files:
+            directory = os.path.dirname(file.path)
+            while directory != self.root and directory not in dirs:
+                dirs.add(directory)
+                directory = os.path.dirname(directory)
+        return dirs
+
+    def sort_batch(self, files: List[ArrivedFile]) -> None:
+        CLASSIFIER.refresh(types_config_path())
+        plan = SortPlan(self.root, self.duplicates)
+        # like the walk, every directory goes after its subdirectories and the root goes last
+        plan.walked_dirs = sorted(self.batch_dirs(files), key=lambda directory: directory.count(os.sep),
+                                  reverse=True) + [self.root]
+        plan_entries(plan, files, index=self.index)
+        archive_results = sort_planned(plan, self.progress)
+        self.index.record((move.target for move in plan.moves), plan.folders)
+        self.sorted_files += len(files)
+        self.batches += 1
+        self.report(f'Sorted {len(files)} new files in {self.root}' + render_results(plan, archive_results))
+
+    def poll(self) -> None:
+        self.scan()
+        files = self.settled_files()
+        if files:
+            self.sort_batch(files)
+
+    def run(self) -> None:
+        try:
+            if MoveJournal(self.root).exists():
+                self.report(sort_dir(self.root, self.progress))
+            while not self._stopped.is_set():
+                self.poll()
+                self._stopped.wait(self.interval)
+        except Exception as error:
+            self.report(f'Stopped watching {self.root}: {type(error).__name__}: {error}')
+            with WATCHERS_LOCK:
+                if WATCHERS.get(self.root) is self:
+                    del WATCHERS[self.root]
+
+    def start(self) -> None:
+        self._thread = Thread(target=self.run, name=f'watch {self.root}', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Waits for the batch being sorted, the files arrived after it stay for the next sorting"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+WATCHERS: Dict[str, DirWatcher] = {}
+WATCHERS_LOCK = Lock()
+
+
+def start_watching(
+        dir_name: str,
+        report: Callable[[str], None] = report_to_stderr,
+        progress: Optional[ProgressCallback] = None,
+        duplicates: str = KEEP_DUPLICATES,
+) -> Optional[DirWatcher]:
+    """Starts the watcher of the directory, None if the directory is already watched"""
+    root = os.path.realpath(dir_name)
+    # a broken types config is reported right away, not by the first batch
+    CLASSIFIER.refresh(types_config_path())
+    with WATCHERS_LOCK:
+        if root in WATCHERS:
+            return None
+        watcher = WATCHERS[root] = DirWatcher(root, report, progress, duplicates)
+    watcher.start()
+    return watcher
+
+
+def stop_watching(dir_name: str) -> Optional[DirWatcher]:
+    """Stops the watcher of the directory, None if the directory is not watched"""
+    with WATCHERS_LOCK:
+        watcher = WATCHERS.pop(os.path.realpath(dir_name), None)
+    if watcher is not None:
+        watcher.stop()
+    return watcher
+
+
+def stop_all_watching() -> None:
+    with WATCHERS_LOCK:
+        watchers = list(WATCHERS.values())
+        WATCHERS.clear()
+    for watcher in watchers:
+        watcher.stop()
@@ -0,0 +1,64 @@
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# files of the same size are told apart by the hash of their heads first, most of them differ right there
+PARTIAL_HASH_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+MAX_HASHING_WORKERS = 8
+
+
+def hash_file(path: str, limit: Optional[int] = None) -> Optional[bytes]:
+    """Digest of the file or of its first limit bytes, None if it can't be read"""
+    digest = hashlib.blake2b()
+    buffer = bytearray(HASH_CHUNK_SIZE if limit is None else min(limit, HASH_CHUNK_SIZE))
+    view = memoryview(buffer)
+    remaining = limit
+    try:
+        with open(path, 'rb') as hashed_file:
+            while remaining is None or remaining > 0:
+                read = hashed_file.readinto(view if remaining is None else view[:remaining])
+                if not read:
+                    break
+                digest.update(view[:read])
+                if remaining is not None:
+                    remaining -= read
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def hash_head(path: str) -> Optional[bytes]:
+    return hash_file(path, PARTIAL_HASH_SIZE)
+
+
+def regroup(groups: List[List[Tuple[str, int]]], key: Callable[[str], Optional[Hashable]],
+            executor: ThreadPoolExecutor) -> List[List[Tuple[str, int]]]:
+    """Splits every group by the key computed on the pool, groups keep the order of their files"""
+    files = [file for group in groups for file in group]
+    regrouped: Dict[Tuple[int, Hashable], List[Tuple[str, int]]] = defaultdict(list)
+    for (path, size), file_key in zip(files, executor.map(key, [path for path, _ in files])):
+        if file_key is not None:
+            regrouped[(size, file_key)].append((path, size))
+    return [group for group in regrouped.values() if len(group) > 1]
+
+
+def find_duplicate_files(files: Iterable[Tuple[str, int]], workers: Optional[int] = None) -> List[List[str]]:
+    """Groups of the files with the same content among (path, size) pairs, files of a group are in the given order.
+    Only the files of a size shared with another file are read, and fully only if their heads are the same too"""
+    by_size: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+    for path, size in files:
+        # empty files are placeholders more often than copies
+        if size:
+            by_size[size].append((path, size))
+    groups = [group for group in by_size.values() if len(group) > 1]
+    if not groups:
+        return []
+    with ThreadPoolExecutor(max_workers=workers or MAX_HASHING_WORKERS) as executor:
+        groups = regroup(groups, hash_head, executor)
+        # the head of a small file is the whole file
+        small_groups = [group for group in groups if group[0][1] <= PARTIAL_HASH_SIZE]
+        groups = small_groups + regroup([group for group in groups if group[0][1] > PARTIAL_HASH_SIZE],
+                                        hash_file, executor)
+    return [[path for path, _ in group] for group in groups]
@@ -0,0 +1,144 @@
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+FOLDERS_NAMES = ('image', 'video', 'audio', 'document', 'archive', 'unknown')
+FILE_TYPES_EXTENSIONS = (
+    ('.jpeg', '.jpg', '.png', '.svg'),
+    ('.avi', '.mp4', '.mov', '.mkv'),
+    ('.mp3', '.ogg', '.wav', '.amr'),
+    ('.doc', '.docx', '.txt', '.pdf', '.xlsx', '.pptx'),
+    ('.zip', '.gz', '.tar')
+)
+EXTENSIONS_FOLDERS = {extension: folder_name
+                      for folder_name, extensions in zip(FOLDERS_NAMES, FILE_TYPES_EXTENSIONS)
+                      for extension in extensions}
+ARCHIVE_FOLDER = FOLDERS_NAMES[4]
+UNKNOWN_FOLDER = FOLDERS_NAMES[5]
+# json like {"image": [".webp", ".heic"], "book": [".epub"]} adds extensions to the folders, new folders too
+TYPES_CONFIG_VARIABLE = 'SORT_DIR_TYPES'
+TYPES_CONFIG_PATH = Path.home() / '.sort_dir_types.json'
+# (offset, magic bytes, folder) of the formats, the first matching one wins
+MAGIC_SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image'),
+    (0, b'GIF8', 'image'),
+    (4, b'ftypheic', 'image'),
+    (4, b'ftypM4A', 'audio'),
+    (4, b'ftyp', 'video'),
+    (8, b'AVI ', 'video'),
+    (0, b'\x1aE\xdf\xa3', 'video'),
+    (0, b'ID3', 'audio'),
+    (0, b'OggS', 'audio'),
+    (0, b'fLaC', 'audio'),
+    (8, b'WAVE', 'audio'),
+    (0, b'%PDF-', 'document'),
+    (0, b'{\\rtf', 'document'),
+    (0, b'PK\x03\x04', 'archive'),
+    (0, b'\x1f\x8b', 'archive'),
+    (257, b'ustar', 'archive'),
+)
+SNIFF_SIZE = max(offset + len(magic) for offset, magic, _ in MAGIC_SIGNATURES)
+SNIFFED_CACHE_SIZE = 65536
+
+
+class TypesConfigError(Exception):
+    pass
+
+
+def read_types_config(path: Path) -> Dict[str, str]:
+    """Extensions of the config mapped to their folders, extensions are lowercased and start with a dot"""
+    try:
+        with open(path, 'r', encoding='utf-8') as config_file:
+            config = json.load(config_file)
+    except (OSError, ValueError) as error:
+        raise TypesConfigError(f'{path}: {error}')
+    if not isinstance(config, dict) or not all(isinstance(extensions, list) for extensions in config.values()):
+        raise TypesConfigError(f'{path}: expected {{"folder": [".extension", ...]}}')
+    extensions_folders = {}
+    for folder_name, extensions in config.items():
+        if not folder_name or folder_name in ('.', '..') or os.sep in folder_name or '/' in folder_name:
+            raise TypesConfigError(f'{path}: {folder_name!r} is not a folder name')
+        for extension in extensions:
+            if not isinstance(extension, str) or not extension.strip('.'):
+                raise TypesConfigError(f'{path}: {extension!r} is not an extension')
+            extensions_folders['.' + extension.lower().lstrip('.')] = folder_name
+    return extensions_folders
+
+
+def types_config_path() -> Path:
+    return Path(os.environ.get(TYPES_CONFIG_VARIABLE, TYPES_CONFIG_PATH))
+
+
+def sniff_folder(path: str) -> str:
+    """Folder of the file by the magic bytes of its format, only the first bytes are read"""
+    try:
+        with open(path, 'rb') as sniffed_file:
+            head = sniffed_file.read(SNIFF_SIZE)
+    except OSError:
+        return UNKNOWN_FOLDER
+    for offset, magic, folder_name in MAGIC_SIGNATURES:
+        if head.startswith(magic, offset):
+            return folder_name
+    return UNKNOWN_FOLDER
+
+
+class FileClassifier:
+    """Sort folder of the file by its extension, a file of an unknown extension is sniffed by its first bytes.
+
+    Sniffed folders are cached per (device, inode) while the mtime and the size of the file stay the same,
+    so sorting the same tree again reads only the new and the changed files.
+    """
+
+    def __init__(self) -> None:
+        self.extensions_folders = dict(EXTENSIONS_FOLDERS)
+        self.folders = FOLDERS_NAMES
+        self.sniffed_files = 0
+        self._config: Optional[Tuple[str, Optional[int]]] = None
+        self._sniffed: 'OrderedDict[Tuple[int, int], Tuple[int, int, str]]' = OrderedDict()
+        self._lock = Lock()
+
+    def refresh(self, config_path: Path) -> None:
+        """Rereads the types config, if it was changed since the last sorting"""
+        try:
+            config = (str(config_path), config_path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            config = (str(config_path), None)
+        if config == self._config:
+            return
+        extensions_folders = dict(EXTENSIONS_FOLDERS)
+        if config[1] is not None:
+            extensions_folders.update(read_types_config(config_path))
+        self.extensions_folders = extensions_folders
+        self.folders = tuple(dict.fromkeys((*FOLDERS_NAMES, *extensions_folders.values())))
+        self._config = config
+
+    def folder_of(self, entry: os.DirEntry) -> str:
+        extension = os.path.splitext(entry.name)[1].lower()
+        folder_name = self.extensions_folders.get(extension)
+        if folder_name is not None:
+            return folder_name
+        stat = entry.stat()
+        key = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            cached = self._sniffed.get(key)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._sniffed.move_to_end(key)
+                return cached[2]
+        folder_name = sniff_folder(entry.path)
+        # jar, odt or epub files are zip archives too, only the files without an extension are unpacked
+        if folder_name == ARCHIVE_FOLDER and extension:
+            folder_name = UNKNOWN_FOLDER
+        with self._lock:
+            self.sniffed_files += 1
+            self._sniffed[key] = (stat.st_mtime_ns, stat.st_size, folder_name)
+            self._sniffed.move_to_end(key)
+            if len(self._sniffed) > SNIFFED_CACHE_SIZE:
+                self._sniffed.popitem(last=False)
+        return folder_name
+
+
+CLASSIFIER = FileClassifier()
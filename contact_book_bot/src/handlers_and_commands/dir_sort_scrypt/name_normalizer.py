@@ -0,0 +1,53 @@
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable
+
+CYRILLIC_LETTERS = 'абвгґдеєжзиіїйклмнопрстуфхцчшщюяыэАБВГҐДЕЄЖЗИІЇЙКЛМНОПРСТУФХЦЧШЩЮЯЫЭьъЬЪ'
+CYRILLIC_TRANSLITERATION = (
+    *u'abvhgde', 'ye', 'zh', *u'zyi', 'yi', *u'yklmnoprstuf', 'kh', 'ts',
+    'ch', 'sh', 'shch', 'yu', 'ya', 'y', 'ye', *u'ABVHGDE', 'Ye', 'Zh', *u'ZYI',
+    'Yi', *u'YKLMNOPRSTUF', 'KH', 'TS', 'CH', 'SH', 'SHCH', 'YU', 'YA', 'Y', 'YE',
+    *(u'_' * 4)
+)
+GREEK_LETTERS = 'αβγδεζηθικλμνξοπρσςτυφχψωάέήίόύώΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩΆΈΉΊΌΎΏ'
+GREEK_TRANSLITERATION = (
+    *u'abgdezi', 'th', *u'iklmn', 'x', *u'oprsstyf', 'ch', 'ps', *u'oaeiioyo',
+    *u'ABGDEZI', 'TH', *u'IKLMN', 'X', *u'OPRSTYF', 'CH', 'PS', *u'OAEIIOYO',
+)
+ALPHABETS = {
+    'cyrillic': dict(zip(CYRILLIC_LETTERS, CYRILLIC_TRANSLITERATION)),
+    'greek': dict(zip(GREEK_LETTERS, GREEK_TRANSLITERATION)),
+}
+# comma separated alphabets, that are transliterated in the names of the sorted files
+ALPHABETS_VARIABLE = 'SORT_DIR_ALPHABETS'
+DEFAULT_ALPHABETS = ('cyrillic',)
+NOT_WORD_PATTERN = re.compile(r'[^\w_]')
+# the same stems come again and again: copies, numbered photos, the files of every new batch of the watcher
+NORMALIZED_NAMES_CACHE_SIZE = 65536
+
+
+class NameNormalizer:
+    """Latin letters, digits and _ instead of the other characters of the name"""
+
+    def __init__(self, alphabets: Iterable[str] = DEFAULT_ALPHABETS) -> None:
+        letters: Dict[str, str] = {}
+        for alphabet in alphabets:
+            letters.update(ALPHABETS[alphabet])
+        self.table = str.maketrans(letters)
+        self.normalize = lru_cache(maxsize=NORMALIZED_NAMES_CACHE_SIZE)(self._normalize)
+
+    def _normalize(self, name: str) -> str:
+        # an ascii name has nothing to transliterate
+        if not name.isascii():
+            name = name.translate(self.table)
+        return NOT_WORD_PATTERN.sub('_', name)
+
+
+def alphabets_from_environment() -> Iterable[str]:
+    alphabets = [alphabet.strip().lower() for alphabet in os.environ.get(ALPHABETS_VARIABLE, '').split(',')]
+    return [alphabet for alphabet in alphabets if alphabet in ALPHABETS] or DEFAULT_ALPHABETS
+
+
+NORMALIZER = NameNormalizer(alphabets_from_environment())
+normalize = NORMALIZER.normalize
@@ -0,0 +1,151 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Set
+from .file_classifier import ARCHIVE_FOLDER
+
+INDEX_NAME = '.sort_dir_index'
+# the index is written anew here, when it has too many lines, and replaces the old one once it is complete
+INDEX_WRITTEN_NAME = INDEX_NAME + '.written'
+INDEX_FILES = frozenset({INDEX_NAME, INDEX_WRITTEN_NAME})
+INDEX_ENCODING = 'utf-8'
+# lines appended by the sortings, after which the index is written anew with one line
+INDEX_COMPACTING_LINES = 1000
+
+
+def list_folder(folder: str, with_sizes: bool = True) -> Dict[str, Optional[int]]:
+    """Names of the entries of the sort folder with the sizes of the files in it, None for the other entries"""
+    listed: Dict[str, Optional[int]] = {}
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                size = None
+                if with_sizes:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            size = entry.stat().st_size
+                    except OSError:
+                        pass
+                listed[entry.name] = size
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return listed
+
+
+class SortedIndex:
+    """Names and sizes of the files in the sort folders of the directory, kept in the directory between sortings,
+    so a sorting of a few new files doesn't list and stat all the files sorted before.
+
+    Every sorting appends a line with the files it added and the mtimes of the folders after it. A folder, whose
+    mtime is not the one in the index, was changed by someone else, so only it is listed again.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.path = os.path.join(root, INDEX_NAME)
+        # folder name -> entry name -> size of the file, None for the archives and directories
+        self.files: Dict[str, Dict[str, Optional[int]]] = {}
+        self.mtimes: Dict[str, int] = {}
+        self._loaded = False
+        self._lines = 0
+        # folders listed again since the index was saved, their whole listing is saved
+        self._listed: Set[str] = set()
+
+    def load(self) -> None:
+        """Reads the lines of the index, lines torn by a crash are skipped"""
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding=INDEX_ENCODING) as index_file:
+                for line in index_file:
+                    try:
+                        folders = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._apply(folders)
+                    self._lines += 1
+        except FileNotFoundError:
+            return None
+
+    def _apply(self, folders: Dict[str, Optional[dict]]) -> None:
+        for folder_name, folder in folders.items():
+            if folder is None:
+                self.files.pop(folder_name, None)
+                self.mtimes.pop(folder_name, None)
+                continue
+            if folder['listed'] or folder_name not in self.files:
+                self.files[folder_name] = {}
+            self.files[folder_name].update(folder['files'])
+            self.mtimes[folder_name] = folder['mtime']
+
+    def folder_files(self, folder_name: str) -> Dict[str, Optional[int]]:
+        """Entries of the sort folder, it is listed again only if it was changed since the index knows it"""
+        if not self._loaded:
+            self.load()
+        folder = os.path.join(self.root, folder_name)
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is None or self.mtimes.get(folder_name) != mtime:
+            # the mtime is taken before the listing, files added during it change the mtime again
+            self.files[folder_name] = list_folder(folder, folder_name != ARCHIVE_FOLDER)
+            self.mtimes[folder_name] = mtime
+            self._listed.add(folder_name)
+        return self.files[folder_name]
+
+    def targets(self, folders: Iterable[str], sizes: Optional[Dict[str, int]] = None) -> Set[str]:
+        """Paths in the sort folders like existing_targets gives them, without listing the unchanged folders"""
+        taken = set()
+        for folder_name in folders:
+            folder = os.path.join(self.root, folder_name)
+            for name, size in self.folder_files(folder_name).items():
+                path = os.path.join(folder, name)
+                taken.add(path)
+                if sizes is not None and size is not None:
+                    sizes[path] = size
+        return taken
+
+    def record(self, targets: Iterable[str], folders: Iterable[str]) -> None:
+        """Adds the targets of the finished sorting, takes the mtimes of its folders and saves the index"""
+        if not self._loaded:
+            self.load()
+        added: Dict[str, Dict[str, Optional[int]]] = {}
+        for target in targets:
+            folder, name = os.path.split(target)
+            folder_name = os.path.basename(folder)
+            try:
+                stat = os.stat(target)
+            except OSError:
+                continue
+            added.setdefault(folder_name, {})[name] = stat.st_size if folder_name != ARCHIVE_FOLDER else None
+        changed: Dict[str, Optional[dict]] = {}
+        for folder_name in {*folders, *added, *self._listed}:
+            try:
+                mtime = os.stat(os.path.join(self.root, folder_name)).st_mtime_ns
+            except OSError:
+                changed[folder_name] = None
+                continue
+            listed = folder_name in self._listed
+            files = self.files.get(folder_name, {}) if listed else {}
+            changed[folder_name] = {'mtime': mtime, 'listed': listed, 'files': {**files, **added.get(folder_name, {})}}
+        self._apply(changed)
+        self._listed = set()
+        if self._lines >= INDEX_COMPACTING_LINES:
+            self._write_all()
+        else:
+            self._append([changed])
+
+    def _append(self, lines: List[dict]) -> None:
+        with open(self.path, 'a', encoding=INDEX_ENCODING) as index_file:
+            # a line torn by a crash must not swallow the next one
+            index_file.write('\n' + ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines))
+        self._lines += len(lines)
+
+    def _write_all(self) -> None:
+        written_path = os.path.join(self.root, INDEX_WRITTEN_NAME)
+        with open(written_path, 'w', encoding=INDEX_ENCODING) as index_file:
+            index_file.write(json.dumps({folder_name: {'mtime': self.mtimes[folder_name], 'listed': True,
+                                                       'files': files}
+                                         for folder_name, files in self.files.items()
+                                         if self.mtimes.get(folder_name) is not None}, ensure_ascii=False) + '\n')
+        os.replace(written_path, self.path)
+        self._lines = 1
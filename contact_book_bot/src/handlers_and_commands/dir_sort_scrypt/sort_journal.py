@@ -0,0 +1,95 @@
+import json
+import os
+from threading import Lock
+from typing import Iterable, List, Optional, Set, Tuple
+from .sort_index import INDEX_FILES
+
+JOURNAL_NAME = '.sort_dir_journal'
+# the new plan is written here first and replaces the journal once it is complete
+JOURNAL_WRITTEN_NAME = JOURNAL_NAME + '.written'
+# files of the journal and of the index of the sorted files, that are not sorted with the files of the directory
+JOURNAL_FILES = frozenset({JOURNAL_NAME, JOURNAL_WRITTEN_NAME, *INDEX_FILES})
+JOURNAL_ENCODING = 'utf-8'
+
+
+class MoveJournal:
+    """Sort plan of the directory and the moves already done, kept in the directory until the sorting is over.
+
+    The first line holds the plan with paths relative to the directory, every next line lists indexes
+    of the finished moves.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.path = os.path.join(root, JOURNAL_NAME)
+        self._file = None
+        self._lock = Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def _absolute(self, path: str) -> str:
+        return os.path.normpath(os.path.join(self.root, path))
+
+    def read(self) -> Optional[Tuple[dict, Set[int]]]:
+        """The plan of the interrupted sorting and indexes of its done moves, lines torn by a crash are skipped"""
+        if not self.exists():
+            return None
+        done = set()
+        with open(self.path, 'r', encoding=JOURNAL_ENCODING) as journal_file:
+            try:
+                plan = json.loads(journal_file.readline())
+            except json.JSONDecodeError:
+                return None
+            for line in journal_file:
+                try:
+                    done.update(json.loads(line)['done'])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+        plan['moves'] = [(self._absolute(source), self._absolute(target), is_archive,
+                          *(self._absolute(duplicate_of) if duplicate_of else None for duplicate_of in rest))
+                         for source, target, is_archive, *rest in plan['moves']]
+        plan['walked_dirs'] = [self._absolute(directory) for directory in plan['walked_dirs']]
+        return plan, done
+
+    def start(
+            self,
+            moves: Iterable[Tuple[str, str, bool, Optional[str]]],
+            folders: Iterable[str],
+            walked_dirs: List[str],
+            duplicates: str,
+    ) -> None:
+        plan = {
+            'moves': [(self._relative(source), self._relative(target), is_archive,
+                       self._relative(duplicate_of) if duplicate_of else None)
+                      for source, target, is_archive, duplicate_of in moves],
+            'folders': sorted(folders),
+            'walked_dirs': [self._relative(directory) for directory in walked_dirs],
+            'duplicates': duplicates,
+        }
+        written_path = os.path.join(self.root, JOURNAL_WRITTEN_NAME)
+        with open(written_path, 'w', encoding=JOURNAL_ENCODING) as journal_file:
+            journal_file.write(json.dumps(plan, ensure_ascii=False) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(written_path, self.path)
+        self.open()
+
+    def open(self) -> None:
+        self._file = open(self.path, 'a', encoding=JOURNAL_ENCODING)
+        # a line torn by a crash must not swallow the next record
+        self._file.write('\n')
+
+    def mark_done(self, indexes: List[int]) -> None:
+        with self._lock:
+            self._file.write(json.dumps({'done': indexes}) + '\n')
+            self._file.flush()
+
+    def remove(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+        os.unlink(self.path)
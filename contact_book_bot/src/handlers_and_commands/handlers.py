@@ -1,16 +1,28 @@
-from .bot_classes_and_exceptions.bot_classes import AddressBook, ContactOutput
+from .bot_classes_and_exceptions import bot_dedupe, bot_import_export
+from .bot_classes_and_exceptions.bot_classes import AddressBook, ContactOutput, PAGE_SIZE, SORT_KEYS, \
+    SEARCH_RESULTS
+from .bot_classes_and_exceptions.bot_phones import normalize_phone
 from .bot_classes_and_exceptions.bot_exceptions import ExistContactError, \
-    LiteralsInDaysError, ZeroDaysError, UnknownFieldError, InvalidDirectoryPathError
-from .dir_sort_scrypt.dir_sorter import sort_dir
-from typing import Optional
+    LiteralsInDaysError, ZeroDaysError, UnknownFieldError, InvalidDirectoryPathError, PageError, TagQueryError, \
+    SearchQueryError, FileTypesConfigError
+from .dir_sort_scrypt.archive_extractor import ArchiveResult
+from .dir_sort_scrypt import dir_watcher
+from .dir_sort_scrypt.dir_sorter import DROP_DUPLICATES, KEEP_DUPLICATES, LINK_DUPLICATES, sort_dir
+from .dir_sort_scrypt.file_classifier import TypesConfigError
+from functools import partial
+from sys import stderr
+from typing import List, Optional, TextIO, Tuple
+from pathlib import Path
 
 COMMANDS = (
     ('hello', 'help'),
     ('goodbye', 'exit', 'close'),
-    ('add_contact', 'find_contact', 'delete_contact', 'show_all', 'edit_contact', 'add_info'),
+    ('add_contact', 'find_contact', 'delete_contact', 'show_all', 'edit_contact', 'add_info',
+     'import_contacts', 'export_contacts', 'who_is_calling', 'duplicate_phones', 'dedupe'),
     'birthdays_from_now',
-    ('see_notes', 'add_note', 'delete_note', 'add_tag', 'find_notes_with_tag', 'change_note', 'search_for_notes'),
-    'sort_dir',
+    ('see_notes', 'add_note', 'delete_note', 'add_tag', 'find_notes_with_tag', 'find_tagged_notes', 'change_note',
+     'search_for_notes', 'search_all_notes'),
+    ('sort_dir', 'watch_dir', 'stop_watch'),
 )
 
 
@@ -21,7 +33,7 @@ def greetings() -> str:
            f"Contact commands : {', '.join(COMMANDS[2])}\n" \
            f"See contacts birthdays in inputted amount of days: {COMMANDS[3]}\n" \
            f"Notes commands : {', '.join(COMMANDS[4])}\n" \
-           f"To sort directory by given path : {COMMANDS[5]}\n" \
+           f"To sort directory by given path : {', '.join(COMMANDS[5])}\n" \
            f"Stop bot's work : {', '.join(COMMANDS[1])}\n"
 
 
@@ -29,6 +41,7 @@ def add_contact(contact: dict, contacts_book: AddressBook) -> str:
     if contact['name'] in contacts_book.keys():
         raise ExistContactError
     contacts_book.add_record(contact)
+    contacts_book.log_change(contact['name'])
     contact_for_output = ContactOutput(contacts_book[contact['name']])
     return f"You successfully added:\n" \
            f"\t{contact_for_output.prepare_data_for_output()}"
@@ -36,30 +49,149 @@ def add_contact(contact: dict, contacts_book: AddressBook) -> str:
 
 def find_contact(find_string: str, contacts_book: AddressBook) -> str:
     found_contacts = contacts_book.find_record(find_string)
+    rendered_contacts = {
+        category: ''.join([str(record) for record in records]) if len(records) > 0 else 'Nothing found'
+        for category, records in found_contacts.items()
+    }
     return f"By the '{find_string}' request bot found contacts :\n" \
            f"\n\tIn name :" \
-           f"\n{''.join(found_contacts['by_name']) if len(found_contacts['by_name']) > 0 else 'Nothing found'}\n" \
+           f"\n{rendered_contacts['by_name']}\n" \
            f"\n\tIn phone number/numbers :" \
-           f"\n{''.join(found_contacts['by_phone']) if len(found_contacts['by_phone']) > 0 else 'Nothing found'}\n" \
+           f"\n{rendered_contacts['by_phone']}\n" \
            f"\n\tIn email :" \
-           f"\n{''.join(found_contacts['by_email']) if len(found_contacts['by_email']) > 0 else 'Nothing found'}\n" \
+           f"\n{rendered_contacts['by_email']}\n" \
            f"\n\tIn address/addresses :" \
-           f"\n{''.join(found_contacts['by_address']) if len(found_contacts['by_address']) > 0 else 'Nothing found'}\n"
+           f"\n{rendered_contacts['by_address']}\n"
 
 
-def dir_sort(path_to_dir: str) -> str:
-    message = sort_dir(path_to_dir)
+def report_unpacking(result: ArchiveResult, done: int, total: int, output: Optional[TextIO] = None) -> None:
+    if result.error:
+        print(f'[{done}/{total}] Could not unpack {result.archive}: {result.error}', file=output)
+    else:
+        print(f'[{done}/{total}] Unpacked {result.members} files into {result.target}', file=output)
+
+
+def import_contacts(path_to_file: str, contacts_book: AddressBook) -> str:
+    imported, rejected, errors_path = bot_import_export.import_contacts(path_to_file, contacts_book)
+    message = f"Successfully imported {imported} contacts from {path_to_file}"
+    if rejected:
+        message += f"\n{rejected} records were rejected, the reasons are in {errors_path}"
+    return message
+
+
+def export_contacts(path_to_file: str, contacts_book: AddressBook) -> str:
+    exported, skipped = bot_import_export.export_contacts(path_to_file, contacts_book)
+    message = f"Successfully exported {exported} contacts to {path_to_file}"
+    if skipped:
+        message += f"\n{skipped} contacts were skipped, a csv file can't keep ',' or '|' in their values, " \
+                   f"export them to a .jsonl or .vcf file"
+    return message
+
+
+def dedupe(contacts_book: AddressBook, options: Optional[List[str]] = None) -> str:
+    groups = bot_dedupe.find_duplicates(contacts_book.contacts())
+    if not groups:
+        return "No duplicate contacts found"
+    if 'merge' in [option.strip().lower() for option in options or []]:
+        merged_groups = bot_dedupe.merge_duplicates(contacts_book, groups)
+        rendered_groups = '\n'.join(kept_name + ' <- ' + ', '.join(merged_names)
+                                    for kept_name, merged_names in merged_groups)
+        return f"Merged {len(merged_groups)} groups of duplicate contacts:\n{rendered_groups}"
+    rendered_groups = '\n'.join(f'{place}. ' + ' / '.join(group.names) + f' (score {group.score:.2f})'
+                                for place, group in enumerate(groups, 1))
+    return f"Found {len(groups)} groups of possible duplicate contacts:\n{rendered_groups}\n" \
+           f"To merge every group into its most filled contact input dedupe with: merge"
+
+
+def duplicates_option(options: List[str]) -> str:
+    if 'drop_duplicates' in options:
+        return DROP_DUPLICATES
+    if 'link_duplicates' in options:
+        return LINK_DUPLICATES
+    return KEEP_DUPLICATES
+
+
+def dir_sort(path_to_dir: str, options: Optional[List[str]] = None) -> str:
+    options = options or []
+    try:
+        message = sort_dir(path_to_dir, report_unpacking, dry_run='dry_run' in options,
+                           duplicates=duplicates_option(options))
+    except TypesConfigError as error:
+        raise FileTypesConfigError(error)
     if not message:
         raise InvalidDirectoryPathError
     return message
 
 
-def show_all(contacts_book: AddressBook) -> str:
-    return contacts_book.see_all_contacts()
+def watch_dir(path_to_dir: str, options: Optional[List[str]] = None) -> str:
+    if not Path(path_to_dir).is_dir():
+        raise InvalidDirectoryPathError
+    try:
+        # the watcher unpacks the archives in its own thread, out of the command, like it reports its batches
+        watcher = dir_watcher.start_watching(path_to_dir, progress=partial(report_unpacking, output=stderr),
+                                             duplicates=duplicates_option(options or []))
+    except TypesConfigError as error:
+        raise FileTypesConfigError(error)
+    if watcher is None:
+        return f"{path_to_dir} is already watched"
+    return f"Watching {watcher.root}, the files are sorted as they arrive. " \
+           f"To stop input stop_watch with the path of the directory"
+
+
+def stop_watch(path_to_dir: str, options: Optional[List[str]] = None) -> str:
+    watcher = dir_watcher.stop_watching(path_to_dir)
+    if watcher is None:
+        watched_dirs = ', '.join(dir_watcher.WATCHERS) or 'nothing'
+        return f"{path_to_dir} is not watched, watched are: {watched_dirs}"
+    return f"Stopped watching {watcher.root}, {watcher.sorted_files} files were sorted in {watcher.batches} batches"
+
+
+def parse_page(page_args: List[str]) -> Tuple[int, int, Optional[str]]:
+    page_args = [*(page_arg.strip() for page_arg in page_args), '', '', ''][:3]
+    try:
+        size = int(page_args[0]) if page_args[0] else PAGE_SIZE
+        offset = int(page_args[1]) if page_args[1] else 0
+    except ValueError:
+        raise PageError
+    sort_by = page_args[2].lower() or None
+    if size <= 0 or offset < 0 or (sort_by and sort_by not in SORT_KEYS):
+        raise PageError
+    return size, offset, sort_by
+
+
+def show_all(contacts_book: AddressBook, page_args: Optional[List[str]] = None) -> str:
+    size, offset, sort_by = parse_page(page_args or [])
+    # one more name tells, if there is the next page, without counting the whole book
+    names = contacts_book.page_names(offset, size + 1, sort_by)
+    rendered_records = [str(record) for record in contacts_book.records(names[:size])]
+    if not rendered_records:
+        return f"There are no contacts from {offset + 1}, the book has {len(contacts_book)} contacts"
+    shown = offset + len(rendered_records)
+    if len(names) <= size:
+        return '\n'.join(rendered_records) + f"\nContacts {offset + 1}-{shown} of {shown}."
+    return '\n'.join(rendered_records) + f"\nContacts {offset + 1}-{shown}. To see the next page input show_all " \
+                                         f"with: {size}, {offset + size}{', ' + sort_by if sort_by else ''}"
+
+
+def who_is_calling(phone: str, contacts_book: AddressBook) -> str:
+    callers = contacts_book.find_by_phone(phone)
+    phone = normalize_phone(phone)
+    if not callers:
+        return f"Nobody in your contact book has the {phone} number"
+    return f"The {phone} number belongs to: {', '.join(caller.name.value for caller in callers)}"
+
+
+def duplicate_phones(contacts_book: AddressBook) -> str:
+    duplicates = contacts_book.duplicate_phones()
+    if not duplicates:
+        return "Every phone in your contact book belongs to one contact"
+    rendered_duplicates = '\n'.join(f"{phone} : {', '.join(names)}" for phone, names in duplicates.items())
+    return f"These phones belong to more than one contact:\n{rendered_duplicates}"
 
 
 def delete_contact(name: str, contacts_book: AddressBook) -> str:
     contacts_book.delete_record(name)
+    contacts_book.log_change(name)
     return f"Successfully deleted {name} contact"
 
 
@@ -75,12 +207,14 @@ def add_note(
 ) -> str:
     contact = contacts_book.get_record_by_name(name)
     contact.add_note(note, tag)
+    contacts_book.log_change(name)
     return f"Successfully added '{note}' to {contact.name.value} contact"
 
 
 def delete_note(name: str, note: str, contacts_book: AddressBook) -> str:
     contact = contacts_book.get_record_by_name(name)
     contact.delete_note(note)
+    contacts_book.log_change(name)
     return f"You've successfully deleted '{note}' note for the {contact.name.value} contact"
 
 
@@ -100,6 +234,7 @@ def change_note(
     note_to_add = new_note[0]
     contact = contacts_book.get_record_by_name(name)
     contact.modify_note(old_note, note_to_add)
+    contacts_book.log_change(name)
     return f"Successfully modified '{old_note}' to '{note_to_add}' for {contact.name.value} contact"
 
 
@@ -113,6 +248,7 @@ def add_tag(
     contact = contacts_book.get_record_by_name(name)
     contact_note = contact.get_note(note)
     contact_note.add_tag(tag_to_add)
+    contacts_book.log_change(name)
     return f"Successfully added '{tag_to_add}' to '{note}' of the {contact.name.value} contact"
 
 
@@ -139,6 +275,28 @@ def find_notes_with_tag(
            f"{contact.name.value} contact with '{tag}' tag: \n {' / '.join(found_notes)}"
 
 
+def parse_tag_query(query_args: List[str]) -> List[List[str]]:
+    """'urgent & work', 'home' -> notes with both urgent and work tags or with home tag"""
+    tag_groups = []
+    for query_arg in query_args:
+        tag_group = [tag.strip() for tag in query_arg.split('&') if tag.strip()]
+        if tag_group:
+            tag_groups.append(tag_group)
+    if not tag_groups:
+        raise TagQueryError
+    return tag_groups
+
+
+def find_tagged_notes(contacts_book: AddressBook, query_args: Optional[List[str]] = None) -> str:
+    tag_groups = parse_tag_query(query_args or [])
+    query = ' or '.join(f"'{' & '.join(tag_group)}'" for tag_group in tag_groups)
+    found_notes = contacts_book.find_tagged_notes(tag_groups)
+    if not found_notes:
+        return f"No notes with {query} tags in the book"
+    rendered_notes = '\n'.join(f"{name} : {note}" for name, note in found_notes)
+    return f"Here are the list of the notes with {query} tags in the whole book:\n{rendered_notes}"
+
+
 def search_for_notes(name: str, search_symbols: str, contacts_book: AddressBook) -> str:
     contact = contacts_book.get_record_by_name(name)
     found_notes = contact.search_for_notes(search_symbols)
@@ -149,14 +307,40 @@ def search_for_notes(name: str, search_symbols: str, contacts_book: AddressBook)
            f"{found_notes}"
 
 
-def get_birthdays_by_days(days: str, contacts_book: AddressBook) -> str:
+def search_all_notes(contacts_book: AddressBook, search_args: Optional[List[str]] = None) -> str:
+    search_args = [search_arg.strip() for search_arg in search_args or []]
+    if not search_args or not search_args[0]:
+        raise SearchQueryError
+    query = search_args[0]
+    try:
+        limit = int(search_args[1]) if len(search_args) > 1 and search_args[1] else SEARCH_RESULTS
+    except ValueError:
+        raise SearchQueryError
+    if limit <= 0:
+        raise SearchQueryError
+    found_notes = contacts_book.search_notes(query, limit)
+    if not found_notes:
+        return f"No notes match '{query}' in the book"
+    rendered_notes = '\n'.join(f"{place}. {name} : {note} (score {score:.2f})"
+                               for place, (score, name, note) in enumerate(found_notes, 1))
+    return f"Here are the best {len(found_notes)} notes for '{query}' in the whole book:\n{rendered_notes}"
+
+
+def parse_days(days: str) -> int:
     try:
         days = int(days)
     except ValueError:
         raise LiteralsInDaysError
     if days < 0:
         raise ZeroDaysError
-    return contacts_book.get_birthdays_by_days(days)
+    return days
+
+
+def get_birthdays_by_days(days: str, contacts_book: AddressBook) -> str:
+    if '-' in days[1:]:
+        first_day, last_day = sorted(parse_days(bound.strip()) for bound in days.split('-', 1))
+        return contacts_book.get_birthdays_in_range(first_day, last_day)
+    return contacts_book.get_birthdays_by_days(parse_days(days))
 
 
 def edit_contact(
@@ -177,6 +361,7 @@ def edit_contact(
         contact.modify_email(new_value)
     else:
         raise UnknownFieldError
+    contacts_book.log_change(name)
     return f"Successfully modified {field} from '{old_value}' to '{new_value}' of the {name} contact"
 
 
@@ -193,4 +378,5 @@ def add_info(
         contact.add_address(new_value[0])
     else:
         raise UnknownFieldError
+    contacts_book.log_change(name)
     return f"Successfully added '{new_value[0]}' to {field} field of the {name} contact"
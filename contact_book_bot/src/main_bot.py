@@ -1,10 +1,27 @@
 from handlers_and_commands.bot_classes_and_exceptions import bot_exceptions
-from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
-from re import search
-from typing import List, Callable
-from difflib import get_close_matches
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook, \
+    CONTACTS_PATH, CONTACTS_DB_PATH
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import ContactsStorage, CsvStorage
+from handlers_and_commands.bot_classes_and_exceptions.bot_sqlite_storage import SqliteStorage
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from json import dumps
+from os import environ
+from re import match, search
+from sys import stdin, stdout, stderr
+from typing import List, Callable, Optional, TextIO, Tuple
+from handlers_and_commands.bot_classes_and_exceptions.bot_indexes import FuzzyIndex
+from handlers_and_commands.dir_sort_scrypt.dir_watcher import stop_all_watching
 from handlers_and_commands.bot_consts import COMMANDS
 
+# mistyped commands are short, so a close command has less trigrams in common than a close name
+COMMAND_SIMILARITY = 0.4
+COMMANDS_MATCHER = FuzzyIndex()
+# the command is separated from its arguments by a space or by a comma
+BATCH_LINE_PATTERN = r'([^\s,]*)\s*,?\s*(.*)'
+for command_name in COMMANDS:
+    COMMANDS_MATCHER.add(command_name)
+
 
 def get_handler(
         contacts: AddressBook,
@@ -12,36 +29,58 @@ def get_handler(
         category: str,
         arguments: List[str] = None
 ) -> str:
+    """Answer of the handler, the mistakes of the user are answered too"""
     try:
-        if not arguments:
-            if category == 'only_book_commands':
-                return handler(contacts)
-            return handler()
-        if category == 'one_argument_book_commands':
-            return handler(arguments[0], contacts)
-        elif category == 'sort_commands':
-            return handler(arguments[0])
-        elif category == 'contact_commands':
-            return handler(parse_user_input(arguments), contacts)
-        elif category == '2args_commands':
-            return handler(arguments[0], arguments[1], contacts)
-        elif category == '3args_commands':
-            return handler(arguments[0], arguments[1], contacts, arguments[2:])
-        elif category == '4args_commands':
-            if len(arguments) == 4:
-                return handler(arguments[0], arguments[1], arguments[3], contacts, arguments[2])
-            else:
-                return handler(arguments[0], arguments[1], arguments[2], contacts)
+        return call_handler(contacts, handler, category, arguments)
+    except Exception as error:
+        answer = error_answer(error)
+        if answer is None:
+            raise
+        return answer
+
+
+def call_handler(
+        contacts: AddressBook,
+        handler: Callable,
+        category: str,
+        arguments: List[str] = None
+) -> str:
+    if not arguments:
+        if category in ('only_book_commands', 'page_book_commands', 'query_book_commands'):
+            return handler(contacts)
+        return handler()
+    if category == 'one_argument_book_commands':
+        return handler(arguments[0], contacts)
+    elif category in ('page_book_commands', 'query_book_commands'):
+        return handler(contacts, arguments)
+    elif category == 'sort_commands':
+        return handler(arguments[0], arguments[1:])
+    elif category == 'contact_commands':
+        return handler(parse_user_input(arguments), contacts)
+    elif category == '2args_commands':
+        return handler(arguments[0], arguments[1], contacts)
+    elif category == '3args_commands':
+        return handler(arguments[0], arguments[1], contacts, arguments[2:])
+    elif category == '4args_commands':
+        if len(arguments) == 4:
+            return handler(arguments[0], arguments[1], arguments[3], contacts, arguments[2])
+        else:
+            return handler(arguments[0], arguments[1], arguments[2], contacts)
+
 
+def error_answer(error: Exception) -> Optional[str]:
+    """Answer to the mistake of the user, None for the other errors"""
+    try:
+        raise error
     except bot_exceptions.ExistContactError:
         return "This contact already exists, " \
                "if you want to change number please use command change"
-    except bot_exceptions.UnknownContactError:
+    except bot_exceptions.UnknownContactError as error:
         return "No contact with such name in contact book, " \
-               "please try input different name"
-    except bot_exceptions.UnknownNoteError:
+               "please try input different name" + did_you_mean(error)
+    except bot_exceptions.UnknownNoteError as error:
         return "No such note for this contact, " \
-               "please try input different note"
+               "please try input different note" + did_you_mean(error)
     except bot_exceptions.UnknownPhoneError:
         return "No such phone for this contact, " \
                "please try input different phone"
@@ -50,7 +89,7 @@ def get_handler(
                "please try input different phone"
     except bot_exceptions.PhoneError:
         return "Phone number must starts from + " \
-               "and phone must contain only digits" \
+               "and phone must contain only digits (no more than 15)" \
                ", please try again"
     except bot_exceptions.BirthdayError:
         return "Data must match pattern 'day.month.year', " \
@@ -61,6 +100,23 @@ def get_handler(
     except bot_exceptions.InvalidDirectoryPathError:
         return 'It is not a directory , ' \
                'please insert a valid directory path'
+    except bot_exceptions.FileTypesConfigError as error:
+        return f'The file types config of sort_dir is broken, please fix it or remove it ({error})'
+    except bot_exceptions.InvalidFilePathError:
+        return 'There is no such file or directory, ' \
+               'please insert a valid file path'
+    except bot_exceptions.UnknownFileFormatError:
+        return 'Only .csv, .jsonl and .vcf files are supported, ' \
+               'please try again'
+    except bot_exceptions.PageError:
+        return 'Page size must be more than zero, offset must be zero or more ' \
+               'and contacts can be sorted only by name or birthday, please try again'
+    except bot_exceptions.TagQueryError:
+        return "Please input tags to find, put & between the tags a note must have all of " \
+               "and , between alternatives, please try again"
+    except bot_exceptions.SearchQueryError:
+        return "Please input words to search and, optionally, the amount of notes to show " \
+               "(more than zero), please try again"
     except bot_exceptions.ZeroDaysError:
         return 'Please input more than zero days, try again'
     except bot_exceptions.LiteralsInDaysError:
@@ -73,6 +129,15 @@ def get_handler(
     except IndexError:
         return "Seems you haven't inputted obligatory arguments for the command, " \
                "or you have inputted too much arguments. Please try again"
+    except Exception:
+        return None
+
+
+def did_you_mean(error: Exception) -> str:
+    suggestions = error.args[0] if error.args else None
+    if not suggestions:
+        return ''
+    return f"\nDid you mean: {' / '.join(suggestions)}?"
 
 
 def parse_user_input(raw_contact: list) -> dict:
@@ -95,14 +160,89 @@ def parse_user_input(raw_contact: list) -> dict:
     return parsed_contact
 
 
+def choose_storage() -> ContactsStorage:
+    """BOOK_BOT_STORAGE=sqlite keeps the book in SQLite database, the csv file is imported into it on first run"""
+    if environ.get('BOOK_BOT_STORAGE', 'csv').lower() == 'sqlite':
+        return SqliteStorage(CONTACTS_DB_PATH, import_from=CONTACTS_PATH)
+    return CsvStorage(CONTACTS_PATH)
+
+
 def get_most_close_commands(command: str) -> list[str]:
-    return get_close_matches(command, list(COMMANDS.keys()))
+    return COMMANDS_MATCHER.similar(command, cutoff=COMMAND_SIMILARITY)
+
+
+def run_command(
+        address_book: AddressBook,
+        command: str,
+        raw_args: Optional[str] = None,
+        call: Callable[..., str] = get_handler,
+) -> str:
+    """call_handler instead of get_handler raises the mistakes of the user instead of answering them"""
+    handler, category, args_for_command = COMMANDS[command]
+    if args_for_command:
+        split_user_args = (raw_args or '').split(',')
+        user_args = [arg.strip() for arg in split_user_args]
+        if command == 'find_notes_with_tag' and len(user_args) == 2:
+            category = '2args_commands'
+        return call(address_book, handler, category, user_args)
+    return call(address_book, handler, category)
+
+
+def parse_batch_line(line: str) -> Tuple[str, str]:
+    """'command arg, arg, ...' or 'command, arg, arg, ...' line of the batch"""
+    command, raw_args = match(BATCH_LINE_PATTERN, line.strip()).groups()
+    return command.lower(), raw_args
 
 
-def main() -> None:
+def run_batch(address_book: AddressBook, commands: TextIO, output: TextIO) -> None:
+    """Runs a command per line and answers with a json line per command, the book is saved once at the end"""
+    address_book.defer_changes()
+    try:
+        for line_number, line in enumerate(commands, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            command, raw_args = parse_batch_line(line)
+            answer = {'line': line_number, 'command': command}
+            if command not in COMMANDS:
+                answer['error'] = "I don't know such command"
+                close_commands = get_most_close_commands(command)
+                if close_commands:
+                    answer['close_commands'] = close_commands
+            else:
+                try:
+                    # progress of the long commands must not get mixed into the answers
+                    with redirect_stdout(stderr):
+                        answer['answer'] = run_command(address_book, command, raw_args, call_handler)
+                except Exception as error:
+                    answer['error'] = error_answer(error) or f'{type(error).__name__}: {error}'
+            answer['ok'] = 'error' not in answer
+            output.write(dumps(answer, ensure_ascii=False) + '\n')
+            if answer.get('answer') == 'Good bye!':
+                break
+    finally:
+        # the watchers started by the batch finish their batches, the process doesn't kill them in the middle
+        stop_all_watching()
+        address_book.save()
+        address_book.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description='Address book and dir sorter chatbot')
+    parser.add_argument('--batch', metavar='PATH',
+                        help="run the commands from the file ('-' for stdin), a command with its arguments per line")
+    arguments = parser.parse_args(argv)
+    if arguments.batch:
+        address_book = AddressBook(choose_storage())
+        address_book.load(lazy=True)
+        if arguments.batch == '-':
+            run_batch(address_book, stdin, stdout)
+        else:
+            with open(arguments.batch, 'r', encoding='utf-8') as commands:
+                run_batch(address_book, commands, stdout)
+        return None
     bot_answer = None
-    address_book = AddressBook()
-    address_book.load()
+    address_book = AddressBook(choose_storage())
+    address_book.load(lazy=True)
     print('Welcome! '
           'Please separate arguments using the , character.\n'
           'For example : \n add_contact \n name , phones, birthday\n\n'
@@ -111,9 +251,7 @@ def main() -> None:
         raw_command = input("Input command :")
         lowered_command = raw_command.lower()
         prepared_command = lowered_command.strip()
-        try:
-            handler, category, args_for_command = COMMANDS[prepared_command]
-        except KeyError:
+        if prepared_command not in COMMANDS:
             close_commands = get_most_close_commands(prepared_command)
             if len(close_commands) != 0:
                 print(f"Seems like you'd missprinted this command. "
@@ -121,17 +259,13 @@ def main() -> None:
             else:
                 print("I don't know such command, please try again(")
             continue
-        if args_for_command:
-            raw_user_args = input(f"Input {args_for_command} :")
-            split_user_args = raw_user_args.split(',')
-            user_args = [arg.strip() for arg in split_user_args]
-            if prepared_command == 'find_notes_with_tag' and len(user_args) == 2:
-                category = '2args_commands'
-            bot_answer = get_handler(address_book, handler, category, user_args)
-        else:
-            bot_answer = get_handler(address_book, handler, category)
+        raw_user_args = None
+        if COMMANDS[prepared_command][2]:
+            raw_user_args = input(f"Input {COMMANDS[prepared_command][2]} :")
+        bot_answer = run_command(address_book, prepared_command, raw_user_args)
         if bot_answer == 'Good bye!':
-            address_book.save()
+            stop_all_watching()
+            address_book.close()
         print(bot_answer)
 
 
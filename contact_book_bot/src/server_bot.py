@@ -0,0 +1,175 @@
+import asyncio
+from argparse import ArgumentParser
+from contextlib import asynccontextmanager
+from functools import partial
+from json import dumps, loads, JSONDecodeError
+from typing import AsyncIterator, List, Optional, Union
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_consts import COMMANDS, MUTATING_COMMANDS, SLOW_COMMANDS
+from handlers_and_commands.dir_sort_scrypt.dir_watcher import stop_all_watching
+from main_bot import choose_storage, get_most_close_commands, run_command
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+GOODBYE_ANSWER = 'Good bye!'
+# answers like show_all of a big book are long json lines
+STREAM_LIMIT = 64 * 1024 * 1024
+# commands of these categories don't use the address book
+BOOKLESS_CATEGORIES = ('none_argument_commands', 'sort_commands')
+
+
+class ReadWriteLock:
+    """Many readers or one writer, writers don't starve as new readers wait for the waiting writer"""
+
+    def __init__(self) -> None:
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reading(self) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def writing(self) -> AsyncIterator[None]:
+        async with self._condition:
+            self._waiting_writers += 1
+            await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class BotServer:
+    """Bot commands over TCP, a json line request {"command": ..., "arguments": ...} gets a json line answer.
+    All clients share one address book"""
+
+    def __init__(self, address_book: AddressBook) -> None:
+        self.address_book = address_book
+        self.lock = ReadWriteLock()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def execute(self, command: str, raw_args: Optional[str] = None) -> str:
+        loop = asyncio.get_running_loop()
+        run = partial(run_command, self.address_book, command, raw_args)
+        if COMMANDS[command][1] in BOOKLESS_CATEGORIES:
+            return await loop.run_in_executor(None, run) if command in SLOW_COMMANDS else run()
+        # every book command runs off the loop, a lazy query reading the storage would stall all clients
+        if command in MUTATING_COMMANDS:
+            async with self.lock.writing():
+                return await loop.run_in_executor(None, run)
+        async with self.lock.reading():
+            return await loop.run_in_executor(None, run)
+
+    async def answer(self, request_line: bytes) -> dict:
+        try:
+            request = loads(request_line)
+            command = str(request['command']).strip().lower()
+        except (JSONDecodeError, UnicodeDecodeError, KeyError, TypeError) as error:
+            return {'error': f'Invalid request, expected {{"command": ..., "arguments": ...}}: {error}'}
+        if command not in COMMANDS:
+            return {'command': command, 'error': "I don't know such command",
+                    'close_commands': get_most_close_commands(command)}
+        arguments = request.get('arguments')
+        if isinstance(arguments, list):
+            arguments = ', '.join(str(argument) for argument in arguments)
+        try:
+            return {'command': command, 'answer': await self.execute(command, arguments)}
+        except Exception as error:
+            return {'command': command, 'error': f'{type(error).__name__}: {error}'}
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if not request_line.strip():
+                    continue
+                answer = await self.answer(request_line)
+                writer.write(dumps(answer, ensure_ascii=False).encode() + b'\n')
+                await writer.drain()
+                # goodbye ends the session of the client, the book stays open for the others
+                if answer.get('answer') == GOODBYE_ANSWER:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self.handle_client, host, port, limit=STREAM_LIMIT)
+        return self._server
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await asyncio.get_running_loop().run_in_executor(None, stop_all_watching)
+        async with self.lock.writing():
+            self.address_book.close()
+
+
+class BotClient:
+    """Client of the bot server, also for talking to the server running in the same process"""
+
+    def __init__(self) -> None:
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> 'BotClient':
+        self._reader, self._writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+        return self
+
+    async def request(self, command: str, arguments: Union[str, List[str], None] = None) -> dict:
+        self._writer.write(dumps({'command': command, 'arguments': arguments}, ensure_ascii=False).encode() + b'\n')
+        await self._writer.drain()
+        return loads(await self._reader.readline())
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+
+
+async def serve(host: str, port: int) -> None:
+    address_book = AddressBook(choose_storage())
+    address_book.load(lazy=True)
+    server = BotServer(address_book)
+    await server.start(host, port)
+    print(f'Serving the bot commands on {host}:{port}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Address book and dir sorter bot server, json lines over TCP')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
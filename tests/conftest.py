@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+from typing import Iterable, List
+
+import pytest
+
+SRC_PATH = Path(__file__).absolute().parent.parent / 'contact_book_bot' / 'src'
+# the stress test of the book is run by the benchmarks too
+BENCHMARKS_PATH = SRC_PATH.parent.parent / 'benchmarks'
+for import_path in (SRC_PATH, BENCHMARKS_PATH):
+    if str(import_path) not in sys.path:
+        sys.path.insert(0, str(import_path))
+
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import contact_to_row, \
+    write_contacts_file  # noqa: E402
+
+TAGS = ('work', 'home', 'urgent')
+
+
+def make_contact(number: int) -> dict:
+    return {
+        'name': f'Contact {number}',
+        'phones': [f'+380{number:09d}', f'+1{number % 50:010d}'],
+        'birthday': f'{number % 28 + 1:02d}.{number % 12 + 1:02d}.1990' if number % 5 else None,
+        'addresses': [f'{number} Main street'] if number % 3 else [],
+        'email': f'contact{number}@mail.com' if number % 2 else None,
+        'notes': [{'note': f'call about project {number}', 'tags': [TAGS[number % 3]]}] if number % 4 else [],
+    }
+
+
+def write_book(path: Path, contacts: Iterable[dict]) -> Path:
+    write_contacts_file(path, (contact_to_row(contact) for contact in contacts))
+    return path
+
+
+@pytest.fixture
+def contacts() -> List[dict]:
+    return [make_contact(number) for number in range(300)]
+
+
+@pytest.fixture
+def book_path(tmp_path: Path, contacts: List[dict]) -> Path:
+    return write_book(tmp_path / 'contact_book.csv', contacts)
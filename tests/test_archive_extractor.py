@@ -0,0 +1,41 @@
+import gzip
+import tarfile
+import zipfile
+from io import BytesIO
+
+from handlers_and_commands.dir_sort_scrypt.archive_extractor import extract_archive, extract_archives
+
+
+def test_archives_are_unpacked_on_the_pool(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'photos.zip', 'w') as zip_file:
+        zip_file.writestr('trip/a.jpg', b'a')
+        zip_file.writestr('trip/b.jpg', b'b')
+    with tarfile.open(tmp_path / 'docs.tar', 'w') as tar_file:
+        member = tarfile.TarInfo('notes.txt')
+        member.size = 4
+        tar_file.addfile(member, BytesIO(b'text'))
+    with gzip.open(tmp_path / 'log.gz', 'wb') as gzip_file:
+        gzip_file.write(b'line')
+    names = ('photos.zip', 'docs.tar', 'log.gz')
+    archives = [(str(tmp_path / name), str(tmp_path / name.split('.')[0])) for name in names]
+    progress = []
+    results = extract_archives(archives, lambda result, done, total: progress.append((done, total)), workers=2)
+    assert sorted((result.archive, result.members, result.error) for result in results) == sorted(
+        [(str(tmp_path / 'photos.zip'), 2, None), (str(tmp_path / 'docs.tar'), 1, None),
+         (str(tmp_path / 'log.gz'), 1, None)])
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert (tmp_path / 'photos' / 'trip' / 'b.jpg').read_bytes() == b'b'
+    assert (tmp_path / 'docs' / 'notes.txt').read_bytes() == b'text'
+    assert (tmp_path / 'log' / 'log').read_bytes() == b'line'
+    assert not (tmp_path / 'photos.zip').exists()
+
+
+def test_members_out_of_the_target_are_refused(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'evil.zip', 'w') as zip_file:
+        zip_file.writestr('good.txt', b'good')
+        zip_file.writestr('../../escaped.txt', b'bad')
+    result = extract_archive(str(tmp_path / 'evil.zip'), str(tmp_path / 'evil'))
+    assert result.error.startswith('UnsafeMemberError')
+    assert not (tmp_path / 'evil').exists() and not (tmp_path.parent / 'escaped.txt').exists()
+    # the broken archive is kept next to the folder it was unpacked into
+    assert result.target == str(tmp_path / 'evil.zip') and (tmp_path / 'evil.zip').exists()
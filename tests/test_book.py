@@ -0,0 +1,192 @@
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_indexes import BirthdayIndex, birthdays_calendar_days, \
+    days_to_next_birthday
+from handlers_and_commands.bot_classes_and_exceptions.bot_sqlite_storage import SqliteStorage
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CsvStorage
+from handlers_and_commands.handlers import show_all
+
+from conftest import make_contact, write_book
+
+BOOK_MODES = ('eager', 'lazy', 'sqlite')
+
+
+@pytest.fixture
+def books(book_path: Path, tmp_path: Path) -> Iterator[Dict[str, AddressBook]]:
+    """The same contacts in memory, read lazily from the csv file and kept in SQLite"""
+    books = {}
+    for mode in BOOK_MODES:
+        if mode == 'sqlite':
+            storage = SqliteStorage(tmp_path / 'contact_book.db', import_from=book_path)
+        else:
+            storage = CsvStorage(book_path)
+        books[mode] = AddressBook(storage)
+        books[mode].load(lazy=mode != 'eager')
+    yield books
+    for book in books.values():
+        book.close()
+
+
+def found_names(book: AddressBook, sought_string: str) -> Dict[str, List[str]]:
+    return {field: sorted(record.name.value for record in records)
+            for field, records in book.find_record(sought_string).items()}
+
+
+def all_page_names(book: AddressBook, sort_by: str, size: int = 40) -> List[str]:
+    names, offset = [], 0
+    while True:
+        page = book.page_names(offset, size, sort_by)
+        if not page:
+            return names
+        names += page
+        offset += size
+
+
+@pytest.mark.parametrize('sought_string', ['Contact 1', '7', '+3800000001', 'mail.com', 'Main', 'nobody'])
+def test_find_record_is_the_same_in_every_mode(books, sought_string):
+    eager = found_names(books['eager'], sought_string)
+    assert found_names(books['lazy'], sought_string) == eager
+    assert found_names(books['sqlite'], sought_string) == eager
+
+
+def test_queries_are_the_same_in_every_mode(books):
+    def answers(book: AddressBook) -> tuple:
+        return (
+            len(book),
+            sorted(record.name.value for record in book.find_by_phone('+1 0000000007')),
+            sorted((name, note.value) for name, note in book.find_tagged_notes([['work'], ['home', 'urgent']])),
+            book.duplicate_phones(),
+            sorted(contact['name'] for contact in book.contacts()),
+        )
+
+    eager = answers(books['eager'])
+    for mode in ('lazy', 'sqlite'):
+        assert answers(books[mode]) == eager
+    # lazy books take the found contacts into memory, the answers stay the same after that
+    for mode in ('lazy', 'sqlite'):
+        assert answers(books[mode]) == eager
+
+
+def test_tag_and_birthday_queries_leave_the_contacts_stored(books):
+    def answers(book: AddressBook) -> tuple:
+        return (
+            [(name, note.value, note.tag_values())
+             for name, note in book.find_tagged_notes([['work'], ['home', 'urgent'], ['home']])],
+            [book.get_birthdays_by_days(days) for days in range(10)],
+            book.get_birthdays_in_range(0, 60),
+        )
+
+    eager = answers(books['eager'])
+    assert eager[0] and 'None' not in eager[2]
+    for mode in ('lazy', 'sqlite'):
+        assert answers(books[mode]) == eager
+        assert len(books[mode].data) == 0
+        # the contacts in memory and in the storage are answered together
+        books[mode].get_record_by_name('Contact 1')
+        books[mode].get_record_by_name('Contact 2')
+        assert answers(books[mode]) == eager
+
+
+@pytest.mark.parametrize('query, found', [
+    ('project 17', ['Contact 17']), ('projekt 203', ['Contact 203']), ('call 33 77', ['Contact 33', 'Contact 77'])])
+def test_note_search_is_the_same_in_every_mode(books, query, found):
+    def answers(book: AddressBook) -> list:
+        return [(round(score, 6), name, note.value) for score, name, note in book.search_notes(query, len(found))]
+
+    eager = answers(books['eager'])
+    assert sorted(name for _, name, _ in eager) == found
+    for mode in ('lazy', 'sqlite'):
+        assert answers(books[mode]) == eager
+        # only the contacts of the found notes are taken into memory
+        assert sorted(books[mode].data) == found
+
+
+def test_pages_are_the_same_in_every_mode(books):
+    for book in books.values():
+        book.get_record_by_name('Contact 150')
+        book.delete_record('Contact 151')
+    names = {mode: all_page_names(book, 'name') for mode, book in books.items()}
+    assert names['eager'] == sorted(names['eager'])
+    assert names['lazy'] == names['sqlite'] == names['eager']
+    for sort_by in (None, 'birthday'):
+        for mode in ('lazy', 'sqlite'):
+            page_names = all_page_names(books[mode], sort_by)
+            assert len(page_names) == len(set(page_names))
+            assert sorted(page_names) == names['eager']
+
+
+def test_pages_are_in_the_asked_order(books, contacts):
+    today = date.today()
+    with_birthdays = []
+    for contact in contacts:
+        if contact['birthday']:
+            day, month = contact['birthday'].split('.')[:2]
+            with_birthdays.append((days_to_next_birthday(int(month), int(day), today), contact['name']))
+    with_birthdays.sort()
+    for mode, book in books.items():
+        by_birthday = all_page_names(book, 'birthday', size=7)
+        assert by_birthday[:len(with_birthdays)] == [name for _, name in with_birthdays]
+        assert len(by_birthday) == len(contacts)
+        if mode != 'eager':
+            # the contacts in memory go first, the storage pages the rest
+            book.get_record_by_name('Contact 150')
+            assert book.page_names(0, 2) == ['Contact 150', 'Contact 0']
+
+
+def test_show_all_tells_the_next_page(books):
+    book = books['sqlite']
+    answer = show_all(book, ['40', '0', 'name'])
+    assert 'Contacts 1-40. To see the next page input show_all with: 40, 40, name' in answer
+    assert answer.index('|Contact Contact 0 :') < answer.index('|Contact Contact 1 :') < \
+        answer.index('|Contact Contact 10 :')
+    assert show_all(book, ['40', '280', 'name']).endswith('Contacts 281-300 of 300.')
+    assert 'There are no contacts from 301' in show_all(book, ['40', '300'])
+
+
+def test_added_contacts_are_found_in_every_mode(books):
+    added = [make_contact(number) for number in range(1000, 1010)]
+    for book in books.values():
+        book.add_contacts(added)
+    for book in books.values():
+        assert 'Contact 1005' in book
+        assert found_names(book, 'Contact 100')['by_name'] == ['Contact 100'] + [f'Contact {number}'
+                                                                                 for number in range(1000, 1010)]
+        assert book.page_names(0, 3, 'name') == ['Contact 0', 'Contact 1', 'Contact 10']
+
+
+def test_leap_day_birthday_is_celebrated_on_28_february_of_common_year():
+    assert days_to_next_birthday(2, 29, date(2023, 2, 27)) == 1
+    assert days_to_next_birthday(2, 29, date(2023, 2, 28)) == 0
+    assert days_to_next_birthday(2, 29, date(2024, 2, 28)) == 1
+    assert days_to_next_birthday(2, 29, date(2023, 3, 1)) == 365
+
+
+def test_leap_day_birthday_in_calendar_days():
+    assert (2, 29) in birthdays_calendar_days(1, 1, date(2023, 2, 27))
+    assert (2, 29) not in birthdays_calendar_days(1, 1, date(2024, 2, 27))
+    assert (2, 29) in birthdays_calendar_days(2, 2, date(2024, 2, 27))
+
+
+def test_leap_day_birthday_in_index():
+    index = BirthdayIndex()
+    index.update('Leap', (2, 29))
+    index.update('Eve', (2, 28))
+    assert index.in_range(0, 3, date(2023, 2, 27)) == [(1, 'Eve'), (1, 'Leap')]
+    assert index.in_range(0, 3, date(2024, 2, 27)) == [(1, 'Eve'), (2, 'Leap')]
+    assert index.in_days(0, date(2023, 3, 1)) == []
+    assert next(index.upcoming(date(2023, 3, 1))) == (364, 'Eve')
+
+
+def test_leap_day_birthday_of_stored_contact(tmp_path):
+    leap = dict(make_contact(1), name='Leap', birthday='29.02.2000')
+    book_path = write_book(tmp_path / 'contact_book.csv', [leap, make_contact(2)])
+    for storage in (CsvStorage(book_path), SqliteStorage(tmp_path / 'contact_book.db', import_from=book_path)):
+        storage.open()
+        assert storage.birthdays_on(birthdays_calendar_days(1, 1, date(2023, 2, 27))) == [('Leap', (2, 29))]
+        assert storage.birthdays_on(birthdays_calendar_days(1, 1, date(2024, 2, 27))) == []
+        storage.close()
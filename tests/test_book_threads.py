@@ -0,0 +1,17 @@
+import pytest
+
+from stress_book import stress_book
+from synthetic_data import write_book
+
+CONTACTS = 500
+THREADS = 8
+SECONDS = 2.0
+
+
+@pytest.mark.parametrize('storage_type', ['csv', 'sqlite'])
+def test_book_shared_by_threads(tmp_path, storage_type):
+    """Writers change the book, while readers find, page and list it, and the book stays consistent"""
+    book_path = write_book(tmp_path / 'contact_book.csv', CONTACTS, seed=1)
+    stress = stress_book(book_path, storage_type, CONTACTS, THREADS, SECONDS, seed=1)
+    assert stress.violations == []
+    assert stress.operations > 0
@@ -0,0 +1,67 @@
+from handlers_and_commands.bot_classes_and_exceptions import bot_dedupe
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_dedupe import find_duplicates, merge_duplicates, name_key
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CsvStorage
+
+from conftest import make_contact, write_book
+
+
+def person(name: str, phones: list, **fields) -> dict:
+    return {'name': name, 'phones': phones, 'birthday': None, 'addresses': [], 'email': None, 'notes': [], **fields}
+
+
+def test_names_that_sound_the_same_have_one_key():
+    assert name_key('Jon Smith') == name_key('Smyth John') == name_key('JOHN  smith')
+    assert name_key('John Smith') != name_key('Joan Smart')
+
+
+def test_duplicates_are_found_only_inside_the_blocks():
+    contacts = [
+        person('John Smith', ['+380501112233'], email='john@mail.com'),
+        person('Jon Smith', ['+380501112233']),
+        person('Smyth John', [], email='JOHN@mail.com'),
+        # a shared phone alone or a similar name alone is not enough
+        person('Mary Brown', ['+380501112233']),
+        person('Jane Smith', []),
+        *(make_contact(number) for number in range(50)),
+    ]
+    groups = find_duplicates(contacts)
+    assert [group.names for group in groups] == [['John Smith', 'Jon Smith', 'Smyth John']]
+    assert groups[0].score >= bot_dedupe.DUPLICATE_SCORE
+
+
+def test_contacts_sharing_a_crowded_key_are_not_compared(monkeypatch):
+    office = [person(name, ['+380440000000'])
+              for name in ('Olga Petrenko', 'Ivan Bondar', 'Maria Koval', 'Petro Shevchenko', 'Oksana Melnyk')]
+    pairs = [person('Anna Lee', ['+380440000000']), person('Ana Lee', ['+380440000000'])]
+    assert [group.names for group in find_duplicates(office + pairs)] == [['Ana Lee', 'Anna Lee']]
+    monkeypatch.setattr(bot_dedupe, 'MAX_BLOCK_SIZE', 4)
+    # the names still share their own key
+    assert [group.names for group in find_duplicates(office + pairs)] == [['Ana Lee', 'Anna Lee']]
+    assert find_duplicates(office) == []
+
+
+def test_merge_keeps_the_stored_phones_and_is_persisted(tmp_path):
+    book_path = write_book(tmp_path / 'contact_book.csv', [
+        person('John Smith', ['+380501112233'], email='john@mail.com', addresses=['Main street 1', 'Office 2', 'Dacha'],
+               notes=[{'note': 'met at work', 'tags': ['work']}]),
+        # '12' was accepted by the older versions of the bot
+        person('Jon Smith', ['+380507778899', '+380501112233', '12'], birthday='01.02.1990',
+               notes=[{'note': 'met at work', 'tags': ['friend']}, {'note': 'owes money', 'tags': ['debt']}]),
+        make_contact(1),
+    ])
+    book = AddressBook(CsvStorage(book_path))
+    book.load(lazy=True)
+    groups = find_duplicates(book.contacts())
+    assert merge_duplicates(book, groups) == [('John Smith', ['Jon Smith'])]
+    book.close()
+
+    book = AddressBook(CsvStorage(book_path))
+    book.load(lazy=True)
+    assert 'Jon Smith' not in book
+    merged = book.get_record_by_name('John Smith')
+    assert merged.field_values('phone') == ['+380501112233', '+380507778899', '12']
+    assert merged.birthday.value.strftime('%d.%m.%Y') == '01.02.1990'
+    assert [(note.value, list(note.tag_values())) for note in merged.note] == \
+        [('met at work', ['work', 'friend']), ('owes money', ['debt'])]
+    book.close()
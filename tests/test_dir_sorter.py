@@ -0,0 +1,147 @@
+import os
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from handlers_and_commands.dir_sort_scrypt.dir_sorter import DROP_DUPLICATES, KEEP_DUPLICATES, LINK_DUPLICATES, \
+    plan_sort, run_moves, sort_dir
+from handlers_and_commands.dir_sort_scrypt import sort_index
+from handlers_and_commands.dir_sort_scrypt.dir_watcher import DirWatcher
+from handlers_and_commands.dir_sort_scrypt.sort_index import INDEX_NAME
+from handlers_and_commands.dir_sort_scrypt.sort_journal import JOURNAL_NAME, JOURNAL_WRITTEN_NAME, MoveJournal
+
+
+def write_files(root: Path, files: Dict[str, bytes]) -> None:
+    for relative_path, content in files.items():
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+
+def tree(root: Path) -> Dict[str, bytes]:
+    return {str(path.relative_to(root)): path.read_bytes() for path in root.rglob('*') if path.is_file()}
+
+
+@pytest.fixture
+def messy_dir(tmp_path: Path) -> Path:
+    root = tmp_path / 'messy'
+    write_files(root, {
+        **{f'photos/photo {number}.jpg': bytes([number]) * (number + 10) for number in range(20)},
+        **{f'music/song {number}.mp3': bytes([number]) * (number + 100) for number in range(20)},
+        'report.pdf': b'%PDF report',
+        'Звіт.txt': b'text',
+    })
+    return root
+
+
+def test_interrupted_sorting_is_continued(messy_dir):
+    expected = tree(messy_dir)
+    plan = plan_sort(str(messy_dir))
+    journal = MoveJournal(str(messy_dir))
+    journal.start(plan.moves, plan.folders, plan.walked_dirs, plan.duplicates)
+    for folder_name in plan.folders:
+        os.makedirs(messy_dir / folder_name, exist_ok=True)
+    pending_moves = plan.pending_moves()
+    run_moves(pending_moves[:15], journal)
+    # the run stops right after this move, before the journal knows about it
+    _, unrecorded_move = pending_moves[15]
+    os.replace(unrecorded_move.source, unrecorded_move.target)
+    journal._file.close()
+
+    assert sort_dir(str(messy_dir), dry_run=True).startswith('Continuing the interrupted sorting. 27 files')
+    assert sort_dir(str(messy_dir)).startswith('Continued the interrupted sorting.')
+    sorted_tree = tree(messy_dir)
+    assert sorted(sorted_tree.values()) == sorted(expected.values())
+    assert sorted_tree['audio/song_0.mp3'] == expected['music/song 0.mp3']
+    assert sorted_tree['document/Zvit.txt'] == b'text'
+    assert not (messy_dir / JOURNAL_NAME).exists()
+    assert sorted(path.name for path in messy_dir.iterdir()) == sorted(plan.folders)
+
+
+def test_half_written_journal_is_not_sorted(messy_dir):
+    (messy_dir / JOURNAL_WRITTEN_NAME).write_text('{"moves": [', encoding='utf-8')
+    plan = plan_sort(str(messy_dir))
+    assert all(JOURNAL_WRITTEN_NAME not in move.source for move in plan.moves)
+    assert len(plan.moves) == 42
+
+
+@pytest.mark.parametrize('duplicates', [KEEP_DUPLICATES, LINK_DUPLICATES, DROP_DUPLICATES])
+def test_duplicates(tmp_path, duplicates):
+    write_files(tmp_path, {'a.mp3': b'same' * 100, 'nested/b.mp3': b'same' * 100, 'c.mp3': b'other' * 80,
+                           'd.mp3': b'same' * 99 + b'diff'})
+    message = sort_dir(str(tmp_path), duplicates=duplicates)
+    assert '1 files have the same content' in message
+    audio = tmp_path / 'audio'
+    names = sorted(path.name for path in audio.iterdir())
+    if duplicates == DROP_DUPLICATES:
+        assert names == ['a.mp3', 'c.mp3', 'd.mp3']
+    else:
+        assert names == ['a.mp3', 'b.mp3', 'c.mp3', 'd.mp3']
+        assert (audio / 'b.mp3').read_bytes() == b'same' * 100
+        linked = (audio / 'a.mp3').stat().st_ino == (audio / 'b.mp3').stat().st_ino
+        assert linked == (duplicates == LINK_DUPLICATES)
+    assert not (tmp_path / 'nested').exists()
+
+
+def test_same_names_are_not_replaced(tmp_path):
+    write_files(tmp_path, {'a.txt': b'first', 'x/a.txt': b'second', 'document/a.txt': b'sorted before'})
+    sort_dir(str(tmp_path))
+    assert sorted(tree(tmp_path / 'document').values()) == [b'first', b'second', b'sorted before']
+    assert (tmp_path / 'document' / 'a.txt').read_bytes() == b'sorted before'
+
+
+def test_watcher_removes_emptied_parents_and_finds_sorted_duplicates(tmp_path):
+    root = tmp_path.resolve()
+    write_files(root, {'a.mp3': b'song' * 50})
+    sort_dir(str(root))
+    write_files(root, {'new/sub/b.mp3': b'song' * 50, 'new/sub/c.txt': b'text'})
+    reports = []
+    watcher = DirWatcher(str(root), report=reports.append, duplicates=DROP_DUPLICATES)
+    watcher.poll()
+    # the files are sorted once they didn't change between two polls
+    assert not reports
+    watcher.poll()
+    assert watcher.sorted_files == 2
+    assert 'new/sub/b.mp3 = audio/a.mp3' in reports[0]
+    assert sorted(path.name for path in root.iterdir()) == [INDEX_NAME, 'audio', 'document']
+    assert sorted(path.name for path in (root / 'audio').iterdir()) == ['a.mp3']
+
+
+def sort_arrived(watcher: DirWatcher) -> None:
+    watcher.poll()
+    watcher.poll()
+
+
+def test_watcher_lists_only_the_changed_sort_folders(tmp_path, monkeypatch):
+    root = tmp_path.resolve()
+    write_files(root, {'a.mp3': b'song' * 50, 'c.txt': b'text'})
+    sort_dir(str(root))
+    listed_folders = []
+
+    def counted_list_folder(folder: str, with_sizes: bool = True) -> dict:
+        listed_folders.append(os.path.basename(folder))
+        return list_folder(folder, with_sizes)
+
+    list_folder = sort_index.list_folder
+    monkeypatch.setattr(sort_index, 'list_folder', counted_list_folder)
+    reports = []
+    write_files(root, {'b.mp3': b'other' * 50})
+    sort_arrived(DirWatcher(str(root), report=reports.append))
+    assert listed_folders == ['audio']
+
+    # the next session reads the index and doesn't list the folder it knows
+    listed_folders.clear()
+    write_files(root, {'new/d.mp3': b'song' * 50, 'e.mp3': b'more' * 10})
+    watcher = DirWatcher(str(root), report=reports.append, duplicates=DROP_DUPLICATES)
+    sort_arrived(watcher)
+    assert listed_folders == []
+    assert 'new/d.mp3 = audio/a.mp3' in reports[-1]
+    assert sorted(path.name for path in (root / 'audio').iterdir()) == ['a.mp3', 'b.mp3', 'e.mp3']
+
+    # a folder changed by someone else is listed again
+    write_files(root, {'audio/f.mp3': b'copied' * 10})
+    write_files(root, {'f.mp3': b'copied' * 10})
+    sort_arrived(watcher)
+    assert listed_folders == ['audio']
+    assert 'f.mp3 = audio/f.mp3' in reports[-1]
@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from handlers_and_commands.dir_sort_scrypt.file_classifier import FileClassifier, TypesConfigError
+
+
+def classified(classifier: FileClassifier, folder: Path) -> Dict[str, str]:
+    with os.scandir(folder) as entries:
+        return {entry.name: classifier.folder_of(entry) for entry in entries}
+
+
+def test_files_are_classified_by_extension_or_by_their_bytes(tmp_path):
+    files = {
+        'PHOTO.JPG': b'not read',
+        'scan': b'\x89PNG\r\n\x1a\n....',
+        'report.bin': b'%PDF-1.7',
+        'library.jar': b'PK\x03\x04....',
+        'backup': b'PK\x03\x04....',
+        'notes': b'plain text',
+    }
+    for name, content in files.items():
+        (tmp_path / name).write_bytes(content)
+    classifier = FileClassifier()
+    assert classified(classifier, tmp_path) == {
+        'PHOTO.JPG': 'image', 'scan': 'image', 'report.bin': 'document',
+        # only the zip files without an extension are unpacked as archives
+        'library.jar': 'unknown', 'backup': 'archive', 'notes': 'unknown',
+    }
+    assert classifier.sniffed_files == 5
+    # the unchanged files are not read again, the changed one is
+    (tmp_path / 'notes').write_bytes(b'%PDF-1.4 and more')
+    assert classified(classifier, tmp_path)['notes'] == 'document'
+    assert classifier.sniffed_files == 6
+
+
+def test_types_config_adds_extensions_and_folders(tmp_path):
+    config_path = tmp_path / 'types.json'
+    config_path.write_text('{"image": ["WEBP"], "book": [".epub"]}', encoding='utf-8')
+    classifier = FileClassifier()
+    classifier.refresh(config_path)
+    assert classifier.extensions_folders['.webp'] == 'image' and classifier.extensions_folders['.epub'] == 'book'
+    assert classifier.folders[-1] == 'book'
+    config_path.write_text('{"../up": [".txt"]}', encoding='utf-8')
+    # the config is read again, when its mtime changes
+    os.utime(config_path, ns=(0, config_path.stat().st_mtime_ns + 1_000_000_000))
+    with pytest.raises(TypesConfigError):
+        classifier.refresh(config_path)
@@ -0,0 +1,101 @@
+from json import dumps, loads
+from pathlib import Path
+from typing import Iterator, List
+
+import pytest
+
+from handlers_and_commands.bot_classes_and_exceptions import bot_exceptions
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_import_export import export_contacts, import_contacts
+from handlers_and_commands.bot_classes_and_exceptions.bot_sqlite_storage import SqliteStorage
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CsvStorage
+
+from conftest import make_contact
+
+SEPARATED_CONTACT = dict(make_contact(1000), name='Doe, John', notes=[{'note': 'a|b', 'tags': ['x']}])
+
+
+def write_jsonl(path: Path, lines: List[str]) -> Path:
+    path.write_text(''.join(line + '\n' for line in lines), encoding='utf-8')
+    return path
+
+
+def rejected_errors(errors_path: Path) -> dict:
+    return {record['line']: record['error']
+            for record in map(loads, errors_path.read_text(encoding='utf-8').splitlines())}
+
+
+@pytest.fixture
+def csv_book(book_path: Path) -> Iterator[AddressBook]:
+    book = AddressBook(CsvStorage(book_path))
+    book.load(lazy=True)
+    yield book
+    book.close()
+
+
+@pytest.fixture
+def sqlite_book(tmp_path: Path, book_path: Path) -> Iterator[AddressBook]:
+    book = AddressBook(SqliteStorage(tmp_path / 'contact_book.db', import_from=book_path))
+    book.load(lazy=True)
+    yield book
+    book.close()
+
+
+def test_import_rejects_invalid_records(csv_book, tmp_path):
+    good = make_contact(2000)
+    import_path = write_jsonl(tmp_path / 'import.jsonl', [
+        dumps(good),
+        dumps(dict(make_contact(2001), phones=['12345'])),
+        dumps(dict(make_contact(2002), birthday='31.02.1990')),
+        dumps(dict(make_contact(2003), email='not an email')),
+        dumps(make_contact(5)),
+        dumps(good),
+        '{"name": ',
+        dumps({'phones': ['+380501234567']}),
+        dumps(SEPARATED_CONTACT),
+    ])
+    imported, rejected, errors_path = import_contacts(import_path, csv_book)
+    assert (imported, rejected) == (1, 8)
+    errors = rejected_errors(errors_path)
+    assert sorted(errors) == [2, 3, 4, 5, 6, 7, 8, 9]
+    assert 'phone' in errors[2] and 'birthday' in errors[3] and 'email' in errors[4]
+    assert 'already exists' in errors[5] and 'already exists' in errors[6]
+    assert 'json' in errors[7] and 'name' in errors[8] and "','" in errors[9]
+    assert csv_book.get_record_by_name('Contact 2000').field_values('phone') == good['phones']
+    assert 'Contact 2001' not in csv_book
+
+
+def test_import_without_rejections_leaves_no_errors_file(csv_book, tmp_path):
+    import_path = write_jsonl(tmp_path / 'import.jsonl', [dumps(make_contact(number)) for number in range(2000, 2010)])
+    assert import_contacts(import_path, csv_book) == (10, 0, None)
+    assert not (tmp_path / 'import.jsonl.errors.jsonl').exists()
+    assert len(csv_book) == 310
+
+
+def test_sqlite_keeps_separators(sqlite_book, tmp_path):
+    import_path = write_jsonl(tmp_path / 'import.jsonl', [dumps(SEPARATED_CONTACT)])
+    assert import_contacts(import_path, sqlite_book) == (1, 0, None)
+    assert sqlite_book.get_record_by_name('Doe, John').note[0].value == 'a|b'
+
+
+def test_csv_export_skips_separators(sqlite_book, tmp_path):
+    write_jsonl(tmp_path / 'import.jsonl', [dumps(SEPARATED_CONTACT)])
+    import_contacts(tmp_path / 'import.jsonl', sqlite_book)
+    assert export_contacts(tmp_path / 'export.csv', sqlite_book) == (300, 1)
+    assert export_contacts(tmp_path / 'export.jsonl', sqlite_book) == (301, 0)
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl', '.vcf'])
+def test_export_and_import_again(csv_book, contacts, tmp_path, extension):
+    export_path = tmp_path / f'export{extension}'
+    assert export_contacts(export_path, csv_book) == (len(contacts), 0)
+    book = AddressBook()
+    imported, rejected, _ = import_contacts(export_path, book)
+    assert (imported, rejected) == (len(contacts), 0)
+    assert sorted(book.contacts(), key=lambda contact: contact['name']) == \
+        sorted(contacts, key=lambda contact: contact['name'])
+
+
+def test_unknown_format_is_refused(csv_book, tmp_path):
+    with pytest.raises(bot_exceptions.UnknownFileFormatError):
+        import_contacts(tmp_path / 'contacts.xml', csv_book)
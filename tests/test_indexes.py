@@ -0,0 +1,119 @@
+from random import Random
+from typing import Dict, List, Set
+
+import pytest
+
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_exceptions import TagQueryError, UnknownContactError
+from handlers_and_commands.bot_classes_and_exceptions.bot_indexes import FuzzyIndex, NoteSearchIndex, SubstringIndex, \
+    TagIndex
+from handlers_and_commands.handlers import find_tagged_notes
+from main_bot import get_most_close_commands
+
+
+def containing(values: Dict[str, List[str]], sought_string: str) -> Set[str]:
+    return {key for key, key_values in values.items() if any(sought_string in value for value in key_values)}
+
+
+@pytest.mark.parametrize('sought_string', ['', 'a', 'ab', 'abc', 'bca', 'abcab', 'ca', 'zzz', 'cc'])
+def test_substring_index_finds_what_a_scan_finds(sought_string):
+    random = Random(1)
+    values = {f'key {number}': [''.join(random.choice('abc') for _ in range(random.randint(1, 7)))
+                                for _ in range(random.randint(0, 2))]
+              for number in range(300)}
+    index = SubstringIndex()
+    for key, key_values in values.items():
+        index.update(key, key_values)
+    # changed and removed keys don't leave their old grams behind
+    for number in range(0, 300, 7):
+        values[f'key {number}'] = ['cc']
+        index.update(f'key {number}', ['cc'])
+    for number in range(3, 300, 11):
+        values.pop(f'key {number}')
+        index.remove(f'key {number}')
+    expected = containing(values, sought_string)
+    if not sought_string:
+        expected = {key for key, key_values in values.items() if key_values}
+    assert index.search(sought_string) == expected
+
+
+def test_values_shorter_than_the_grams_are_found():
+    index = SubstringIndex()
+    index.update('Al', ['Al'])
+    index.update('Bob', ['Bob', 'b@x.io'])
+    assert index.search('Al') == {'Al'}
+    assert index.search('l') == {'Al'}
+    assert index.search('b') == {'Bob'}
+    assert index.search('b@x') == {'Bob'}
+    assert index.search('Alb') == set()
+
+
+def test_tag_index_finds_the_notes_with_all_tags_of_a_group():
+    index = TagIndex()
+    index.update('Ann', [('groceries', ['home', 'urgent']), ('report', ['work', 'urgent']), ('plain', [])])
+    index.update('Bob', [('call', ['work'])])
+    assert index.search([['urgent', 'work']]) == [('Ann', 'report')]
+    assert index.search([['work'], ['home', 'urgent'], []]) == [('Ann', 'report'), ('Ann', 'groceries'),
+                                                                ('Bob', 'call')]
+    assert index.search([['home', 'work']]) == []
+    index.update('Ann', [('report', ['work'])])
+    assert index.search([['urgent']]) == [] and index.tags() == ['work']
+    index.remove('Bob')
+    assert index.search([['work']]) == [('Ann', 'report')]
+
+
+def test_book_tag_index_follows_the_notes():
+    book = AddressBook()
+    book.add_record({'name': 'Ann', 'numbers': [], 'birthday': None, 'address': [], 'email': None})
+    record = book.get_record_by_name('Ann')
+    record.add_note('buy milk', ['home'])
+    record.add_note('send report', ['work'])
+    record.note[0].tag.append('urgent')
+    answer = find_tagged_notes(book, ['urgent & home', ' work '])
+    assert "'urgent & home' or 'work'" in answer
+    assert answer.index("'buy milk'") < answer.index("'send report'")
+    record.delete_note('buy milk')
+    assert book.find_tagged_notes([['home']]) == []
+    with pytest.raises(TagQueryError):
+        find_tagged_notes(book, [' & '])
+
+
+def test_note_search_ranks_exact_words_over_prefixes_and_typos():
+    index = NoteSearchIndex()
+    index.update('Ann', [('exact', 'budget meeting on monday'), ('prefix', 'budgeting for the trip')])
+    index.update('Bob', [('typo', 'budjet review'), ('other', 'meeting with the team about nothing')])
+    assert [note for _, _, note in index.search('budget', 10)] == ['exact', 'prefix', 'typo']
+    # the rarer word of the query weighs more
+    assert [note for _, _, note in index.search('monday meeting', 10)][0] == 'exact'
+    assert [(key, note) for _, key, note in index.search('meeting', 1)] == [('Ann', 'exact')]
+    index.update('Ann', [('prefix', 'budgeting for the trip')])
+    index.remove('Bob')
+    assert [note for _, _, note in index.search('budget', 10)] == ['prefix']
+    assert index.search('nothing', 10) == []
+
+
+def test_fuzzy_index_suggests_the_closest_values():
+    index = FuzzyIndex()
+    index.update('Ann', ['buy milk', 'buy milk', 'call Bob'])
+    index.update('Bob', ['buy milk'])
+    assert index.similar('by milk') == ['buy milk']
+    index.remove('Ann')
+    # the other contact still has the same note
+    assert index.similar('by milk') == ['buy milk'] and index.similar('cal Bob') == []
+    for number in range(3000):
+        index.add(f'value {number}')
+    for number in range(2990):
+        index.discard(f'value {number}')
+    assert index.similar('value 2995', limit=1) == ['value 2995'] and len(index) == 11
+
+
+def test_commands_and_names_are_suggested():
+    assert get_most_close_commands('fnd_contact')[0] == 'find_contact'
+    assert get_most_close_commands('shw_all')[0] == 'show_all'
+    assert get_most_close_commands('qwerty') == []
+    book = AddressBook()
+    for name in ('Contact 12', 'Contact 120', 'Maria'):
+        book.add_record({'name': name, 'numbers': [], 'birthday': None, 'address': [], 'email': None})
+    with pytest.raises(UnknownContactError) as error:
+        book.get_record_by_name('Contat 12')
+    assert error.value.args[0][0] == 'Contact 12'
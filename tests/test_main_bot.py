@@ -0,0 +1,59 @@
+from io import StringIO
+from json import loads
+from pathlib import Path
+from typing import List
+
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CsvStorage
+from handlers_and_commands.dir_sort_scrypt import dir_watcher
+from main_bot import run_batch
+
+
+def batch_answers(book_path: Path, lines: List[str]) -> List[dict]:
+    book = AddressBook(CsvStorage(book_path))
+    book.load(lazy=True)
+    output = StringIO()
+    run_batch(book, StringIO(''.join(line + '\n' for line in lines)), output)
+    return [loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_batch_answers_every_command_and_saves_once(book_path):
+    answers = batch_answers(book_path, [
+        'add_contact Bill, +380501234567',
+        # the command may be followed by a comma too
+        'find_contact, Bill',
+        '# comments and empty lines are skipped',
+        '',
+        'fnd_contact Bill',
+        'delete_contact Nobody',
+        'goodbye',
+        'delete_contact Bill',
+    ])
+    assert [(answer['line'], answer['command'], answer['ok']) for answer in answers] == [
+        (1, 'add_contact', True), (2, 'find_contact', True), (5, 'fnd_contact', False),
+        (6, 'delete_contact', False), (7, 'goodbye', True)]
+    assert '+380501234567' in answers[1]['answer']
+    assert 'find_contact' in answers[2]['close_commands']
+    assert 'No contact with such name' in answers[3]['error']
+    book = AddressBook(CsvStorage(book_path))
+    book.load(lazy=True)
+    assert book.get_record_by_name('Bill').field_values('phone') == ['+380501234567']
+    book.close()
+
+
+def test_batch_stops_its_watchers(book_path, tmp_path, capsys):
+    watched = tmp_path / 'watched'
+    watched.mkdir()
+    answers = batch_answers(book_path, [f'watch_dir {watched}'])
+    assert [answer['ok'] for answer in answers] == [True]
+    assert dir_watcher.WATCHERS == {}
+    assert capsys.readouterr().out == ''
+
+
+def test_watcher_reports_to_stderr(tmp_path, capsys):
+    (tmp_path / 'a.txt').write_text('text', encoding='utf-8')
+    watcher = dir_watcher.DirWatcher(str(tmp_path.resolve()))
+    watcher.poll()
+    watcher.poll()
+    captured = capsys.readouterr()
+    assert captured.out == '' and 'Sorted 1 new files' in captured.err
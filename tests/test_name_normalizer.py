@@ -0,0 +1,27 @@
+import re
+from random import Random
+
+from handlers_and_commands.dir_sort_scrypt.name_normalizer import CYRILLIC_LETTERS, CYRILLIC_TRANSLITERATION, \
+    NameNormalizer
+
+
+def table_normalize(name: str) -> str:
+    """The normalize of the dir sorter before the prebuilt table, for comparison"""
+    map_cyr_to_latin = {ord(src): dest for src, dest in zip(CYRILLIC_LETTERS, CYRILLIC_TRANSLITERATION)}
+    return re.compile(r"[^\w_]").sub('_', name.translate(map_cyr_to_latin))
+
+
+def test_normalizer_transliterates_like_the_table_did():
+    random = Random(1)
+    letters = CYRILLIC_LETTERS + 'abcXYZ019 ,.!-_()ё€αΩ'
+    names = [''.join(random.choice(letters) for _ in range(random.randint(0, 12))) for _ in range(2000)]
+    normalizer = NameNormalizer()
+    assert [normalizer.normalize(name) for name in names] == [table_normalize(name) for name in names]
+    assert normalizer.normalize('Привіт, світ!') == 'Pryvit__svit_'
+    assert normalizer.normalize('report (final).v2') == 'report__final__v2'
+
+
+def test_more_alphabets_are_transliterated():
+    normalizer = NameNormalizer(('cyrillic', 'greek'))
+    assert normalizer.normalize('Αθήνα та Київ') == 'Athina_ta_Kyyiv'
+    assert NameNormalizer().normalize('Αθήνα') == 'Αθήνα'
@@ -0,0 +1,29 @@
+import pytest
+
+from handlers_and_commands.bot_classes_and_exceptions import bot_exceptions
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook, Phone
+from handlers_and_commands.bot_classes_and_exceptions.bot_phones import normalize_phone
+from handlers_and_commands.handlers import duplicate_phones, who_is_calling
+
+
+@pytest.mark.parametrize('written', ['+38 (050) 123-45-67', '00380501234567', '+380.50.123.45.67', '+38050/1234567'])
+def test_phone_is_kept_in_one_form(written):
+    assert normalize_phone(written) == Phone(written).value == '+380501234567'
+
+
+@pytest.mark.parametrize('wrong', ['380501234567', '+38050123456a', '+1234567890123456', '+３８０'])
+def test_wrong_phones_are_refused(wrong):
+    with pytest.raises(bot_exceptions.PhoneError):
+        Phone(wrong)
+
+
+def test_phones_are_found_whatever_the_form():
+    book = AddressBook()
+    book.add_record({'name': 'Bill', 'numbers': ['+380501234567'], 'birthday': None, 'address': [], 'email': None})
+    book.add_record({'name': 'Office', 'numbers': ['0038 050 123 45 67', '+380441112233'], 'birthday': None,
+                     'address': [], 'email': None})
+    assert who_is_calling('+38 (050) 123-45-67', book) == 'The +380501234567 number belongs to: Bill, Office'
+    assert who_is_calling('+380440000000', book) == 'Nobody in your contact book has the +380440000000 number'
+    assert duplicate_phones(book) == 'These phones belong to more than one contact:\n+380501234567 : Bill, Office'
+    book.get_record_by_name('Office').modify_phone('+380501234567', '+380447778899')
+    assert duplicate_phones(book) == 'Every phone in your contact book belongs to one contact'
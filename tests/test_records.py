@@ -0,0 +1,72 @@
+import pytest
+
+from handlers_and_commands.bot_classes_and_exceptions import bot_exceptions
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import RENDER_CACHE, AddressBook, Note, Record, \
+    contact_to_record, record_to_contact
+
+from conftest import make_contact
+
+
+def test_record_is_slotted_and_keeps_the_contact():
+    contact = make_contact(7)
+    record = contact_to_record(contact)
+    assert not hasattr(record, '__dict__') and not hasattr(record.phone[0], '__dict__')
+    assert record_to_contact(record) == contact
+
+
+def test_field_lists_change_the_record_and_the_indexes():
+    book = AddressBook()
+    book.add_record({'name': 'Bill', 'numbers': ['+380501234567'], 'birthday': None, 'address': [], 'email': None})
+    record = book.get_record_by_name('Bill')
+    record.phone.append('+38 (050) 765-43-21')
+    assert record.field_values('phone') == ['+380501234567', '+380507654321']
+    assert [found.name.value for found in book.find_by_phone('+380507654321')] == ['Bill']
+    # a value taken from the list is a copy, it is replaced in the list instead
+    record.phone[0].value = '+380000000000'
+    assert record.phone[0].value == '+380501234567'
+    record.phone[0] = '+380501111111'
+    del record.phone[1]
+    assert [phone.value for phone in record.phone] == ['+380501111111']
+    assert book.find_by_phone('+380507654321') == []
+    with pytest.raises(bot_exceptions.PhoneError):
+        record.phone.append('12345abc')
+    assert record.field_values('phone') == ['+380501111111']
+
+
+def test_notes_and_tags_lists():
+    record = Record('Ann')
+    record.add_note('buy milk', ['home'])
+    record.note.append(Note('call Bob', []))
+    record.note[1].tag.append('work')
+    assert [(note.value, note.tag_values()) for note in record.note] == \
+        [('buy milk', ('home',)), ('call Bob', ('work',))]
+    assert all(note.record is record for note in record.note)
+    removed = record.note[0]
+    del record.note[0]
+    assert removed.record is None and len(record.note) == 1
+    with pytest.raises(TypeError):
+        record.note.append('not a note')
+
+
+def test_rendered_records_and_notes_are_cached_until_they_change():
+    RENDER_CACHE.clear()
+    record = Record('Ann', phones=['+380501234567'])
+    record.add_note('buy milk', ['home'])
+    note = record.note[0]
+    first = str(record)
+    assert str(record) == first and str(note) == str(note)
+    assert RENDER_CACHE.stats()['hits'] == 2
+    changes = [
+        lambda: record.modify_email('ann@mail.com'),
+        lambda: record.phone.append('+380507654321'),
+        lambda: setattr(note, 'value', 'buy bread'),
+        lambda: note.tag.append('shop'),
+    ]
+    rendered = [first]
+    for change in changes:
+        rendered_note = str(note)
+        change()
+        rendered.append(str(record))
+        assert rendered[-1] != rendered[-2]
+    assert str(note) != rendered_note
+    assert "/'buy bread', tags: home, shop/" in rendered[-1] and 'ann@mail.com' in rendered[-1]
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from threading import Lock
+from typing import List
+
+import server_bot
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CsvStorage
+from server_bot import BotClient, BotServer
+
+# how long every command of the test takes, long enough for the others to overlap it
+COMMAND_SECONDS = 0.2
+
+
+class CommandsLog:
+    """Commands running at every moment, run_command of the server is wrapped by it"""
+
+    def __init__(self, run_command) -> None:
+        self._run_command = run_command
+        self._lock = Lock()
+        self.running: List[str] = []
+        # the commands, that were running, when a command started
+        self.overlaps: List[List[str]] = []
+
+    def __call__(self, address_book, command, raw_args=None):
+        with self._lock:
+            self.overlaps.append([command, *self.running])
+            self.running.append(command)
+        try:
+            if command != 'hello':
+                time.sleep(COMMAND_SECONDS)
+            return self._run_command(address_book, command, raw_args)
+        finally:
+            with self._lock:
+                self.running.remove(command)
+
+
+async def with_server(book_path, requests_of_clients):
+    book = AddressBook(CsvStorage(book_path))
+    book.load(lazy=True)
+    server = BotServer(book)
+    listening = await server.start('127.0.0.1', 0)
+    port = listening.sockets[0].getsockname()[1]
+    clients = [await BotClient().connect('127.0.0.1', port) for _ in requests_of_clients]
+    try:
+        return await asyncio.gather(*(requests(client) for client, requests in zip(clients, requests_of_clients)))
+    finally:
+        for client in clients:
+            await client.close()
+        await server.close()
+
+
+def test_readers_share_the_book_and_writers_have_it_alone(book_path, monkeypatch):
+    log = CommandsLog(server_bot.run_command)
+    monkeypatch.setattr(server_bot, 'run_command', log)
+
+    async def read(client):
+        return await client.request('find_contact', 'Person 1')
+
+    async def write(client):
+        # the readers are already running, when the writer comes
+        await asyncio.sleep(COMMAND_SECONDS / 4)
+        return await client.request('add_contact', ['Newcomer', '+380509998877'])
+
+    async def read_later(client):
+        await asyncio.sleep(COMMAND_SECONDS / 2)
+        return await client.request('find_contact', 'Newcomer')
+
+    answers = asyncio.run(with_server(book_path, [read, read, read, write, read_later]))
+    assert all('error' not in answer for answer in answers)
+    assert 'Person 1' in answers[0]['answer']
+    # the reader, that came after the waiting writer, sees its contact
+    assert 'Newcomer' in answers[4]['answer']
+    started = {overlap[0]: overlap[1:] for overlap in log.overlaps if overlap[0] != 'find_contact'}
+    assert started['add_contact'] == []
+    reads = [overlap for overlap in log.overlaps if overlap[0] == 'find_contact']
+    assert max(len(overlap) for overlap in reads) >= 3
+    assert all('add_contact' not in overlap for overlap in reads)
+
+
+def test_slow_command_does_not_stop_the_others(book_path, tmp_path, monkeypatch):
+    log = CommandsLog(server_bot.run_command)
+    monkeypatch.setattr(server_bot, 'run_command', log)
+    (tmp_path / 'unsorted').mkdir()
+    (tmp_path / 'unsorted' / 'a.txt').write_text('text', encoding='utf-8')
+    greeted = []
+
+    async def sort(client):
+        return await client.request('sort_dir', str(tmp_path / 'unsorted'))
+
+    async def greet(client):
+        await asyncio.sleep(COMMAND_SECONDS / 4)
+        answer = await client.request('hello')
+        greeted.append(log.running[:])
+        return answer
+
+    sorted_answer, greet_answer = asyncio.run(with_server(book_path, [sort, greet]))
+    assert 'error' not in sorted_answer and 'error' not in greet_answer
+    # hello was answered, while the sorting was still running in the executor
+    assert greeted == [['sort_dir']]
+    assert (tmp_path / 'unsorted' / 'document' / 'a.txt').exists()
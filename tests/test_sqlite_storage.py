@@ -0,0 +1,37 @@
+from json import loads
+from pathlib import Path
+
+import pytest
+
+from handlers_and_commands.bot_classes_and_exceptions import bot_sqlite_storage
+from handlers_and_commands.bot_classes_and_exceptions.bot_sqlite_storage import SqliteStorage
+
+from conftest import make_contact, write_book
+
+
+def test_rows_that_can_not_be_imported_are_rejected(tmp_path, contacts):
+    broken = dict(make_contact(1000), birthday='31.02.1990')
+    book_path = write_book(tmp_path / 'contact_book.csv', [*contacts, broken])
+    storage = SqliteStorage(tmp_path / 'contact_book.db', import_from=book_path)
+    storage.open()
+    assert (len(storage), storage.rejected) == (len(contacts), 1)
+    storage.close()
+    (rejected_row,) = map(loads, Path(f'{book_path}.errors.jsonl').read_text(encoding='utf-8').splitlines())
+    assert rejected_row['record']['name'] == 'Contact 1000' and 'day is out of range' in rejected_row['error']
+
+
+def test_interrupted_import_is_repeated(tmp_path, book_path, contacts, monkeypatch):
+    database_path = tmp_path / 'contact_book.db'
+
+    def interrupted(*_) -> None:
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patched:
+        patched.setattr(bot_sqlite_storage, 'row_to_contact', interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            SqliteStorage(database_path, import_from=book_path).open()
+    assert not database_path.exists()
+    storage = SqliteStorage(database_path, import_from=book_path)
+    storage.open()
+    assert len(storage) == len(contacts)
+    storage.close()
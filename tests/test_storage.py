@@ -0,0 +1,126 @@
+from csv import DictReader
+from json import dumps
+from pathlib import Path
+from typing import Dict
+
+from handlers_and_commands.bot_classes_and_exceptions import bot_storage
+from handlers_and_commands.bot_classes_and_exceptions.bot_classes import AddressBook
+from handlers_and_commands.bot_classes_and_exceptions.bot_storage import CONTACTS_FILE_ENCODING, CsvStorage, \
+    contact_to_row, fold_journal, row_to_contact
+
+
+def opened_book(path: Path, lazy: bool = True) -> AddressBook:
+    book = AddressBook(CsvStorage(path))
+    book.load(lazy=lazy)
+    return book
+
+
+def book_contacts(path: Path) -> Dict[str, dict]:
+    book = opened_book(path)
+    contacts = {contact['name']: contact for contact in book.contacts()}
+    book.close()
+    return contacts
+
+
+def file_contacts(path: Path) -> Dict[str, dict]:
+    with open(path, 'r', encoding=CONTACTS_FILE_ENCODING, newline='') as contacts_file:
+        return {row['name']: row_to_contact(row) for row in DictReader(contacts_file)}
+
+
+def change_book(book: AddressBook) -> None:
+    book.add_record({'name': 'Bill', 'numbers': ['+380501234567'], 'birthday': None, 'address': [], 'email': None})
+    book.log_change('Bill')
+    book.get_record_by_name('Contact 1').modify_email('changed@mail.com')
+    book.log_change('Contact 1')
+    book.delete_record('Contact 2')
+    book.log_change('Contact 2')
+
+
+def test_journal_is_replayed_without_saving(book_path):
+    book = opened_book(book_path)
+    change_book(book)
+    expected = {contact['name']: contact for contact in book.contacts()}
+    book.close()
+    contacts = book_contacts(book_path)
+    assert contacts == expected
+    assert contacts['Contact 1']['email'] == 'changed@mail.com'
+    assert 'Contact 2' not in contacts and 'Bill' in contacts
+    # the contacts file itself is not rewritten by the changes
+    assert 'Bill' not in file_contacts(book_path)
+
+
+def test_torn_journal_line_is_skipped(book_path):
+    book = opened_book(book_path)
+    change_book(book)
+    book.close()
+    with open(book_path.with_suffix('.journal'), 'a', encoding=CONTACTS_FILE_ENCODING) as journal_file:
+        journal_file.write('{"op": "upsert", "contact": {"na')
+    book = opened_book(book_path)
+    book.get_record_by_name('Contact 3').modify_email('after@mail.com')
+    book.log_change('Contact 3')
+    book.close()
+    contacts = book_contacts(book_path)
+    assert 'Bill' in contacts and 'Contact 2' not in contacts
+    assert contacts['Contact 3']['email'] == 'after@mail.com'
+
+
+def test_journal_is_folded_into_contacts_file(book_path, monkeypatch):
+    monkeypatch.setattr(bot_storage, 'JOURNAL_FOLDING_SIZE', 5)
+    book = opened_book(book_path)
+    for number in range(10, 22):
+        book.get_record_by_name(f'Contact {number}').modify_email(f'folded{number}@mail.com')
+        book.log_change(f'Contact {number}')
+    expected = {contact['name']: contact for contact in book.contacts()}
+    book.close()
+    folded = file_contacts(book_path)
+    assert folded['Contact 10']['email'] == 'folded10@mail.com'
+    assert sum(contact['email'].startswith('folded') for contact in folded.values() if contact['email']) >= 5
+    assert book_contacts(book_path) == expected
+
+
+def test_folding_can_be_repeated(book_path, contacts, tmp_path):
+    journal_path = tmp_path / 'contact_book.journal.folding'
+    changed = dict(contacts[5], email='new@mail.com')
+    added = dict(contacts[0], name='Added')
+    operations = [{'op': 'upsert', 'contact': dict(changed, email='old@mail.com')},
+                  {'op': 'upsert', 'contact': changed}, {'op': 'delete', 'name': 'Contact 6'},
+                  {'op': 'upsert', 'contact': added}]
+    for _ in range(2):
+        journal_path.write_text(''.join(dumps(operation) + '\n' for operation in operations),
+                                encoding=CONTACTS_FILE_ENCODING)
+        fold_journal(book_path, journal_path)
+        assert not journal_path.exists()
+    folded = file_contacts(book_path)
+    assert len(folded) == len(contacts)
+    assert contact_to_row(folded['Contact 5']) == contact_to_row(changed)
+    assert 'Contact 6' not in folded and 'Added' in folded
+
+
+def test_saved_book_has_no_journal_left(book_path):
+    book = opened_book(book_path, lazy=False)
+    change_book(book)
+    expected = {contact['name']: contact for contact in book.contacts()}
+    book.save()
+    book.close()
+    assert book_path.with_suffix('.journal').stat().st_size == 0
+    assert file_contacts(book_path) == expected
+
+
+def test_added_rows_are_kept_on_disk(book_path, contacts):
+    storage = CsvStorage(book_path)
+    storage.open()
+    added = [dict(contact, name=f'Imported {number}', notes=[{'note': 'said "call me"\nlater', 'tags': ['work']}])
+             for number, contact in enumerate(contacts[:50])]
+    storage.add_contacts(added)
+    storage.add_contacts([dict(added[0], email='again@mail.com')])
+    storage.delete_contact('Imported 1')
+    storage.forget('Imported 1')
+    # only the offsets of the rows are in memory
+    assert all(isinstance(offset, int) for offset in storage._contacts_file._changed_offsets.values())
+    assert storage.pop_contact('Imported 2') == row_to_contact(contact_to_row(added[2]))
+    listed = {contact['name']: contact for contact in storage.contacts()}
+    assert len(listed) == len(contacts) + 48
+    assert listed['Imported 0']['email'] == 'again@mail.com'
+    assert listed['Imported 3']['notes'] == [{'note': 'said "call me"\nlater', 'tags': ['work']}]
+    storage.close()
+    assert book_contacts(book_path)['Imported 3'] == listed['Imported 3']